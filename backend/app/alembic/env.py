@@ -2,7 +2,7 @@ import os
 from logging.config import fileConfig
 
 from alembic import context
-from sqlalchemy import engine_from_config, pool
+from sqlalchemy import engine_from_config, inspect, pool
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -10,7 +10,8 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -18,11 +19,23 @@ fileConfig(config.config_file_name)
 # target_metadata = mymodel.Base.metadata
 # target_metadata = None
 
-from app.models import SQLModel  # noqa
+from app.models import ITEM_PARTITIONS, SQLModel  # noqa
 from app.core.config import settings # noqa
 
 target_metadata = SQLModel.metadata
 
+# The partitions of item are created with it by DDL and not in the metadata,
+# autogenerate must not drop them
+ITEM_PARTITION_NAMES = {f"item_p{remainder}" for remainder in range(ITEM_PARTITIONS)}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table":
+        return name not in ITEM_PARTITION_NAMES
+    if type_ in ("index", "unique_constraint", "foreign_key_constraint"):
+        return object.table.name not in ITEM_PARTITION_NAMES
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -33,6 +46,22 @@ def get_url():
     return str(settings.SQLALCHEMY_DATABASE_URI)
 
 
+def get_urls():
+    # Every shard has the whole schema, see app.core.shards. Autogenerate
+    # compares the models with the main database only.
+    if getattr(config.cmd_opts, "autogenerate", False):
+        return [get_url()]
+    return [get_url(), *settings.POSTGRES_SHARD_URLS]
+
+
+def is_new_database(connection):
+    # Only an upgrade to head may build the schema at once
+    head = context.script.get_current_head()
+    return context.get_revision_argument() == head and not inspect(
+        connection
+    ).has_table("alembic_version")
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -47,7 +76,11 @@ def run_migrations_offline():
     """
     url = get_url()
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True, compare_type=True
+        url=url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        compare_type=True,
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -58,24 +91,36 @@ def run_migrations_online():
     """Run migrations in 'online' mode.
 
     In this scenario we need to create an Engine
-    and associate a connection with the context.
+    and associate a connection with the context,
+    once for the main database and each shard.
 
     """
-    configuration = config.get_section(config.config_ini_section)
-    configuration["sqlalchemy.url"] = get_url()
-    connectable = engine_from_config(
-        configuration,
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata, compare_type=True
+    for url in get_urls():
+        configuration = config.get_section(config.config_ini_section, {})
+        configuration["sqlalchemy.url"] = url
+        connectable = engine_from_config(
+            configuration,
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                compare_type=True,
+                include_object=include_object,
+            )
+
+            with context.begin_transaction():
+                if url != get_url() and is_new_database(connection):
+                    # The history converted the data of the main database, a
+                    # new shard starts from the current models instead
+                    target_metadata.create_all(connection)
+                    context.get_context().stamp(context.script, "head")
+                else:
+                    context.run_migrations()
+        connectable.dispose()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,30 @@
+"""Add shard_assignment table for owners moved between shards
+
+Revision ID: 3f6a8c2d9e1b
+Revises: b5f1c7d2e8a4
+Create Date: 2026-10-17 16:22:08.913274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a8c2d9e1b'
+down_revision = 'b5f1c7d2e8a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'shard_assignment',
+        sa.Column('owner_id', sa.Uuid(), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('owner_id')
+    )
+
+
+def downgrade():
+    op.drop_table('shard_assignment')
@@ -0,0 +1,129 @@
+"""Hash partition item by owner_id
+
+The primary key becomes (id, owner_id), as a primary key or unique index of
+a partitioned table has to contain the partition key. Nothing in the
+database keeps item.id unique on its own any more: ids are only generated by
+the API, with uuid4, and never taken from clients.
+
+Revision ID: 6b2e9d4f8a1c
+Revises: 3f6a8c2d9e1b
+Create Date: 2026-10-17 18:42:10.736215
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2e9d4f8a1c'
+down_revision = '3f6a8c2d9e1b'
+branch_labels = None
+depends_on = None
+
+PARTITIONS = 16
+CHUNK_SIZE = 5000
+
+# Mirrors every write to item into item_partitioned while it is filled, an
+# update is a delete and an insert in case the owner changed
+SYNC_FUNCTION = """
+CREATE FUNCTION item_partitioned_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM item_partitioned WHERE id = OLD.id AND owner_id = OLD.owner_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO item_partitioned (id, owner_id, title, description, version)
+        VALUES (NEW.id, NEW.owner_id, NEW.title, NEW.description, NEW.version);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+# Copies the next chunk of rows in id order and returns the last id copied.
+# The rows are locked so a concurrent delete waits for the chunk and is then
+# mirrored, rows the trigger already copied are newer and kept
+COPY_CHUNK = sa.text("""
+WITH chunk AS (
+    SELECT * FROM item WHERE id > :after ORDER BY id LIMIT :size FOR SHARE
+), copied AS (
+    INSERT INTO item_partitioned (id, owner_id, title, description, version)
+    SELECT id, owner_id, title, description, version FROM chunk
+    ON CONFLICT DO NOTHING
+)
+SELECT id FROM chunk ORDER BY id DESC LIMIT 1
+""")
+
+
+def create_item_table(name, *constraints, **kw):
+    op.create_table(
+        name,
+        sa.Column('title', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column('description', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('owner_id', sa.Uuid(), nullable=False),
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['user.id'], name='item_owner_id_fkey', ondelete='CASCADE'),
+        *constraints,
+        **kw,
+    )
+
+
+def upgrade():
+    # Leftovers of an interrupted run, the copy starts over
+    op.execute("DROP TRIGGER IF EXISTS item_partitioned_sync ON item")
+    op.execute("DROP TABLE IF EXISTS item_partitioned")
+    op.execute("DROP FUNCTION IF EXISTS item_partitioned_sync()")
+
+    create_item_table('item_partitioned', postgresql_partition_by='HASH (owner_id)')
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f"CREATE TABLE item_p{remainder} PARTITION OF item_partitioned "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})"
+        )
+    # The primary key must contain the partition key, the unique constraint
+    # on id alone is dropped, see above
+    op.create_primary_key('item_partitioned_pkey', 'item_partitioned', ['id', 'owner_id'])
+    op.create_index('ix_item_partitioned_owner_id_id', 'item_partitioned', ['owner_id', 'id'])
+    op.execute(SYNC_FUNCTION)
+    op.execute(
+        "CREATE TRIGGER item_partitioned_sync AFTER INSERT OR UPDATE OR DELETE "
+        "ON item FOR EACH ROW EXECUTE FUNCTION item_partitioned_sync()"
+    )
+
+    # Each chunk commits on its own, item stays writable during the copy
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        after = uuid.UUID(int=0)
+        while True:
+            last = connection.execute(COPY_CHUNK, {'after': after, 'size': CHUNK_SIZE}).scalar()
+            if last is None:
+                break
+            after = last
+        op.execute("ANALYZE item_partitioned")
+
+    # The trigger kept both tables equal, the swap only waits for the lock
+    op.execute("SET LOCAL lock_timeout = '10s'")
+    op.execute("LOCK TABLE item IN ACCESS EXCLUSIVE MODE")
+    op.drop_table('item')
+    op.execute("DROP FUNCTION item_partitioned_sync()")
+    op.rename_table('item_partitioned', 'item')
+    op.execute("ALTER INDEX item_partitioned_pkey RENAME TO item_pkey")
+    op.execute("ALTER INDEX ix_item_partitioned_owner_id_id RENAME TO ix_item_owner_id_id")
+
+
+def downgrade():
+    # Copied in one transaction, writes to item wait until it is done
+    op.execute("LOCK TABLE item IN EXCLUSIVE MODE")
+    create_item_table('item_unpartitioned', sa.PrimaryKeyConstraint('id', name='item_unpartitioned_pkey'))
+    op.execute(
+        "INSERT INTO item_unpartitioned (id, owner_id, title, description, version) "
+        "SELECT id, owner_id, title, description, version FROM item"
+    )
+    op.drop_table('item')
+    op.rename_table('item_unpartitioned', 'item')
+    op.execute("ALTER INDEX item_unpartitioned_pkey RENAME TO item_pkey")
+    op.create_index('ix_item_owner_id_id', 'item', ['owner_id', 'id'])
@@ -0,0 +1,33 @@
+"""Add user_email table to keep emails unique across shards
+
+Revision ID: 8e4a1d7c3f5b
+Revises: 6b2e9d4f8a1c
+Create Date: 2026-10-17 21:08:44.512930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4a1d7c3f5b'
+down_revision = '6b2e9d4f8a1c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user_email',
+        sa.Column('email', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column('owner_id', sa.Uuid(), nullable=False),
+        sa.PrimaryKeyConstraint('email')
+    )
+    # Only read in the main database, shard 0. The users of the other shards
+    # are still found by the lookup across the shards done before the claim.
+    op.execute('INSERT INTO user_email (email, owner_id) SELECT email, id FROM "user"')
+
+
+def downgrade():
+    op.drop_table('user_email')
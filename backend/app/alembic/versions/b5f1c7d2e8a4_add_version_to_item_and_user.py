@@ -0,0 +1,29 @@
+"""Add version counter to item and user for ETags
+
+Revision ID: b5f1c7d2e8a4
+Revises: 7d3b9e1f5a2c
+Create Date: 2026-10-17 14:05:51.270136
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5f1c7d2e8a4'
+down_revision = '7d3b9e1f5a2c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A constant default is stored in the catalog, existing rows are not
+    # rewritten
+    op.add_column('user', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('item', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('item', 'version')
+    op.drop_column('user', 'version')
@@ -0,0 +1,90 @@
+import uuid
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+from fastapi import Response
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.cache import response_cache
+from app.core.config import settings
+from app.core.replicas import reads_replica
+from app.core.responses import json_body_response
+from app.core.singleflight import singleflight
+
+T = TypeVar("T")
+
+
+@dataclass
+class CachedResponse:
+    """
+    A serialized public model as stored in the response cache, with what is
+    needed to answer without loading the row: its ETag, and the user who may
+    read it besides superusers.
+    """
+
+    etag: str
+    owner_id: uuid.UUID
+    body: bytes
+
+    def encode(self) -> bytes:
+        return f"{self.etag}\n{self.owner_id.hex}\n".encode() + self.body
+
+    @classmethod
+    def decode(cls, data: bytes) -> "CachedResponse":
+        etag, owner_id, body = data.split(b"\n", 2)
+        return cls(etag=etag.decode(), owner_id=uuid.UUID(owner_id.decode()), body=body)
+
+    def to_response(self) -> Response:
+        return json_body_response(self.body, headers={"ETag": self.etag})
+
+
+async def get_cached_response(key: str) -> CachedResponse | None:
+    data = await response_cache.get(key)
+    return CachedResponse.decode(data) if data is not None else None
+
+
+async def cache_response(
+    key: str,
+    public: SQLModel,
+    *,
+    etag: str,
+    owner_id: uuid.UUID,
+    session: AsyncSession,
+) -> CachedResponse:
+    """
+    Serialize `public` once and keep it for the next reads of `key`, unless
+    it was loaded by `session` from a replica: a lagging replica could put
+    back a version that was just invalidated.
+    """
+    entry = CachedResponse(
+        etag=etag, owner_id=owner_id, body=public.model_dump_json().encode()
+    )
+    if not reads_replica(session):
+        await response_cache.set(key, entry.encode())
+    return entry
+
+
+async def coalesce(
+    key: str,
+    session: AsyncSession,
+    load: Callable[[AsyncSession], Coroutine[Any, Any, T]],
+) -> T:
+    """
+    Run `load` on the request's session, or, with `settings.SINGLEFLIGHT_ENABLED`,
+    share one run between the concurrent requests for `key`. A shared run can
+    outlive the request that started it, so it gets a session of its own.
+    """
+    bind = session.bind
+    if not settings.SINGLEFLIGHT_ENABLED or not isinstance(bind, AsyncEngine):
+        return await load(session)
+
+    async def load_shared() -> T:
+        async with AsyncSession(bind, expire_on_commit=False) as own_session:
+            return await load(own_session)
+
+    # Only share with requests reading from the same server, a replica that
+    # is fine for one client may not have replayed another client's writes
+    return await singleflight.do(f"{key}@{bind.url}", load_shared)
@@ -0,0 +1,70 @@
+import uuid
+from typing import Any, TypeVar
+
+from fastapi import HTTPException, Response
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+T = TypeVar("T", bound=SQLModel)
+
+
+def make_etag(id: uuid.UUID, version: int, fields: list[str] | None = None) -> str:
+    """
+    Build the ETag of a row from its id and version counter. A sparse
+    fieldset is another representation of the row, its normalized `fields`
+    are appended after a "-".
+    """
+    if fields:
+        return f'"{id.hex}.{version}-{"+".join(fields)}"'
+    return f'"{id.hex}.{version}"'
+
+
+def version_tag(etag: str) -> str:
+    """
+    Return the ETag of the full representation for any ETag of the row.
+    """
+    return etag.split("-", 1)[0].rstrip('"') + '"'
+
+
+def etag_matches(header: str, etag: str, *, any_representation: bool = False) -> bool:
+    """
+    Tell whether an If-Match or If-None-Match header value matches `etag`,
+    or with `any_representation` the same version of the row as `etag`.
+    """
+    if header.strip() == "*":
+        return True
+    # Weak comparison, a weak validator still names the same version
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if any_representation:
+        return version_tag(etag) in {version_tag(tag) for tag in tags}
+    return etag in tags
+
+
+def not_modified(if_none_match: str | None, etag: str) -> Response | None:
+    """
+    Return a 304 response when the client already has the current version.
+    """
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def check_if_match(if_match: str | None, etag: str) -> None:
+    # Only the version matters for a write, whatever representation was read
+    if if_match and not etag_matches(if_match, etag, any_representation=True):
+        raise HTTPException(
+            status_code=412,
+            detail="The resource was modified since it was read",
+        )
+
+
+async def get_for_update(
+    session: AsyncSession, model: type[T], id: Any, *, if_match: str | None
+) -> T | None:
+    """
+    Load a row to update. With an If-Match header the row is locked, so it
+    cannot change between the version check and the write.
+    """
+    if not if_match:
+        return await session.get(model, id)
+    return await session.get(model, id, with_for_update=True, populate_existing=True)
@@ -1,17 +1,27 @@
-from collections.abc import Generator
+import uuid
+from collections.abc import AsyncGenerator, AsyncIterator, Generator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.security.utils import get_authorization_scheme_param
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
-from sqlmodel import Session
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session, col, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app import crud
 from app.core import security
+from app.core.cache import user_cache
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import SAFE_METHODS, async_engine, engine, read_only_engine
+from app.core.replicas import committed_lsn, pass_lsn, replicas, requested_lsn
+from app.core.shards import shards
+from app.models import AuthUser, TokenPayload, User, UserEmail
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -23,11 +33,192 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+def request_owner_id(request: Request) -> uuid.UUID | None:
+    """
+    The user the request's bearer token was issued to, None without a valid
+    token. It only picks the shard, `get_current_user` still checks the user.
+    """
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() != "bearer":
+        return None
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+        return uuid.UUID(TokenPayload(**payload).sub)
+    except (InvalidTokenError, ValidationError, TypeError, ValueError):
+        return None
+
+
+def get_shard_engine(request: Request) -> AsyncEngine:
+    """
+    Engine of the shard holding the requesting user and their items, the
+    main database for anonymous requests.
+    """
+    if len(shards) == 1:
+        return async_engine
+    owner_id = request_owner_id(request)
+    return shards.engine_for(owner_id) if owner_id else async_engine
+
+
+async def get_async_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    bind = get_shard_engine(request)
+    if request.method in SAFE_METHODS:
+        bind = read_only_engine(bind)
+    # Objects stay loaded after commit, lazy loads would need a greenlet
+    async with AsyncSession(bind, expire_on_commit=False) as session:
+        yield session
+        # Runs before the response is sent, ReadAfterWriteMiddleware passes it on
+        if lsn := await committed_lsn(session):
+            request.state.read_after_lsn = lsn
+
+
+def get_read_engine(request: Request) -> AsyncEngine:
+    """
+    Engine for routes that only read: a replica when one is healthy and has
+    replayed the client's last write, the primary otherwise. Replicas are of
+    the main database, the other shards are read from directly.
+    """
+    bind = get_shard_engine(request)
+    if bind is not async_engine:
+        return bind
+    replica = replicas.choose(requested_lsn(request))
+    return replica.engine if replica else async_engine
+
+
+def get_read_engines(request: Request) -> list[AsyncEngine]:
+    """
+    Engines to read all shards from, for the listings of superusers.
+    """
+    replica = replicas.choose(requested_lsn(request))
+    return [replica.engine if replica else async_engine, *shards.engines[1:]]
+
+
+ReadEngineDep = Annotated[AsyncEngine, Depends(get_read_engine)]
+ReadEnginesDep = Annotated[list[AsyncEngine], Depends(get_read_engines)]
+
+
+async def get_read_db(bind: ReadEngineDep) -> AsyncGenerator[AsyncSession, None]:
+    # Exports stream from ReadEngineDep itself: server-side cursors need a
+    # transaction, so only these sessions use the read only mode
+    async with AsyncSession(read_only_engine(bind), expire_on_commit=False) as session:
+        yield session
+
+
+@asynccontextmanager
+async def shard_session(
+    session: AsyncSession, shard: int | None
+) -> AsyncIterator[AsyncSession]:
+    """
+    Use `session` when it is bound to `shard`, or when `shard` is None, and
+    otherwise a session of its own on that shard.
+    """
+    bind = session.bind
+    if (
+        shard is None
+        or not isinstance(bind, AsyncEngine)
+        or bind.pool is shards.engines[shard].pool
+    ):
+        yield session
+        return
+    async with shards.session(shard) as other:
+        yield other
+        # Reads after the response must see these writes too
+        await pass_lsn(other, session)
+
+
+def user_session(
+    session: AsyncSession, user_id: uuid.UUID
+) -> AbstractAsyncContextManager[AsyncSession]:
+    """
+    A session on the shard of the user `user_id` and their items.
+    """
+    return shard_session(session, shards.shard_for(user_id))
+
+
+@asynccontextmanager
+async def email_session(
+    session: AsyncSession, email: str
+) -> AsyncIterator[AsyncSession]:
+    """
+    A session on the shard of the user with `email`, `session` when there is
+    no such user.
+    """
+    shard = None
+    if len(shards) > 1:
+        shard = await shards.locate(select(User.id).where(User.email == email))
+    async with shard_session(session, shard) as email_shard_session:
+        yield email_shard_session
+
+
+async def get_user_by_email(session: AsyncSession, email: str) -> User | None:
+    """
+    `crud.get_user_by_email` across the shards, to check emails are unique.
+    """
+    async with email_session(session, email) as email_shard_session:
+        return await crud.get_user_by_email(session=email_shard_session, email=email)
+
+
+async def claim_email(email: str, owner_id: uuid.UUID) -> bool:
+    """
+    Reserve `email` for the user `owner_id` in shard 0, whichever shard the
+    user is on, as the unique index on the email only covers one shard.
+    Return False when another user holds it.
+
+    The claim commits before the user is written, callers release it with
+    `release_email` if that fails.
+    """
+    statement = (
+        insert(UserEmail)
+        .values(email=email, owner_id=owner_id)
+        .on_conflict_do_nothing()
+    )
+    async with shards.session(0) as session:
+        await session.execute(statement)
+        owner = await session.scalar(
+            select(UserEmail.owner_id).where(UserEmail.email == email)
+        )
+        await session.commit()
+    return owner == owner_id
+
+
+async def release_email(email: str, owner_id: uuid.UUID) -> None:
+    """
+    Drop the claim of the user `owner_id` on `email`.
+    """
+    async with shards.session(0) as session:
+        await session.execute(
+            delete(UserEmail).where(
+                col(UserEmail.email) == email, col(UserEmail.owner_id) == owner_id
+            )
+        )
+        await session.commit()
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+async def get_user_cached(session: AsyncSession, user_id: str) -> AuthUser | None:
+    """
+    Load what authorization needs of a user, from the in-process user cache
+    when possible. Only those fields are cached, never the row itself: routes
+    that return or write the user load it with `CurrentUserRow`.
+    """
+    data = user_cache.get(user_id)
+    if data is None:
+        user = await session.get(User, user_id)
+        if not user:
+            return None
+        auth_user = AuthUser.model_validate(user)
+        user_cache.set(user_id, auth_user.model_dump())
+        return auth_user
+    return AuthUser(**data)
+
+
+async def get_current_user(session: AsyncSessionDep, token: TokenDep) -> AuthUser:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -38,7 +229,25 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+    user = await get_user_cached(session, token_data.sub) if token_data.sub else None
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return user
+
+
+CurrentUser = Annotated[AuthUser, Depends(get_current_user)]
+
+
+async def get_current_user_row(
+    session: AsyncSessionDep, current_user: CurrentUser
+) -> User:
+    """
+    The requesting user's row, read from the database: the cached fields of
+    `CurrentUser` may be up to `USER_CACHE_TTL_SECONDS` old.
+    """
+    user = await session.get(User, current_user.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,10 +255,10 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
-CurrentUser = Annotated[User, Depends(get_current_user)]
+CurrentUserRow = Annotated[User, Depends(get_current_user_row)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+def get_current_active_superuser(current_user: CurrentUser) -> AuthUser:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
@@ -0,0 +1,74 @@
+import csv
+import io
+from collections.abc import AsyncIterator, Sequence
+from typing import Any, Literal
+
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+from sqlalchemy import Row, Select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES: dict[ExportFormat, str] = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def encode_ndjson(rows: Sequence[Row[Any]]) -> bytes:
+    return b"".join(to_json(row._asdict()) + b"\n" for row in rows)
+
+
+async def stream_rows(
+    statement: Select[Any],
+    *,
+    binds: Sequence[AsyncEngine],
+    export_format: ExportFormat,
+) -> AsyncIterator[bytes]:
+    """
+    Run `statement` on a server-side cursor of each of `binds` in turn and
+    yield its rows encoded in chunks of `settings.EXPORT_BATCH_SIZE`, so
+    memory does not grow with the size of the export.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for index, bind in enumerate(binds):
+        # The session is opened here rather than taken from a dependency:
+        # FastAPI closes dependencies before the body of a streaming response
+        # is sent
+        async with AsyncSession(bind) as session:
+            result = await session.stream(
+                statement.execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+            )
+            if export_format == "ndjson":
+                async for rows in result.partitions():
+                    yield encode_ndjson(rows)
+                continue
+            if index == 0:
+                writer.writerow(result.keys())
+                yield buffer.getvalue().encode()
+            async for rows in result.partitions():
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(rows)
+                yield buffer.getvalue().encode()
+
+
+def export_response(
+    statement: Select[Any],
+    *,
+    binds: Sequence[AsyncEngine],
+    export_format: ExportFormat,
+    filename: str,
+) -> StreamingResponse:
+    return StreamingResponse(
+        stream_rows(statement, binds=binds, export_format=export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{export_format}"'
+        },
+    )
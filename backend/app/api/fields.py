@@ -0,0 +1,82 @@
+from collections.abc import Callable, Iterable
+from typing import Annotated, Any
+
+from fastapi import Depends, HTTPException, Query, Response
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.interfaces import LoaderOption
+from sqlmodel import SQLModel
+
+from app.core.responses import serialize_model
+from app.models import ItemPublic, UserPublic
+
+
+def fields_query(
+    public_model: type[SQLModel],
+) -> Callable[[str | None], list[str] | None]:
+    """
+    Build a dependency parsing a comma separated `fields` query parameter
+    against the fields of `public_model`, the allowlist of what may be
+    requested.
+    """
+    allowed = list(public_model.model_fields)
+
+    def parse_fields(
+        fields: Annotated[
+            str | None,
+            Query(
+                description=(
+                    "Comma separated fields to return, "
+                    f"any of: {', '.join(allowed)}. Defaults to all of them."
+                )
+            ),
+        ] = None,
+    ) -> list[str] | None:
+        if fields is None:
+            return None
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        if not requested:
+            raise HTTPException(status_code=400, detail="No fields requested")
+        if unknown := requested.difference(allowed):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+            )
+        # In declaration order, like the full representation
+        return [name for name in allowed if name in requested]
+
+    return parse_fields
+
+
+ItemFields = Annotated[list[str] | None, Depends(fields_query(ItemPublic))]
+UserFields = Annotated[list[str] | None, Depends(fields_query(UserPublic))]
+
+
+def with_keys(fields: list[str], keys: Iterable[str]) -> list[str]:
+    """
+    Add the columns the route needs itself, for cursors or permission checks,
+    to the requested `fields`.
+    """
+    return fields + [key for key in keys if key not in fields]
+
+
+def load_fields(table_model: type[SQLModel], fields: list[str]) -> LoaderOption:
+    """
+    Only load the columns of `fields` when selecting `table_model` entities.
+    """
+    return load_only(*(getattr(table_model, name) for name in fields))
+
+
+def sparse_response(
+    public_model: type[SQLModel],
+    obj: Any,
+    fields: list[str],
+    headers: dict[str, str] | None = None,
+) -> Response:
+    """
+    Serialize the `fields` of `obj` as `public_model` would, without reading
+    the attributes that were not loaded.
+    """
+    public = public_model.model_construct(
+        **{name: getattr(obj, name) for name in fields}
+    )
+    return serialize_model(public, include=set(fields), headers=headers)
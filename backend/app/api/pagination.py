@@ -0,0 +1,189 @@
+import base64
+import binascii
+import heapq
+import json
+import uuid
+from collections.abc import Callable, Sequence
+from itertools import islice
+from typing import Any, Literal, TypeVar
+
+from fastapi import HTTPException, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select, SelectOfScalar
+
+from app.core.db import read_only_engine
+from app.core.responses import serialize_model
+from app.core.shards import gather_shards
+
+P = TypeVar("P", bound=SQLModel)
+
+# How list endpoints compute `count`:
+# * exact: a separate COUNT(*) query
+# * estimated: the planner row estimate, only used for unfiltered listings
+# * none: no count at all
+# * window: COUNT(*) OVER () in the page query itself, saving a round trip
+CountMode = Literal["exact", "estimated", "none", "window"]
+
+
+def encode_cursor(*keys: uuid.UUID) -> str:
+    """
+    Encode the sort key of the last row of a page as an opaque cursor.
+    """
+    payload = json.dumps([str(key) for key in keys], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *, size: int) -> tuple[uuid.UUID, ...]:
+    """
+    Decode a cursor created by `encode_cursor` back into its sort key.
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        keys = json.loads(payload)
+        if not isinstance(keys, list) or len(keys) != size:
+            raise ValueError(keys)
+        return tuple(uuid.UUID(key) for key in keys)
+    except (AttributeError, TypeError, ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def estimate_row_count(session: AsyncSession, table_name: str) -> int | None:
+    """
+    Return the planner estimate of the number of rows in a table, summed
+    over its partitions for a partitioned table.
+
+    `None` means Postgres has no statistics for the table yet.
+    """
+    # pg_partition_tree lists no leaves for a table without partitions
+    statement = text(
+        "SELECT sum(reltuples) FILTER (WHERE reltuples >= 0)::bigint "
+        "FROM pg_class, to_regclass(quote_ident(:table_name)) AS target "
+        "WHERE oid IN (SELECT relid FROM pg_partition_tree(target) WHERE isleaf) "
+        "OR oid = target AND relkind <> 'p'"
+    )
+    result = await session.execute(statement, {"table_name": table_name})
+    estimate = result.scalar()
+    if estimate is None:
+        return None
+    return int(estimate)
+
+
+def select_public(
+    table_model: type[SQLModel],
+    public_model: type[SQLModel],
+    names: Sequence[str] | None = None,
+) -> Select[Any]:
+    """
+    Select only the columns of `table_model` exposed by `public_model`, in the
+    order they are declared there, or only the columns in `names`.
+    """
+    names = names or list(public_model.model_fields)
+    return Select(*(getattr(table_model, name) for name in names))
+
+
+def construct_public(
+    public_model: type[P],
+    rows: Sequence[Sequence[Any]],
+    names: Sequence[str] | None = None,
+) -> list[P]:
+    """
+    Build public models from rows of `select_public`, skipping validation:
+    the values come straight from the database columns they describe.
+    """
+    names = names or list(public_model.model_fields)
+    return [
+        public_model.model_construct(**dict(zip(names, row, strict=True)))
+        for row in rows
+    ]
+
+
+def model_response(model: SQLModel, *, fields: Sequence[str] | None = None) -> Response:
+    """
+    Serialize a response model built with `construct_public` once, instead of
+    letting FastAPI validate it again against the `response_model`.
+
+    With `fields`, only those fields of each model in its `data` are included.
+    """
+    include: dict[str, Any] | None = None
+    if fields:
+        include = dict.fromkeys(type(model).model_fields, True)
+        include["data"] = {"__all__": set(fields)}
+    return serialize_model(model, include=include)
+
+
+async def read_page(
+    session: AsyncSession,
+    statement: Select[Any],
+    *,
+    count_statement: SelectOfScalar[int],
+    count_mode: CountMode,
+    estimate_table: str | None = None,
+) -> tuple[Sequence[Sequence[Any]], int | None, bool]:
+    """
+    Run a page query and count its rows as requested by `count_mode`.
+
+    Returns the rows, the count and whether the count is an estimate.
+    `estimate_table` should only be given when `count_statement` is
+    unfiltered, otherwise "estimated" falls back to an exact count.
+    """
+    if count_mode == "window":
+        window_statement = statement.add_columns(func.count().over())
+        rows = (await session.execute(window_statement)).all()
+        if rows:
+            return [row[:-1] for row in rows], rows[0][-1], False
+        # An empty page has no row to carry the total, count separately
+        return [], (await session.exec(count_statement)).one(), False
+
+    items = (await session.exec(statement)).all()
+    if count_mode == "none":
+        return items, None, False
+    if count_mode == "estimated" and estimate_table:
+        estimate = await estimate_row_count(session, estimate_table)
+        if estimate is not None:
+            return items, estimate, True
+    return items, (await session.exec(count_statement)).one(), False
+
+
+async def read_shard_pages(
+    engines: Sequence[AsyncEngine],
+    statement: Select[Any],
+    *,
+    offset: int,
+    limit: int,
+    sort_key: Callable[[Any], Any],
+    count_statement: SelectOfScalar[int],
+    count_mode: CountMode,
+    estimate_table: str | None = None,
+) -> tuple[Sequence[Sequence[Any]], int | None, bool]:
+    """
+    `read_page` across shards: every shard returns its first `offset + limit`
+    rows of `statement`, which must be ordered by `sort_key`, and the pages
+    are merged before skipping `offset` rows. The counts add up, and the
+    total is an estimate when one of them is.
+    """
+
+    async def load(
+        session: AsyncSession,
+    ) -> tuple[Sequence[Sequence[Any]], int | None, bool]:
+        return await read_page(
+            session,
+            statement.limit(offset + limit),
+            count_statement=count_statement,
+            count_mode=count_mode,
+            estimate_table=estimate_table,
+        )
+
+    pages = await gather_shards([read_only_engine(e) for e in engines], load)
+    rows = list(
+        islice(
+            heapq.merge(*(rows for rows, _, _ in pages), key=sort_key),
+            offset,
+            offset + limit,
+        )
+    )
+    counts = [count for _, count, _ in pages]
+    count = None if None in counts else sum(c for c in counts if c is not None)
+    return rows, count, any(estimated for _, _, estimated in pages)
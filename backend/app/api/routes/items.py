@@ -1,109 +1,576 @@
 import uuid
-from typing import Any
+from operator import attrgetter
+from typing import Annotated, Any
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import col, delete, func, insert, select, tuple_, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
+from app import item_import
+from app.api.cached import (
+    CachedResponse,
+    cache_response,
+    coalesce,
+    get_cached_response,
+)
+from app.api.conditional import check_if_match, make_etag, not_modified
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentUser,
+    ReadEngineDep,
+    ReadEnginesDep,
+    ReadSessionDep,
+    shard_session,
+    user_session,
+)
+from app.api.export import ExportFormat, export_response
+from app.api.fields import ItemFields, load_fields, sparse_response, with_keys
+from app.api.pagination import (
+    CountMode,
+    construct_public,
+    decode_cursor,
+    encode_cursor,
+    model_response,
+    read_page,
+    read_shard_pages,
+    select_public,
+)
+from app.api.routing import MsgpackRoute
+from app.core.cache import invalidate_items, item_cache_key
+from app.core.config import settings
+from app.core.responses import accepts_msgpack
+from app.core.shards import gather_shards, shards
+from app.models import (
+    AuthUser,
+    Item,
+    ItemBatchResult,
+    ItemBatchResults,
+    ItemBatchUpdate,
+    ItemCreate,
+    ItemImportReport,
+    ItemPublic,
+    ItemsPublic,
+    ItemUpdate,
+    Message,
+    User,
+)
 
-router = APIRouter(prefix="/items", tags=["items"])
+router = APIRouter(prefix="/items", tags=["items"], route_class=MsgpackRoute)
+
+BatchSize = Body(min_length=1, max_length=settings.MAX_BATCH_SIZE)
+
+
+async def get_batch_items(
+    session: AsyncSession, current_user: AuthUser, ids: list[uuid.UUID]
+) -> tuple[dict[uuid.UUID, Item], dict[uuid.UUID, ItemBatchResult]]:
+    """
+    Load the items of a batch, split into the ones the user may change and
+    the results for the ones they may not.
+
+    Regular users' items are looked up in the partition of their owner id,
+    only ids not found there are looked up in every partition.
+    """
+    found: dict[uuid.UUID, Item] = {}
+    if not current_user.is_superuser:
+        result = await session.exec(
+            select(Item).where(
+                col(Item.owner_id) == current_user.id, col(Item.id).in_(set(ids))
+            )
+        )
+        found = {item.id: item for item in result}
+    if missing := set(ids) - found.keys():
+        result = await session.exec(select(Item).where(col(Item.id).in_(missing)))
+        found.update((item.id, item) for item in result)
+    allowed: dict[uuid.UUID, Item] = {}
+    rejected: dict[uuid.UUID, ItemBatchResult] = {}
+    for id in ids:
+        item = found.get(id)
+        if not item:
+            rejected[id] = ItemBatchResult(id=id, status=404, detail="Item not found")
+        elif not current_user.is_superuser and (item.owner_id != current_user.id):
+            rejected[id] = ItemBatchResult(
+                id=id, status=400, detail="Not enough permissions"
+            )
+        else:
+            allowed[id] = item
+    return allowed, rejected
+
+
+async def batch_shards(
+    current_user: AuthUser, ids: list[uuid.UUID]
+) -> dict[int | None, list[uuid.UUID]]:
+    """
+    Group the ids of a batch by the shard of their item for superusers, who
+    may reach the items of any owner. Ids found on no shard, and all ids of
+    other users, are grouped under None, for the user's own shard.
+    """
+    if len(shards) == 1 or not current_user.is_superuser:
+        return {None: ids}
+
+    async def found(session: AsyncSession) -> set[uuid.UUID]:
+        result = await session.exec(select(Item.id).where(col(Item.id).in_(set(ids))))
+        return set(result)
+
+    results = await gather_shards(shards.engines, found)
+    groups: dict[int | None, list[uuid.UUID]] = {}
+    for id in ids:
+        shard = next((shard for shard, hit in enumerate(results) if id in hit), None)
+        groups.setdefault(shard, []).append(id)
+    return groups
+
+
+async def get_item(
+    session: AsyncSession, current_user: AuthUser, statement: SelectOfScalar[Item]
+) -> Item | None:
+    """
+    Run `statement`, a lookup of one item by id. A regular user's own item
+    is looked up in the partition of their owner id, only superusers and
+    items of other owners, which are then refused, read every partition.
+    """
+    if not current_user.is_superuser:
+        owned = statement.where(col(Item.owner_id) == current_user.id)
+        if item := (await session.exec(owned)).first():
+            return item
+    return (await session.exec(statement)).first()
+
+
+async def item_shard(current_user: AuthUser, id: uuid.UUID) -> int | None:
+    """
+    Find the shard of item `id` for superusers, who may reach the items of
+    any owner. Other users only have items on their own shard.
+    """
+    if len(shards) == 1 or not current_user.is_superuser:
+        return None
+    return await shards.locate(select(Item.id).where(Item.id == id))
 
 
 @router.get("/", response_model=ItemsPublic)
-def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+async def read_items(
+    session: ReadSessionDep,
+    engines: ReadEnginesDep,
+    current_user: CurrentUser,
+    skip: int = 0,
+    limit: Annotated[int, Query(ge=1, le=settings.MAX_PAGE_SIZE)] = 100,
+    cursor: str | None = None,
+    count_mode: Annotated[CountMode, Query(alias="count")] = "exact",
+    fields: ItemFields = None,
 ) -> Any:
     """
     Retrieve items.
+
+    Pass the `next_cursor` of a previous page as `cursor` to fetch the next
+    page by key instead of by `skip`, which gets slower the deeper it goes.
+
+    `count` selects how the total is computed: "exact", "estimated" (from
+    planner statistics, only when listing all items), "none" or "window"
+    (in the same query as the page).
+
+    `fields` limits the columns read and returned for each item.
     """
+    # The cursor is built from the keys even when they are not requested
+    names = with_keys(fields, ["owner_id", "id"]) if fields else None
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
-    else:
-        count_statement = (
-            select(func.count())
-            .select_from(Item)
-            .where(Item.owner_id == current_user.id)
+    count_statement = select(func.count()).select_from(Item)
+    statement = select_public(Item, ItemPublic, names).order_by(
+        col(Item.owner_id), col(Item.id)
+    )
+    estimate_table: str | None = "item"
+    if not current_user.is_superuser:
+        count_statement = count_statement.where(Item.owner_id == current_user.id)
+        statement = statement.where(col(Item.owner_id) == current_user.id)
+        estimate_table = None
+    offset = skip
+    if cursor:
+        owner_id, item_id = decode_cursor(cursor, size=2)
+        statement = statement.where(
+            tuple_(Item.owner_id, Item.id) > tuple_(owner_id, item_id)
         )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Item)
-            .where(Item.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
+        offset = 0
+        # A window count would only cover the rows after the cursor
+        if count_mode == "window":
+            count_mode = "exact"
+
+    async def load(session: AsyncSession) -> Response:
+        # The items of a user are all on their shard, superusers see all shards
+        if current_user.is_superuser and len(shards) > 1:
+            rows, count, count_estimated = await read_shard_pages(
+                engines,
+                statement,
+                offset=offset,
+                limit=limit,
+                sort_key=attrgetter("owner_id", "id"),
+                count_statement=count_statement,
+                count_mode=count_mode,
+                estimate_table=estimate_table,
+            )
+        else:
+            rows, count, count_estimated = await read_page(
+                session,
+                statement.offset(offset).limit(limit),
+                count_statement=count_statement,
+                count_mode=count_mode,
+                estimate_table=estimate_table,
+            )
+        items = construct_public(ItemPublic, rows, names)
+
+        next_cursor = None
+        if len(items) == limit:
+            next_cursor = encode_cursor(items[-1].owner_id, items[-1].id)
+        return model_response(
+            ItemsPublic.model_construct(
+                data=items,
+                count=count,
+                count_estimated=count_estimated,
+                next_cursor=next_cursor,
+            ),
+            fields=fields,
+        )
+
+    if not current_user.is_superuser:
+        return await load(session)
+    # Superusers all see the same pages, identical requests can share one
+    media_type = "msgpack" if accepts_msgpack.get() else "json"
+    key = f"items:{media_type}:{skip}:{limit}:{cursor}:{count_mode}:{fields}"
+    shared = await coalesce(key, session, load)
+    # The response itself is not shared, middlewares change its headers
+    return Response(shared.body, media_type=shared.media_type)
+
+
+# Declared before the "/{id}" routes so "export" is not parsed as an id
+@router.get("/export", response_class=StreamingResponse)
+async def export_items(
+    bind: ReadEngineDep,
+    engines: ReadEnginesDep,
+    current_user: CurrentUser,
+    format: ExportFormat = "ndjson",
+) -> StreamingResponse:
+    """
+    Stream all items visible to the user as NDJSON or CSV, for superusers one
+    shard after the other.
+    """
+    statement = select_public(Item, ItemPublic).order_by(
+        col(Item.owner_id), col(Item.id)
+    )
+    binds = engines
+    if not current_user.is_superuser:
+        statement = statement.where(col(Item.owner_id) == current_user.id)
+        binds = [bind]
+    return export_response(
+        statement, binds=binds, export_format=format, filename="items"
+    )
+
+
+# Declared before the "/{id}" routes so "batch" is not parsed as an id
+@router.post("/batch", response_model=ItemBatchResults)
+async def create_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    items_in: Annotated[list[ItemCreate], BatchSize],
+) -> Any:
+    """
+    Create several items in one transaction.
+    """
+    items = [
+        Item.model_validate(item_in, update={"owner_id": current_user.id})
+        for item_in in items_in
+    ]
+    # Ids are generated here, so a single multi-row INSERT is enough and
+    # nothing needs to be read back
+    await session.execute(insert(Item).values([item.model_dump() for item in items]))
+    await session.commit()
+    return ItemBatchResults(
+        data=[
+            ItemBatchResult(
+                id=item.id, status=200, item=ItemPublic.model_validate(item)
+            )
+            for item in items
+        ]
+    )
+
+
+@router.post(
+    "/import",
+    response_model=ItemImportReport,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/x-ndjson": {"schema": {"type": "string"}},
+                "text/csv": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def import_items(
+    request: Request,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    format: item_import.ImportFormat = "ndjson",
+    owner_id: uuid.UUID | None = None,
+) -> Any:
+    """
+    Import items from an NDJSON or CSV request body.
+
+    Every line (or CSV row after the header) is an item with a `title` and
+    an optional `description`. Valid rows are loaded with COPY, invalid ones
+    are skipped and listed in the report. Superusers may import for another
+    user with `owner_id`.
+    """
+    if owner_id and owner_id != current_user.id:
+        if not current_user.is_superuser:
+            raise HTTPException(status_code=400, detail="Not enough permissions")
+    owner_id = owner_id or current_user.id
+    async with user_session(session, owner_id) as session:
+        if owner_id != current_user.id and not await session.get(User, owner_id):
+            raise HTTPException(status_code=404, detail="User not found")
+        return await item_import.import_items(
+            session,
+            request.stream(),
+            owner_id=owner_id,
+            import_format=format,
+        )
+
+
+async def update_batch(
+    session: AsyncSession, current_user: AuthUser, items_in: list[ItemBatchUpdate]
+) -> list[ItemBatchResult]:
+    """
+    Apply the updates of a batch whose items are all on the shard of
+    `session`, in one transaction, and return their results in order.
+    """
+    allowed, rejected = await get_batch_items(
+        session, current_user, [item_in.id for item_in in items_in]
+    )
+    current = {id: ItemPublic.model_validate(item) for id, item in allowed.items()}
+    rows = []
+    results = []
+    for item_in in items_in:
+        if item_in.id in rejected:
+            results.append(rejected[item_in.id])
+            continue
+        update_dict = item_in.model_dump(exclude_unset=True, exclude={"id"})
+        if update_dict:
+            # The owner completes the primary key, each UPDATE reads one
+            # partition
+            owner_id = allowed[item_in.id].owner_id
+            rows.append({"id": item_in.id, "owner_id": owner_id, **update_dict})
+            current[item_in.id] = current[item_in.id].model_copy(update=update_dict)
+        results.append(
+            ItemBatchResult(id=item_in.id, status=200, item=current[item_in.id])
         )
-        items = session.exec(statement).all()
+    if rows:
+        # Bulk UPDATE by primary key, sent as one executemany
+        await session.execute(update(Item), rows)
+        await session.commit()
+        await invalidate_items(row["id"] for row in rows)
+    return results
+
+
+@router.patch("/batch", response_model=ItemBatchResults)
+async def update_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    items_in: Annotated[list[ItemBatchUpdate], BatchSize],
+) -> Any:
+    """
+    Update several items in one transaction, one per shard for superusers.
+
+    Each element is applied only if the item exists and belongs to the user,
+    the others are reported in the results and do not fail the batch.
+    """
+    groups = await batch_shards(current_user, [item_in.id for item_in in items_in])
+    results: dict[uuid.UUID, list[ItemBatchResult]] = {}
+    for shard, ids in groups.items():
+        on_shard = set(ids)
+        batch = [item_in for item_in in items_in if item_in.id in on_shard]
+        async with shard_session(session, shard) as batch_session:
+            for result in await update_batch(batch_session, current_user, batch):
+                results.setdefault(result.id, []).append(result)
+    # Back in the order of the request, an id may be updated more than once
+    return ItemBatchResults(data=[results[item_in.id].pop(0) for item_in in items_in])
+
+
+async def delete_batch(
+    session: AsyncSession, current_user: AuthUser, ids: list[uuid.UUID]
+) -> dict[uuid.UUID, ItemBatchResult]:
+    """
+    Delete the items of a batch that are all on the shard of `session`, in
+    one transaction, and return their results by id.
+    """
+    allowed, rejected = await get_batch_items(session, current_user, ids)
+    if allowed:
+        owner_ids = {item.owner_id for item in allowed.values()}
+        await session.execute(
+            delete(Item).where(
+                col(Item.owner_id).in_(owner_ids), col(Item.id).in_(allowed)
+            )
+        )
+        await session.commit()
+        await invalidate_items(allowed)
+    return {
+        id: rejected.get(id)
+        or ItemBatchResult(id=id, status=200, detail="Item deleted successfully")
+        for id in ids
+    }
+
 
-    return ItemsPublic(data=items, count=count)
+@router.delete("/batch", response_model=ItemBatchResults)
+async def delete_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    ids: Annotated[list[uuid.UUID], BatchSize],
+) -> Any:
+    """
+    Delete several items in one transaction, one per shard for superusers.
+    """
+    results: dict[uuid.UUID, ItemBatchResult] = {}
+    for shard, shard_ids in (await batch_shards(current_user, ids)).items():
+        async with shard_session(session, shard) as batch_session:
+            results.update(await delete_batch(batch_session, current_user, shard_ids))
+    return ItemBatchResults(data=[results[id] for id in ids])
 
 
 @router.get("/{id}", response_model=ItemPublic)
-def read_item(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+async def read_item(
+    session: ReadSessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    fields: ItemFields = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Any:
     """
     Get item by ID.
+
+    Answers 304 Not Modified when `If-None-Match` has the current `ETag`.
+    With `fields`, only those columns are read and returned, bypassing the
+    response cache which holds the full item.
     """
-    item = session.get(Item, id)
-    if not item:
+    if fields:
+        statement = (
+            select(Item)
+            .where(Item.id == id)
+            .options(
+                load_fields(Item, with_keys(fields, ["id", "owner_id", "version"]))
+            )
+        )
+        shard = await item_shard(current_user, id)
+        async with shard_session(session, shard) as session:
+            item = await get_item(session, current_user, statement)
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        if not current_user.is_superuser and (item.owner_id != current_user.id):
+            raise HTTPException(status_code=400, detail="Not enough permissions")
+        etag = make_etag(item.id, item.version, fields)
+        if cached := not_modified(if_none_match, etag):
+            return cached
+        return sparse_response(ItemPublic, item, fields, headers={"ETag": etag})
+
+    key = item_cache_key(id)
+    entry = await get_cached_response(key)
+    if entry is None:
+
+        async def load(session: AsyncSession) -> CachedResponse | None:
+            item = await get_item(
+                session, current_user, select(Item).where(Item.id == id)
+            )
+            if not item:
+                return None
+            return await cache_response(
+                key,
+                ItemPublic.model_validate(item),
+                etag=make_etag(item.id, item.version),
+                owner_id=item.owner_id,
+                session=session,
+            )
+
+        # The lookup runs as the first caller, only share it with callers who
+        # would get the same answer: the same owner, or superusers. coalesce
+        # adds the server, so the shard, to the key.
+        scope = "superuser" if current_user.is_superuser else current_user.id.hex
+        shard = await item_shard(current_user, id)
+        async with shard_session(session, shard) as session:
+            entry = await coalesce(f"{key}:{scope}", session, load)
+    if entry is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
+    if not current_user.is_superuser and (entry.owner_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    return item
+    if cached := not_modified(if_none_match, entry.etag):
+        return cached
+    return entry.to_response()
 
 
 @router.post("/", response_model=ItemPublic)
-def create_item(
-    *, session: SessionDep, current_user: CurrentUser, item_in: ItemCreate
+async def create_item(
+    *, session: AsyncSessionDep, current_user: CurrentUser, item_in: ItemCreate
 ) -> Any:
     """
     Create new item.
     """
     item = Item.model_validate(item_in, update={"owner_id": current_user.id})
     session.add(item)
-    session.commit()
-    session.refresh(item)
+    await session.commit()
     return item
 
 
 @router.put("/{id}", response_model=ItemPublic)
-def update_item(
+async def update_item(
     *,
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: CurrentUser,
     id: uuid.UUID,
     item_in: ItemUpdate,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Update an item.
+
+    With `If-Match` the update only happens if the item still has that
+    `ETag`, otherwise it answers 412 Precondition Failed.
     """
-    item = session.get(Item, id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    update_dict = item_in.model_dump(exclude_unset=True)
-    item.sqlmodel_update(update_dict)
-    session.add(item)
-    session.commit()
-    session.refresh(item)
+    statement = select(Item).where(Item.id == id)
+    if if_match:
+        # Locked, so it cannot change between the version check and the write
+        statement = statement.with_for_update().execution_options(
+            populate_existing=True
+        )
+    shard = await item_shard(current_user, id)
+    async with shard_session(session, shard) as session:
+        item = await get_item(session, current_user, statement)
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        if not current_user.is_superuser and (item.owner_id != current_user.id):
+            raise HTTPException(status_code=400, detail="Not enough permissions")
+        check_if_match(if_match, make_etag(item.id, item.version))
+        update_dict = item_in.model_dump(exclude_unset=True)
+        item.sqlmodel_update(update_dict)
+        session.add(item)
+        await session.commit()
+        await invalidate_items([item.id])
+    response.headers["ETag"] = make_etag(item.id, item.version)
     return item
 
 
 @router.delete("/{id}")
-def delete_item(
-    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+async def delete_item(
+    session: AsyncSessionDep, current_user: CurrentUser, id: uuid.UUID
 ) -> Message:
     """
     Delete an item.
     """
-    item = session.get(Item, id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(item)
-    session.commit()
+    shard = await item_shard(current_user, id)
+    async with shard_session(session, shard) as session:
+        item = await get_item(session, current_user, select(Item).where(Item.id == id))
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        if not current_user.is_superuser and (item.owner_id != current_user.id):
+            raise HTTPException(status_code=400, detail="Not enough permissions")
+        await session.delete(item)
+        await session.commit()
+    await invalidate_items([item.id])
     return Message(message="Item deleted successfully")
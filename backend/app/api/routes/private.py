@@ -4,13 +4,16 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 
 from app.api.deps import SessionDep
+from app.api.routing import MsgpackRoute
+from app.core.config import settings
 from app.core.security import get_password_hash
 from app.models import (
+    ShardAssignment,
     User,
     UserPublic,
 )
 
-router = APIRouter(tags=["private"], prefix="/private")
+router = APIRouter(tags=["private"], prefix="/private", route_class=MsgpackRoute)
 
 
 class PrivateUserCreate(BaseModel):
@@ -33,6 +36,9 @@ def create_user(user_in: PrivateUserCreate, session: SessionDep) -> Any:
     )
 
     session.add(user)
+    if settings.POSTGRES_SHARD_URLS:
+        # Created in the main database, whichever shard its id hashes to
+        session.add(ShardAssignment(owner_id=user.id, shard=0))
     session.commit()
 
     return user
@@ -1,17 +1,50 @@
 import uuid
-from typing import Any
+from operator import attrgetter
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlmodel import col, delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
+from app.api.cached import (
+    CachedResponse,
+    cache_response,
+    coalesce,
+    get_cached_response,
+)
+from app.api.conditional import check_if_match, get_for_update, make_etag, not_modified
 from app.api.deps import (
+    AsyncSessionDep,
     CurrentUser,
-    SessionDep,
+    CurrentUserRow,
+    ReadEnginesDep,
+    ReadSessionDep,
+    claim_email,
     get_current_active_superuser,
+    get_current_user_row,
+    get_user_by_email,
+    release_email,
+    user_session,
+)
+from app.api.export import ExportFormat, export_response
+from app.api.fields import UserFields, load_fields, sparse_response, with_keys
+from app.api.pagination import (
+    CountMode,
+    construct_public,
+    decode_cursor,
+    encode_cursor,
+    model_response,
+    read_page,
+    read_shard_pages,
+    select_public,
 )
+from app.api.routing import MsgpackRoute
+from app.core.cache import invalidate_items, invalidate_user, user_cache_key
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash_async, verify_password_async
+from app.core.shards import shards
 from app.models import (
     Item,
     Message,
@@ -24,9 +57,9 @@ from app.models import (
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
+from app.utils import generate_new_account_email
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=MsgpackRoute)
 
 
 @router.get(
@@ -34,99 +67,208 @@ router = APIRouter(prefix="/users", tags=["users"])
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(
+    session: ReadSessionDep,
+    engines: ReadEnginesDep,
+    skip: int = 0,
+    limit: Annotated[int, Query(ge=1, le=settings.MAX_PAGE_SIZE)] = 100,
+    cursor: str | None = None,
+    count_mode: Annotated[CountMode, Query(alias="count")] = "exact",
+    fields: UserFields = None,
+) -> Any:
     """
     Retrieve users.
+
+    Pass the `next_cursor` of a previous page as `cursor` to fetch the next
+    page by key instead of by `skip`.
+
+    `count` selects how the total is computed: "exact", "estimated" (from
+    planner statistics), "none" or "window" (in the same query as the page).
+
+    `fields` limits the columns read and returned for each user.
     """
+    # The cursor is built from the id even when it is not requested
+    names = with_keys(fields, ["id"]) if fields else None
 
     count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    statement = select_public(User, UserPublic, names).order_by(col(User.id))
+    offset = skip
+    if cursor:
+        (user_id,) = decode_cursor(cursor, size=1)
+        statement = statement.where(col(User.id) > user_id)
+        offset = 0
+        # A window count would only cover the rows after the cursor
+        if count_mode == "window":
+            count_mode = "exact"
+    if len(shards) > 1:
+        rows, count, count_estimated = await read_shard_pages(
+            engines,
+            statement,
+            offset=offset,
+            limit=limit,
+            sort_key=attrgetter("id"),
+            count_statement=count_statement,
+            count_mode=count_mode,
+            estimate_table="user",
+        )
+    else:
+        rows, count, count_estimated = await read_page(
+            session,
+            statement.offset(offset).limit(limit),
+            count_statement=count_statement,
+            count_mode=count_mode,
+            estimate_table="user",
+        )
+    users = construct_public(UserPublic, rows, names)
 
-    return UsersPublic(data=users, count=count)
+    next_cursor = encode_cursor(users[-1].id) if len(users) == limit else None
+    return model_response(
+        UsersPublic.model_construct(
+            data=users,
+            count=count,
+            count_estimated=count_estimated,
+            next_cursor=next_cursor,
+        ),
+        fields=fields,
+    )
 
 
 @router.post(
     "/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic
 )
-def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
+async def create_user(*, session: AsyncSessionDep, user_in: UserCreate) -> Any:
     """
     Create new user.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
-    if user:
+    # Created on the shard its id is routed to
+    user_id = uuid.uuid4()
+    user = await get_user_by_email(session, user_in.email)
+    if user or not await claim_email(user_in.email, user_id):
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
-
-    user = crud.create_user(session=session, user_create=user_in)
-    if settings.emails_enabled and user_in.email:
-        email_data = generate_new_account_email(
-            email_to=user_in.email, username=user_in.email, password=user_in.password
-        )
-        send_email(
-            email_to=user_in.email,
-            subject=email_data.subject,
-            html_content=email_data.html_content,
-        )
+    try:
+        async with user_session(session, user_id) as session:
+            if settings.emails_enabled and user_in.email:
+                email_data = generate_new_account_email(
+                    email_to=user_in.email,
+                    username=user_in.email,
+                    password=user_in.password,
+                )
+                # Staged before create_user so its commit writes both rows at
+                # once
+                crud.enqueue_email(
+                    session=session, email_to=user_in.email, email_data=email_data
+                )
+            user = await crud.create_user(
+                session=session, user_create=user_in, user_id=user_id
+            )
+    except BaseException:
+        await release_email(user_in.email, user_id)
+        raise
     return user
 
 
 @router.patch("/me", response_model=UserPublic)
-def update_user_me(
-    *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentUser
+async def update_user_me(
+    *, session: AsyncSessionDep, user_in: UserUpdateMe, current_user: CurrentUserRow
 ) -> Any:
     """
     Update own user.
     """
 
-    if user_in.email:
-        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
-        if existing_user and existing_user.id != current_user.id:
+    previous_email = current_user.email
+    new_email = user_in.email if user_in.email != previous_email else None
+    if new_email:
+        existing_user = await get_user_by_email(session, new_email)
+        if (
+            existing_user and existing_user.id != current_user.id
+        ) or not await claim_email(new_email, current_user.id):
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
             )
     user_data = user_in.model_dump(exclude_unset=True)
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    try:
+        await session.commit()
+    except BaseException:
+        if new_email:
+            await release_email(new_email, current_user.id)
+        raise
+    if new_email:
+        await release_email(previous_email, current_user.id)
+    await invalidate_user(current_user.id)
+    await session.refresh(current_user)
     return current_user
 
 
 @router.patch("/me/password", response_model=Message)
-def update_password_me(
-    *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
+async def update_password_me(
+    *, session: AsyncSessionDep, body: UpdatePassword, current_user: CurrentUserRow
 ) -> Any:
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
+    if not await verify_password_async(
+        body.current_password, current_user.hashed_password
+    ):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
         raise HTTPException(
             status_code=400, detail="New password cannot be the same as the current one"
         )
-    hashed_password = get_password_hash(body.new_password)
+    hashed_password = await get_password_hash_async(body.new_password)
     current_user.hashed_password = hashed_password
     session.add(current_user)
-    session.commit()
+    await session.commit()
+    await invalidate_user(current_user.id)
     return Message(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+async def read_user_me(
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    response: Response,
+    fields: UserFields = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Any:
     """
     Get current user.
+
+    `fields` limits the fields read and returned.
     """
-    return current_user
+    if fields:
+        # Like CurrentUserRow, without reading the other columns
+        statement = (
+            select(User)
+            .where(User.id == current_user.id)
+            .options(
+                load_fields(User, with_keys(fields, ["id", "version", "is_active"]))
+            )
+        )
+        partial = (await session.exec(statement)).first()
+        if not partial:
+            raise HTTPException(status_code=404, detail="User not found")
+        if not partial.is_active:
+            raise HTTPException(status_code=400, detail="Inactive user")
+        etag = make_etag(partial.id, partial.version, fields)
+        if cached := not_modified(if_none_match, etag):
+            return cached
+        return sparse_response(UserPublic, partial, fields, headers={"ETag": etag})
+    user = await get_current_user_row(session, current_user)
+    etag = make_etag(user.id, user.version)
+    if cached := not_modified(if_none_match, etag):
+        return cached
+    response.headers["ETag"] = etag
+    return user
 
 
 @router.delete("/me", response_model=Message)
-def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
+async def delete_user_me(session: AsyncSessionDep, current_user: CurrentUserRow) -> Any:
     """
     Delete own user.
     """
@@ -134,43 +276,102 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    session.delete(current_user)
-    session.commit()
+    statement = (
+        delete(Item)
+        .where(col(Item.owner_id) == current_user.id)
+        .returning(col(Item.id))
+    )
+    item_ids = (await session.execute(statement)).scalars().all()
+    await session.delete(current_user)
+    await session.commit()
+    await release_email(current_user.email, current_user.id)
+    await invalidate_user(current_user.id)
+    await invalidate_items(item_ids)
     return Message(message="User deleted successfully")
 
 
 @router.post("/signup", response_model=UserPublic)
-def register_user(session: SessionDep, user_in: UserRegister) -> Any:
+async def register_user(session: AsyncSessionDep, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
-    if user:
+    user_id = uuid.uuid4()
+    user = await get_user_by_email(session, user_in.email)
+    if user or not await claim_email(user_in.email, user_id):
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system",
         )
     user_create = UserCreate.model_validate(user_in)
-    user = crud.create_user(session=session, user_create=user_create)
+    try:
+        async with user_session(session, user_id) as session:
+            user = await crud.create_user(
+                session=session, user_create=user_create, user_id=user_id
+            )
+    except BaseException:
+        await release_email(user_in.email, user_id)
+        raise
     return user
 
 
+# Declared before "/{user_id}" so "export" is not parsed as an id
+@router.get(
+    "/export",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_class=StreamingResponse,
+)
+async def export_users(
+    engines: ReadEnginesDep, format: ExportFormat = "ndjson"
+) -> StreamingResponse:
+    """
+    Stream all users as NDJSON or CSV, one shard after the other.
+    """
+    statement = select_public(User, UserPublic).order_by(col(User.id))
+    return export_response(
+        statement, binds=engines, export_format=format, filename="users"
+    )
+
+
 @router.get("/{user_id}", response_model=UserPublic)
-def read_user_by_id(
-    user_id: uuid.UUID, session: SessionDep, current_user: CurrentUser
+async def read_user_by_id(
+    user_id: uuid.UUID,
+    session: ReadSessionDep,
+    current_user: CurrentUser,
+    if_none_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Get a specific user by id.
     """
-    user = session.get(User, user_id)
-    if user == current_user:
-        return user
-    if not current_user.is_superuser:
+    key = user_cache_key(user_id)
+    entry = await get_cached_response(key)
+    if entry is None:
+
+        async def load(session: AsyncSession) -> CachedResponse | None:
+            user = await session.get(User, user_id)
+            if not user:
+                return None
+            return await cache_response(
+                key,
+                UserPublic.model_validate(user),
+                etag=make_etag(user.id, user.version),
+                owner_id=user.id,
+                session=session,
+            )
+
+        async with user_session(session, user_id) as session:
+            entry = await coalesce(key, session, load)
+    if (entry is None or entry.owner_id != current_user.id) and (
+        not current_user.is_superuser
+    ):
         raise HTTPException(
             status_code=403,
             detail="The user doesn't have enough privileges",
         )
-    return user
+    if entry is None:
+        return None
+    if cached := not_modified(if_none_match, entry.etag):
+        return cached
+    return entry.to_response()
 
 
 @router.patch(
@@ -178,49 +379,74 @@ def read_user_by_id(
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UserPublic,
 )
-def update_user(
+async def update_user(
     *,
-    session: SessionDep,
+    session: AsyncSessionDep,
     user_id: uuid.UUID,
     user_in: UserUpdate,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Update a user.
-    """
 
-    db_user = session.get(User, user_id)
-    if not db_user:
-        raise HTTPException(
-            status_code=404,
-            detail="The user with this id does not exist in the system",
-        )
-    if user_in.email:
-        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
-        if existing_user and existing_user.id != user_id:
+    With `If-Match` the update only happens if the user still has that
+    `ETag`, otherwise it answers 412 Precondition Failed.
+    """
+    async with user_session(session, user_id) as session:
+        db_user = await get_for_update(session, User, user_id, if_match=if_match)
+        if not db_user:
             raise HTTPException(
-                status_code=409, detail="User with this email already exists"
+                status_code=404,
+                detail="The user with this id does not exist in the system",
             )
-
-    db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+        check_if_match(if_match, make_etag(db_user.id, db_user.version))
+        previous_email = db_user.email
+        new_email = user_in.email if user_in.email != previous_email else None
+        if new_email:
+            existing_user = await get_user_by_email(session, new_email)
+            if (existing_user and existing_user.id != user_id) or not await claim_email(
+                new_email, user_id
+            ):
+                raise HTTPException(
+                    status_code=409, detail="User with this email already exists"
+                )
+        try:
+            db_user = await crud.update_user(
+                session=session, db_user=db_user, user_in=user_in
+            )
+        except BaseException:
+            if new_email:
+                await release_email(new_email, user_id)
+            raise
+    if new_email:
+        await release_email(previous_email, user_id)
+    response.headers["ETag"] = make_etag(db_user.id, db_user.version)
     return db_user
 
 
 @router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser)])
-def delete_user(
-    session: SessionDep, current_user: CurrentUser, user_id: uuid.UUID
+async def delete_user(
+    session: AsyncSessionDep, current_user: CurrentUser, user_id: uuid.UUID
 ) -> Message:
     """
     Delete a user.
     """
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    if user == current_user:
+    if user_id == current_user.id:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Item).where(col(Item.owner_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
+    async with user_session(session, user_id) as session:
+        user = await session.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        statement = (
+            delete(Item).where(col(Item.owner_id) == user_id).returning(col(Item.id))
+        )
+        item_ids = (await session.execute(statement)).scalars().all()
+        await session.delete(user)
+        await session.commit()
+    await release_email(user.email, user_id)
+    await invalidate_user(user_id)
+    await invalidate_items(item_ids)
     return Message(message="User deleted successfully")
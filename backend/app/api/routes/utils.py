@@ -1,11 +1,23 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
+from app import crud
+from app.api.deps import AsyncSessionDep, get_current_active_superuser
+from app.api.routing import MsgpackRoute
+from app.core.cache import response_cache, user_cache
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.core.pool import pool_stats
+from app.core.replicas import replicas
+from app.core.security import password_hasher
+from app.core.shards import shards
+from app.core.singleflight import singleflight
 from app.models import Message
-from app.utils import generate_test_email, send_email
+from app.utils import generate_test_email
 
-router = APIRouter(prefix="/utils", tags=["utils"])
+router = APIRouter(prefix="/utils", tags=["utils"], route_class=MsgpackRoute)
 
 
 @router.post(
@@ -13,19 +25,55 @@ router = APIRouter(prefix="/utils", tags=["utils"])
     dependencies=[Depends(get_current_active_superuser)],
     status_code=201,
 )
-def test_email(email_to: EmailStr) -> Message:
+async def test_email(email_to: EmailStr, session: AsyncSessionDep) -> Message:
     """
     Test emails.
     """
     email_data = generate_test_email(email_to=email_to)
-    send_email(
-        email_to=email_to,
-        subject=email_data.subject,
-        html_content=email_data.html_content,
-    )
+    crud.enqueue_email(session=session, email_to=email_to, email_data=email_data)
+    await session.commit()
     return Message(message="Test email sent")
 
 
+@router.get("/metrics/", dependencies=[Depends(get_current_active_superuser)])
+async def read_metrics() -> dict[str, dict[str, Any]]:
+    """
+    Counters of the in-process caches and pools of the worker serving the
+    request.
+    """
+    return {
+        "user_cache": user_cache.stats(),
+        "response_cache": await response_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "singleflight": singleflight.stats(),
+        "database_pool": pool_stats(async_engine.pool),
+    }
+
+
+@router.get("/database-pool/", dependencies=[Depends(get_current_active_superuser)])
+async def read_database_pool() -> dict[str, Any]:
+    """
+    Pool settings and connections of both engines in the worker serving the
+    request, the API's and the blocking one used by background work, the
+    state of the read replicas and the shards.
+    """
+    return {
+        "settings": {
+            "pool_size": settings.POSTGRES_POOL_SIZE,
+            "max_overflow": settings.POSTGRES_POOL_MAX_OVERFLOW,
+            "pool_timeout": settings.POSTGRES_POOL_TIMEOUT_SECONDS,
+            "pool_recycle": settings.POSTGRES_POOL_RECYCLE_SECONDS,
+            "pre_ping": settings.POSTGRES_POOL_PRE_PING,
+            "statement_timeout_ms": settings.POSTGRES_STATEMENT_TIMEOUT_MS,
+            "transaction_pooler": settings.POSTGRES_TRANSACTION_POOLER,
+        },
+        "api": pool_stats(async_engine.pool),
+        "blocking": pool_stats(engine.pool),
+        "replicas": replicas.stats(),
+        "shards": shards.stats(),
+    }
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
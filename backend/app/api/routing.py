@@ -0,0 +1,130 @@
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+import msgpack  # type: ignore[import-untyped]
+from fastapi import HTTPException, Request, Response
+from fastapi.datastructures import Default, DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+from app.core.responses import (
+    MSGPACK_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPES,
+    accepts_msgpack,
+    negotiated_response_class,
+    wants_msgpack,
+)
+
+NEGOTIATED = {JSONResponse.media_type, MSGPACK_MEDIA_TYPE}
+
+# Appended to the ETags of MessagePack bodies, like the fields of a sparse
+# fieldset by make_etag: the same version in another encoding is another
+# representation, it must not be served for the JSON one or the reverse
+MSGPACK_ETAG_SUFFIX = '-msgpack"'
+
+
+def negotiate(
+    response_class: type[Response] | DefaultPlaceholder,
+) -> type[Response] | DefaultPlaceholder:
+    """
+    Extend a JSON response class to answer in MessagePack. A default stays a
+    default, so the routers and the app can still override it.
+    """
+    if isinstance(response_class, DefaultPlaceholder):
+        return Default(negotiate(response_class.value))
+    if issubclass(response_class, JSONResponse):
+        return negotiated_response_class(response_class)
+    return response_class
+
+
+async def decode_msgpack_body(request: Request) -> Request:
+    """
+    Return a request carrying the decoded MessagePack body as if it had been
+    sent as JSON, so FastAPI validates it like any JSON body.
+    """
+    body = await request.body()
+    try:
+        data = msgpack.unpackb(body)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid MessagePack body")
+    headers = [
+        (name, value)
+        for name, value in request.scope["headers"]
+        if name != b"content-type"
+    ]
+    headers.append((b"content-type", b"application/json"))
+    decoded = Request({**request.scope, "headers": headers}, request.receive)
+    decoded._body = body
+    decoded._json = data
+    return decoded
+
+
+def negotiate_if_none_match(request: Request, msgpack: bool) -> Request:
+    """
+    Return a request whose If-None-Match only lists the ETags of the
+    negotiated encoding, without the MessagePack suffix, so routes compare
+    them with the ETags they build for JSON.
+    """
+    header = request.headers.get("if-none-match")
+    if not header or header.strip() == "*":
+        return request
+    tags = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.endswith(MSGPACK_ETAG_SUFFIX) == msgpack:
+            tags.append(tag.removesuffix(MSGPACK_ETAG_SUFFIX) + '"' if msgpack else tag)
+    headers = [
+        (name, value)
+        for name, value in request.scope["headers"]
+        if name != b"if-none-match"
+    ]
+    if tags:
+        headers.append((b"if-none-match", ", ".join(tags).encode("latin-1")))
+    return Request({**request.scope, "headers": headers}, request.receive)
+
+
+class MsgpackRoute(APIRoute):
+    """
+    A route that also speaks MessagePack: bodies sent with a MessagePack
+    `Content-Type` are decoded without a JSON step, and responses are encoded
+    as MessagePack when the `Accept` header asks for it. JSON stays the
+    default and the only format in the OpenAPI schema.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        endpoint: Callable[..., Any],
+        *,
+        response_class: type[Response] | DefaultPlaceholder = Default(JSONResponse),
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            path, endpoint, response_class=negotiate(response_class), **kwargs
+        )
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            wants = wants_msgpack(request.headers.get("accept"))
+            request = negotiate_if_none_match(request, wants)
+            content_type = request.headers.get("content-type", "")
+            if content_type.partition(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES:
+                request = await decode_msgpack_body(request)
+            token = accepts_msgpack.set(wants)
+            try:
+                response = await handler(request)
+            finally:
+                accepts_msgpack.reset(token)
+            if response.media_type in NEGOTIATED:
+                response.headers.append("Vary", "Accept")
+            etag = response.headers.get("etag")
+            if etag and (
+                response.media_type == MSGPACK_MEDIA_TYPE
+                or (wants and response.status_code == 304)
+            ):
+                response.headers["ETag"] = etag[:-1] + MSGPACK_ETAG_SUFFIX
+            return response
+
+        return route_handler
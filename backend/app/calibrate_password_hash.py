@@ -0,0 +1,91 @@
+import argparse
+import logging
+import statistics
+import time
+from typing import Any
+
+from passlib.hash import argon2, bcrypt
+
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SAMPLE_PASSWORD = "calibration-password"
+# Never suggest a cost below these, whatever the hardware
+MIN_BCRYPT_ROUNDS = 10
+MIN_ARGON2_TIME_COST = 2
+
+
+def measure(handler: Any, samples: int) -> float:
+    """
+    Return the median time in seconds to verify a hash made by `handler`.
+    """
+    hashed = handler.hash(SAMPLE_PASSWORD)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.verify(SAMPLE_PASSWORD, hashed)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate_bcrypt(target_seconds: float, samples: int) -> int:
+    """
+    Return the highest bcrypt cost whose verify fits in `target_seconds`.
+    """
+    rounds = MIN_BCRYPT_ROUNDS
+    while rounds < 31:
+        elapsed = measure(bcrypt.using(rounds=rounds + 1), samples)
+        logger.info(f"bcrypt rounds={rounds + 1}: {elapsed * 1000:.1f} ms")
+        if elapsed > target_seconds:
+            break
+        rounds += 1
+    return rounds
+
+
+def calibrate_argon2(target_seconds: float, samples: int) -> int:
+    """
+    Return the highest argon2id time cost whose verify fits in
+    `target_seconds` with the configured memory cost and parallelism.
+    """
+    time_cost = MIN_ARGON2_TIME_COST
+    while True:
+        handler = argon2.using(  # type: ignore[no-untyped-call]
+            type="ID",
+            rounds=time_cost + 1,
+            memory_cost=settings.PASSWORD_ARGON2_MEMORY_COST,
+            parallelism=settings.PASSWORD_ARGON2_PARALLELISM,
+        )
+        elapsed = measure(handler, samples)
+        logger.info(f"argon2id time_cost={time_cost + 1}: {elapsed * 1000:.1f} ms")
+        if elapsed > target_seconds:
+            break
+        time_cost += 1
+    return time_cost
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Pick password hashing parameters for a latency budget"
+    )
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default="bcrypt")
+    parser.add_argument("--target-ms", type=float, default=100)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    target_seconds = args.target_ms / 1000
+    logger.info(f"Calibrating {args.scheme} for {args.target_ms:.0f} ms per verify")
+    if args.scheme == "bcrypt":
+        rounds = calibrate_bcrypt(target_seconds, args.samples)
+        suggested = {"PASSWORD_BCRYPT_ROUNDS": rounds}
+    else:
+        time_cost = calibrate_argon2(target_seconds, args.samples)
+        suggested = {"PASSWORD_ARGON2_TIME_COST": time_cost}
+    logger.info("Suggested settings:")
+    for name, value in {"PASSWORD_HASH_SCHEME": args.scheme, **suggested}.items():
+        logger.info(f"{name}={value}")
+
+
+if __name__ == "__main__":
+    main()
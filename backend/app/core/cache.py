@@ -0,0 +1,366 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any, Generic, TypeVar
+from urllib.parse import unquote, urlsplit
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Bounded in-process LRU cache whose entries expire after `ttl` seconds.
+
+    The cache is per worker process: entries invalidated here can still be
+    served by other workers until they expire there.
+    """
+
+    def __init__(self, *, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# AuthUser fields of recently authenticated users, keyed by user id
+user_cache: TTLCache[str, dict[str, Any]] = TTLCache(
+    max_size=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS
+)
+
+
+# Stored in place of a deleted entry, cached values are never empty
+TOMBSTONE = b""
+
+
+class CacheBackend(ABC):
+    """
+    Shared interface of the response cache backends, values are opaque bytes.
+
+    Backends fail open: an unreachable cache behaves like an empty one.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes) -> None:
+        """
+        Store `value`, unless `key` was deleted less than the tombstone TTL
+        ago: a read that started before a change was committed must not put
+        back what the change invalidated.
+        """
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """
+        Delete `keys`, leaving a tombstone that keeps them from being set
+        again for the tombstone TTL.
+        """
+
+    @abstractmethod
+    async def stats(self) -> dict[str, Any]: ...
+
+
+def hit_ratio(hits: int, misses: int) -> float | None:
+    lookups = hits + misses
+    return hits / lookups if lookups else None
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Per worker LRU cache, see `TTLCache` for the consistency caveat.
+    """
+
+    def __init__(self, *, max_size: int, ttl: float, tombstone_ttl: float) -> None:
+        self.cache: TTLCache[str, bytes] = TTLCache(max_size=max_size, ttl=ttl)
+        self.tombstones: TTLCache[str, bool] = TTLCache(
+            max_size=max_size, ttl=tombstone_ttl
+        )
+
+    async def get(self, key: str) -> bytes | None:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        if not self.tombstones.get(key):
+            self.cache.set(key, value)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.cache.delete(key)
+            self.tombstones.set(key, True)
+
+    async def stats(self) -> dict[str, Any]:
+        stats = self.cache.stats()
+        return {
+            "backend": "memory",
+            "hit_ratio": hit_ratio(stats["hits"], stats["misses"]),
+            **stats,
+        }
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """
+    Minimal RESP2 client connection, enough for the commands the cache uses.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, url: str) -> "RedisConnection":
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(
+            parts.hostname or "localhost", parts.port or 6379
+        )
+        connection = cls(reader, writer)
+        if parts.password:
+            # With a username, an ACL user rather than the default one
+            credentials = [unquote(parts.password)]
+            if parts.username:
+                credentials.insert(0, unquote(parts.username))
+            await connection.command("AUTH", *credentials)
+        database = parts.path.lstrip("/")
+        if database and database != "0":
+            await connection.command("SELECT", database)
+        return connection
+
+    async def command(self, *args: str | bytes) -> Any:
+        return (await self.pipeline([args]))[0]
+
+    async def pipeline(self, commands: list[tuple[str | bytes, ...]]) -> list[Any]:
+        """
+        Send `commands` in one write and return their replies.
+        """
+        out = []
+        for args in commands:
+            out.append(b"*%d\r\n" % len(args))
+            for arg in args:
+                data = arg.encode() if isinstance(arg, str) else arg
+                out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.writer.write(b"".join(out))
+        await self.writer.drain()
+        return [await self.read_reply() for _ in commands]
+
+    async def read_reply(self) -> Any:
+        line = await self.reader.readuntil(b"\r\n")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest
+        if prefix == b"-":
+            raise RedisError(rest.decode())
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            return (await self.reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache shared by all workers in a Redis compatible server, spoken to over
+    plain asyncio streams with a small pool of connections.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        ttl: float,
+        tombstone_ttl: float,
+        max_connections: int,
+        timeout: float,
+    ) -> None:
+        self.url = url
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._idle: list[RedisConnection] = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def _pipeline(self, commands: list[tuple[str | bytes, ...]]) -> list[Any]:
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(
+                        RedisConnection.open(self.url), self.timeout
+                    )
+                replies = await asyncio.wait_for(
+                    connection.pipeline(commands), self.timeout
+                )
+            except BaseException:
+                # The connection may be mid reply, never reuse it
+                if connection is not None:
+                    connection.close()
+                raise
+            self._idle.append(connection)
+            return replies
+
+    async def _try_pipeline(
+        self, commands: list[tuple[str | bytes, ...]]
+    ) -> list[Any] | None:
+        try:
+            return await self._pipeline(commands)
+        except (
+            OSError,
+            asyncio.TimeoutError,
+            RedisError,
+            asyncio.IncompleteReadError,
+        ) as e:
+            self.errors += 1
+            logger.warning(f"Response cache {commands[0][0]!r} failed: {e!r}")
+            return None
+
+    async def _try(self, *args: str | bytes) -> Any:
+        replies = await self._try_pipeline([args])
+        return replies[0] if replies is not None else None
+
+    async def get(self, key: str) -> bytes | None:
+        value = await self._try("GET", key)
+        if not value:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value  # type: ignore[no-any-return]
+
+    async def set(self, key: str, value: bytes) -> None:
+        if self.ttl > 0:
+            # NX: a tombstone or a fresher value stays
+            ttl = str(int(self.ttl * 1000))
+            await self._try("SET", key, value, "PX", ttl, "NX")
+
+    async def delete(self, *keys: str) -> None:
+        if keys and self.ttl > 0:
+            ttl = str(int(self.tombstone_ttl * 1000))
+            await self._try_pipeline(
+                [("SET", key, TOMBSTONE, "PX", ttl) for key in keys]
+            )
+
+    async def stats(self) -> dict[str, Any]:
+        # Evictions happen server side, ask the server
+        info = await self._try("INFO", "stats")
+        evictions = None
+        if info is not None:
+            match = re.search(rb"^evicted_keys:(\d+)", info, re.MULTILINE)
+            evictions = int(match.group(1)) if match else None
+        return {
+            "backend": "redis",
+            "hit_ratio": hit_ratio(self.hits, self.misses),
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "evictions": evictions,
+        }
+
+
+def item_cache_key(id: uuid.UUID) -> str:
+    return f"item:{id.hex}"
+
+
+def user_cache_key(id: uuid.UUID) -> str:
+    return f"user:{id.hex}"
+
+
+def get_response_cache() -> CacheBackend:
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        return RedisCacheBackend(
+            settings.RESPONSE_CACHE_REDIS_URL,
+            ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+            tombstone_ttl=settings.RESPONSE_CACHE_TOMBSTONE_SECONDS,
+            max_connections=settings.RESPONSE_CACHE_REDIS_MAX_CONNECTIONS,
+            timeout=settings.RESPONSE_CACHE_REDIS_TIMEOUT_SECONDS,
+        )
+    return MemoryCacheBackend(
+        max_size=settings.RESPONSE_CACHE_MAX_SIZE,
+        ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+        tombstone_ttl=settings.RESPONSE_CACHE_TOMBSTONE_SECONDS,
+    )
+
+
+# Serialized public representations of items and users, keyed by
+# item_cache_key / user_cache_key
+response_cache = get_response_cache()
+
+
+async def invalidate_user(user_id: uuid.UUID) -> None:
+    """
+    Drop every cached copy of a user, call it after committing a change.
+    """
+    user_cache.delete(str(user_id))
+    await response_cache.delete(user_cache_key(user_id))
+
+
+async def invalidate_items(ids: Iterable[uuid.UUID]) -> None:
+    await response_cache.delete(*(item_cache_key(id) for id in ids))
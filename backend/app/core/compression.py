@@ -0,0 +1,235 @@
+import zlib
+from collections.abc import Iterable
+from typing import Protocol
+
+import brotli  # type: ignore[import-untyped]
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+# Supported encodings in order of preference
+ENCODINGS = ("zstd", "br", "gzip")
+
+# Responses that are already compressed or must reach the client unbuffered
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream", "image/", "video/", "application/zip")
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes:
+        """
+        Return everything compressed so far, without ending the stream.
+        """
+        ...
+
+    def finish(self) -> bytes: ...
+
+
+class GzipCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)  # type: ignore[no-any-return]
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()  # type: ignore[no-any-return]
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()  # type: ignore[no-any-return]
+
+
+class ZstdCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def make_compressor(encoding: str) -> Compressor:
+    if encoding == "zstd":
+        return ZstdCompressor(settings.COMPRESSION_ZSTD_LEVEL)
+    if encoding == "br":
+        return BrotliCompressor(settings.COMPRESSION_BROTLI_QUALITY)
+    return GzipCompressor(settings.COMPRESSION_GZIP_LEVEL)
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """
+    Return the preferred encoding that an Accept-Encoding header allows, or
+    None to send the response as is.
+    """
+    if not accept_encoding:
+        return None
+    accepted: dict[str, float] = {}
+    for coding in accept_encoding.split(","):
+        name, *params = coding.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+class CompressionResponder:
+    """
+    Compress one response. Whether it is compressed in one go or chunk by
+    chunk is only known with its first body message, so the start message
+    is held until then.
+    """
+
+    def __init__(self, app: ASGIApp, encoding: str) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.start: Message | None = None
+        self.compressor: Compressor | None = None
+        self.send: Send
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            if not compressible(headers) or (
+                not more_body and len(body) < settings.COMPRESSION_MIN_SIZE
+            ):
+                # A 304 stands for the compressed representation sent before
+                if start["status"] == 304:
+                    weaken_etag(headers)
+                await self.send(start)
+                await self.send(message)
+                return
+            self.compressor = make_compressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            weaken_etag(headers)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                headers["Content-Length"] = str(len(body))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            await self.send(start)
+        if self.compressor is None:
+            await self.send(message)
+            return
+        # Flush every chunk so streaming clients are not kept waiting
+        body = self.compressor.compress(body) + (
+            self.compressor.flush() if more_body else self.compressor.finish()
+        )
+        await self.send(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
+
+
+def weaken_etag(headers: MutableHeaders) -> None:
+    """
+    Mark a strong ETag as weak: the compressed bytes are a different
+    representation, but still the same version of the resource.
+    """
+    if (etag := headers.get("ETag")) and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+def compressible(headers: Headers) -> bool:
+    if "Content-Encoding" in headers:
+        return False
+    return not headers.get("Content-Type", "").startswith(UNCOMPRESSED_MEDIA_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with zstd, brotli or gzip depending on the request's
+    Accept-Encoding.
+
+    GET responses of `static_paths`, which don't change while the app runs,
+    are kept already compressed for each encoding instead of being rendered
+    and compressed on every request.
+    """
+
+    def __init__(self, app: ASGIApp, *, static_paths: Iterable[str] = ()) -> None:
+        self.app = app
+        self.static_paths = set(static_paths)
+        self.static: dict[tuple[str, str | None], list[Message]] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("Accept-Encoding"))
+        if scope["method"] == "GET" and scope["path"] in self.static_paths:
+            await self.send_static(scope, receive, send, encoding)
+        elif encoding is None:
+            await self.app(scope, receive, send)
+        else:
+            responder = CompressionResponder(self.app, encoding)
+            await responder(scope, receive, send)
+
+    async def send_static(
+        self, scope: Scope, receive: Receive, send: Send, encoding: str | None
+    ) -> None:
+        key = (scope["path"], encoding)
+        messages = self.static.get(key)
+        if messages is None:
+            messages = []
+
+            async def capture(message: Message) -> None:
+                messages.append(message)
+
+            if encoding is None:
+                await self.app(scope, receive, capture)
+            else:
+                responder = CompressionResponder(self.app, encoding)
+                await responder(scope, receive, capture)
+            if messages[0]["status"] == 200:
+                self.static[key] = messages
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message["headers"])}
+            await send(message)
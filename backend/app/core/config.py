@@ -1,3 +1,5 @@
+import importlib.util
+import os
 import secrets
 import warnings
 from typing import Annotated, Any, Literal
@@ -9,6 +11,7 @@ from pydantic import (
     HttpUrl,
     PostgresDsn,
     computed_field,
+    field_validator,
     model_validator,
 )
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -34,6 +37,79 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     # 60 minutes * 24 hours * 8 days = 8 days
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Encoder for JSON responses, "orjson" and "msgspec" are faster but need
+    # the library of the same name, installed with the fast-json extra
+    JSON_RESPONSE_CLASS: Literal["json", "orjson", "msgspec"] = "json"
+
+    @field_validator("JSON_RESPONSE_CLASS")
+    @classmethod
+    def _check_json_library(cls, v: str) -> str:
+        if v != "json" and importlib.util.find_spec(v) is None:
+            raise ValueError(
+                f'JSON_RESPONSE_CLASS is "{v}" but the {v} package is not '
+                'installed, install the app with the "fast-json" extra.'
+            )
+        return v
+
+    # Upper bound for the `limit` query parameter of list endpoints
+    MAX_PAGE_SIZE: int = 1000
+    # Upper bound for the number of elements in a batch request
+    MAX_BATCH_SIZE: int = 1000
+    # Rows fetched per round trip from the server-side cursor of exports
+    EXPORT_BATCH_SIZE: int = 1000
+    # Rows validated and written to COPY at a time by item imports, and how
+    # many rejected rows an import report lists
+    IMPORT_CHUNK_SIZE: int = 5000
+    IMPORT_MAX_REJECTS: int = 1000
+    # Per worker cache of authenticated users, a TTL of 0 disables it
+    USER_CACHE_TTL_SECONDS: float = 30
+    USER_CACHE_MAX_SIZE: int = 10_000
+    # Cache of serialized items and users for the read endpoints, a TTL of 0
+    # disables it. "memory" is per worker, so other workers may serve a stale
+    # copy until the TTL expires, use "redis" with several workers. An
+    # invalidated key is not cached again for TOMBSTONE_SECONDS, which must
+    # outlast the reads that started before the change was committed.
+    RESPONSE_CACHE_BACKEND: Literal["memory", "redis"] = "memory"
+    RESPONSE_CACHE_TTL_SECONDS: float = 0
+    RESPONSE_CACHE_TOMBSTONE_SECONDS: float = 10
+    RESPONSE_CACHE_MAX_SIZE: int = 10_000
+    RESPONSE_CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    RESPONSE_CACHE_REDIS_MAX_CONNECTIONS: int = 10
+    RESPONSE_CACHE_REDIS_TIMEOUT_SECONDS: float = 0.1
+    # Share one database call between identical concurrent reads of an item,
+    # a user or a superuser item page, see app.core.singleflight
+    SINGLEFLIGHT_ENABLED: bool = False
+    # Responses of at least COMPRESSION_MIN_SIZE bytes are compressed with the
+    # best encoding the client accepts among zstd, br and gzip, streaming
+    # responses always are.
+    COMPRESSION_MIN_SIZE: int = 1000
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    # Password hashing policy, tune with `python -m app.calibrate_password_hash`.
+    # Stored hashes that don't match it are rehashed on the next login.
+    PASSWORD_HASH_SCHEME: Literal["bcrypt", "argon2"] = "bcrypt"
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_ARGON2_TIME_COST: int = 3
+    PASSWORD_ARGON2_MEMORY_COST: int = 64 * 1024  # KiB
+    PASSWORD_ARGON2_PARALLELISM: int = 4
+    # Dedicated pool for password hashing, see app.core.executor
+    PASSWORD_HASH_EXECUTOR: Literal["thread", "process"] = "thread"
+    # Defaults to this process's share of the cores, every web worker
+    # process has its own pool
+    PASSWORD_HASH_WORKERS: int | None = None
+    # Hashes waiting or running before requests get a 503
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # Web worker processes per host, the Dockerfile passes it to --workers
+    WEB_CONCURRENCY: int = 1
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def password_hash_workers(self) -> int:
+        if self.PASSWORD_HASH_WORKERS is not None:
+            return self.PASSWORD_HASH_WORKERS
+        return max(1, (os.cpu_count() or 1) // self.WEB_CONCURRENCY)
+
     FRONTEND_HOST: str = "http://localhost:5173"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
@@ -55,6 +131,59 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str = ""
     POSTGRES_DB: str = ""
+    # Connection pool of each engine, per worker process: a worker opens up to
+    # POOL_SIZE + POOL_MAX_OVERFLOW connections per engine, so plan for
+    # workers times that within Postgres' max_connections. A checkout waits
+    # POOL_TIMEOUT_SECONDS for a free connection before failing, connections
+    # older than POOL_RECYCLE_SECONDS are reopened (-1 never) and POOL_PRE_PING
+    # tests each one on checkout.
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_POOL_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT_SECONDS: float = 30
+    POSTGRES_POOL_RECYCLE_SECONDS: int = 1800
+    POSTGRES_POOL_PRE_PING: bool = False
+    # statement_timeout of every connection in milliseconds, 0 disables it
+    POSTGRES_STATEMENT_TIMEOUT_MS: int = 0
+    # Connect through a transaction pooler such as PgBouncer in
+    # pool_mode=transaction: the engines open a connection to the pooler per
+    # session instead of keeping a pool, POSTGRES_POOL_* are ignored, prepared
+    # statements are disabled and the statement timeout is set per
+    # transaction. Autocommit sessions get none, set it on the database role.
+    POSTGRES_TRANSACTION_POOLER: bool = False
+    # Sessions of GET, HEAD and OPTIONS requests: "autocommit" runs each
+    # query on its own, saving the BEGIN and ROLLBACK round trips, though
+    # queries of one request may see different snapshots; "read_only" keeps
+    # the transaction and has the server refuse writes; "transaction" is the
+    # same as for the other methods.
+    POSTGRES_SAFE_METHOD_SESSION: Literal["autocommit", "read_only", "transaction"] = (
+        "autocommit"
+    )
+    # Streaming replicas for the GET routes, as SQLAlchemy URLs separated by
+    # commas. Replicas more than MAX_LAG_BYTES of WAL behind the primary, or
+    # failing the check run every CHECK_SECONDS, are skipped until they
+    # recover. Clients read their own writes, see app.core.replicas.
+    POSTGRES_REPLICA_URLS: Annotated[list[str] | str, BeforeValidator(parse_cors)] = []
+    POSTGRES_REPLICA_MAX_LAG_BYTES: int = 16 * 1024 * 1024
+    POSTGRES_REPLICA_CHECK_SECONDS: float = 1
+    # Further databases users and their items are sharded to by owner id, as
+    # SQLAlchemy URLs separated by commas. The main database is shard 0, it
+    # holds the owners assigned to another shard than their hash, reloaded by
+    # every worker each ASSIGNMENT_REFRESH_SECONDS, see app.core.shards.
+    POSTGRES_SHARD_URLS: Annotated[list[str] | str, BeforeValidator(parse_cors)] = []
+    POSTGRES_SHARD_ASSIGNMENT_REFRESH_SECONDS: float = 5
+    # Number of shards owner ids are hashed to, the first ones. Kept apart
+    # from the URLs so adding a shard moves no one, raise it only after
+    # pinning the owners it would move, see app.shard_rebalance.
+    POSTGRES_SHARD_HASH_COUNT: int = 1
+
+    @model_validator(mode="after")
+    def _check_shard_hash_count(self) -> Self:
+        if not 1 <= self.POSTGRES_SHARD_HASH_COUNT <= 1 + len(self.POSTGRES_SHARD_URLS):
+            raise ValueError(
+                "POSTGRES_SHARD_HASH_COUNT must be between 1 and the number of "
+                "shards, the main database included"
+            )
+        return self
 
     @computed_field  # type: ignore[prop-decorator]
     @property
@@ -84,6 +213,17 @@ class Settings(BaseSettings):
         return self
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
+    # Outbox delivery, see app.email_worker. Failed sends are retried after
+    # RETRY_BASE_SECONDS * 2 ** (attempts - 1), capped at RETRY_MAX_SECONDS,
+    # and the email is marked dead after MAX_ATTEMPTS
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 8
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS: float = 30
+    EMAIL_OUTBOX_RETRY_MAX_SECONDS: float = 3600
+    EMAIL_OUTBOX_POLL_SECONDS: float = 5
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50
+    # Directory where compiled email templates are cached across restarts,
+    # templates are compiled from source on every start when unset
+    EMAIL_TEMPLATES_BYTECODE_CACHE_DIR: str | None = None
 
     @computed_field  # type: ignore[prop-decorator]
     @property
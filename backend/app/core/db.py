@@ -1,10 +1,98 @@
-from sqlmodel import Session, create_engine, select
+from typing import Any
+
+from sqlalchemy import Connection, Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool, Pool
+from sqlmodel import create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.core.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+from app.models import ShardAssignment, User, UserCreate, UserEmail
+
+
+def engine_options(poolclass: type[Pool]) -> dict[str, Any]:
+    """
+    Keyword arguments shared by the engines, from the POSTGRES_POOL_*
+    settings, or for a transaction pooler with POSTGRES_TRANSACTION_POOLER.
+    """
+    if settings.POSTGRES_TRANSACTION_POOLER:
+        # The pooler keeps the connections, and each transaction may run on
+        # another server connection: prepared statements would be missing
+        # from it, and the pooler refuses startup options
+        return {"poolclass": NullPool, "connect_args": {"prepare_threshold": None}}
+    options: dict[str, Any] = {
+        "poolclass": poolclass,
+        "pool_size": settings.POSTGRES_POOL_SIZE,
+        "max_overflow": settings.POSTGRES_POOL_MAX_OVERFLOW,
+        "pool_timeout": settings.POSTGRES_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.POSTGRES_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+    }
+    if settings.POSTGRES_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={settings.POSTGRES_STATEMENT_TIMEOUT_MS}"
+        }
+    return options
+
+
+@event.listens_for(Engine, "begin")
+def _set_local_statement_timeout(connection: Connection) -> None:
+    # Behind a transaction pooler, the timeout only lasts for the transaction
+    # so it does not stay on the server connection for other clients
+    if (
+        not settings.POSTGRES_TRANSACTION_POOLER
+        or not settings.POSTGRES_STATEMENT_TIMEOUT_MS
+        or connection.get_execution_options().get("isolation_level") == "AUTOCOMMIT"
+    ):
+        return
+    # Straight to the driver, the transaction is still being started
+    cursor = connection.connection.cursor()
+    cursor.execute(
+        f"SET LOCAL statement_timeout = {settings.POSTGRES_STATEMENT_TIMEOUT_MS}"
+    )
+    cursor.close()
+
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+# Blocking engine for Alembic, scripts and other code outside the event loop
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI), **engine_options(InstrumentedQueuePool)
+)
+# Engine used by the API, psycopg runs it natively on asyncio
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    **engine_options(InstrumentedAsyncQueuePool),
+)
+
+# Methods that must not change anything, their sessions only read
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Execution options of each POSTGRES_SAFE_METHOD_SESSION mode
+SAFE_METHOD_SESSION_OPTIONS: dict[str, dict[str, Any]] = {
+    "autocommit": {"isolation_level": "AUTOCOMMIT"},
+    "read_only": {"postgresql_readonly": True},
+    "transaction": {},
+}
+
+_read_only_engines: dict[tuple[AsyncEngine, str], AsyncEngine] = {}
+
+
+def read_only_engine(engine: AsyncEngine) -> AsyncEngine:
+    """
+    Return `engine` set up for sessions that only read, as selected by
+    `settings.POSTGRES_SAFE_METHOD_SESSION`. The variants share the pool of
+    `engine`, connections are switched back when they are returned.
+    """
+    mode = settings.POSTGRES_SAFE_METHOD_SESSION
+    if mode == "transaction":
+        return engine
+    key = (engine, mode)
+    if key not in _read_only_engines:
+        _read_only_engines[key] = engine.execution_options(
+            **SAFE_METHOD_SESSION_OPTIONS[mode]
+        )
+    return _read_only_engines[key]
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -12,7 +100,7 @@ engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
 # for more details: https://github.com/fastapi/full-stack-fastapi-template/issues/28
 
 
-def init_db(session: Session) -> None:
+async def init_db(session: AsyncSession) -> None:
     # Tables should be created with Alembic migrations
     # But if you don't want to use migrations, create
     # the tables un-commenting the next lines
@@ -21,13 +109,22 @@ def init_db(session: Session) -> None:
     # This works because the models are already imported and registered from app.models
     # SQLModel.metadata.create_all(engine)
 
-    user = session.exec(
+    result = await session.exec(
         select(User).where(User.email == settings.FIRST_SUPERUSER)
-    ).first()
+    )
+    user = result.first()
     if not user:
         user_in = UserCreate(
             email=settings.FIRST_SUPERUSER,
             password=settings.FIRST_SUPERUSER_PASSWORD,
             is_superuser=True,
         )
-        user = crud.create_user(session=session, user_create=user_in)
+        user = await crud.create_user(session=session, user_create=user_in)
+    if not await session.get(UserEmail, user.email):
+        # Claimed like the users created through the API
+        session.add(UserEmail(email=user.email, owner_id=user.id))
+        await session.commit()
+    if settings.POSTGRES_SHARD_URLS and not await session.get(ShardAssignment, user.id):
+        # Created in the main database, whichever shard its id hashes to
+        session.add(ShardAssignment(owner_id=user.id, shard=0))
+        await session.commit()
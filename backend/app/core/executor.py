@@ -0,0 +1,105 @@
+import asyncio
+import math
+import multiprocessing
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Literal, TypeVar
+
+from app.core.metrics import Histogram
+
+T = TypeVar("T")
+
+
+class ExecutorBusyError(Exception):
+    """
+    Raised instead of queueing when a `BoundedExecutor` backlog is full.
+    """
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Executor busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _timed(func: Callable[..., T], *args: Any) -> tuple[T, float]:
+    # Runs in the worker, so the duration excludes time spent queued
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class BoundedExecutor:
+    """
+    Run blocking CPU bound calls on a dedicated pool with a bounded backlog.
+
+    Keeps slow calls such as password hashing from taking over the shared
+    anyio threadpool. Calls beyond `max_pending` are rejected right away
+    with `ExecutorBusyError` so the API can answer 503 instead of queueing.
+    """
+
+    def __init__(
+        self, *, kind: Literal["thread", "process"], workers: int, max_pending: int
+    ) -> None:
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.run_time = Histogram()
+        self.wait_time = Histogram()
+        self._executor: Executor | None = None
+
+    def _get_executor(self) -> Executor:
+        # Created on first use, importing this module must not spawn workers
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="bounded-executor"
+                )
+        return self._executor
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.pending - self.workers)
+
+    def retry_after(self) -> int:
+        backlog_seconds = self.run_time.mean * self.pending / self.workers
+        return max(1, math.ceil(backlog_seconds))
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ExecutorBusyError(self.retry_after())
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, run_time = await loop.run_in_executor(
+                self._get_executor(), _timed, func, *args
+            )
+        finally:
+            self.pending -= 1
+        self.run_time.observe(run_time)
+        self.wait_time.observe(time.perf_counter() - start - run_time)
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "run_time_seconds": self.run_time.stats(),
+            "wait_time_seconds": self.wait_time.stats(),
+        }
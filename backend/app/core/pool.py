@@ -0,0 +1,71 @@
+import time
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.pool import (
+    AsyncAdaptedQueuePool,
+    ConnectionPoolEntry,
+    Pool,
+    QueuePool,
+)
+
+from app.core.metrics import Histogram
+
+
+class InstrumentedPoolMixin:
+    """
+    Measure how long checkouts wait for a connection, including the time to
+    open a new one, and count the ones that time out.
+    """
+
+    checkout_wait: Histogram
+    timeouts: int
+
+    def _init_metrics(self) -> None:
+        self.checkout_wait = Histogram()
+        self.timeouts = 0
+
+    def _timed_get(self, get: Any) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return get()  # type: ignore[no-any-return]
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.checkout_wait.observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._init_metrics()
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        return self._timed_get(super()._do_get)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._init_metrics()
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        return self._timed_get(super()._do_get)
+
+
+def pool_stats(pool: Pool) -> dict[str, Any]:
+    """
+    Connections of a worker's pool: checked out, idle in the pool, and
+    opened beyond `pool_size` (negative while the pool is not full yet).
+    """
+    stats: dict[str, Any] = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats["size"] = pool.size()
+        stats["checked_out"] = pool.checkedout()
+        stats["idle"] = pool.checkedin()
+        stats["overflow"] = pool.overflow()
+    if isinstance(pool, InstrumentedPoolMixin):
+        stats["timeouts"] = pool.timeouts
+        stats["checkout_wait_seconds"] = pool.checkout_wait.stats()
+    return stats
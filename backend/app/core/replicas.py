@@ -0,0 +1,281 @@
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.db import async_engine, engine_options
+from app.core.pool import InstrumentedAsyncQueuePool, pool_stats
+
+logger = logging.getLogger(__name__)
+
+# Where a client's last write ends in the primary's WAL, sent back by the
+# client so its next reads only go to replicas that have replayed it
+READ_AFTER_LSN_COOKIE = "read_after_lsn"
+READ_AFTER_LSN_HEADER = "X-Read-After-LSN"
+READ_AFTER_LSN_MAX_AGE = 300
+
+PRIMARY_LSN = text("SELECT pg_current_wal_insert_lsn()::text")
+# A server that is not in recovery has nothing to replay, it is up to date
+REPLAY_LSN = text(
+    "SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() "
+    "ELSE pg_current_wal_lsn() END::text"
+)
+
+
+def parse_lsn(lsn: str) -> int:
+    """
+    Convert a pg_lsn such as "16/B374D848" into a byte position in the WAL.
+    """
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+@dataclass
+class Replica:
+    engine: AsyncEngine
+    healthy: bool = False
+    replay_lsn: int = 0
+    lag_bytes: int | None = None
+    error: str | None = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "url": str(self.engine.url),
+            "healthy": self.healthy,
+            "lag_bytes": self.lag_bytes,
+            "error": self.error,
+            "pool": pool_stats(self.engine.pool),
+        }
+
+
+class ReplicaSet:
+    """
+    Streaming replicas the GET routes read from.
+
+    A background task checks each replica's replay position against the
+    primary every `check_seconds`. Replicas that fail the check or are more
+    than `max_lag_bytes` behind are skipped until they recover, and reads go
+    to the primary when no replica is usable. Replicas start unhealthy until
+    their first check.
+    """
+
+    def __init__(
+        self, replicas: list[Replica], *, max_lag_bytes: int, check_seconds: float
+    ) -> None:
+        self.replicas = replicas
+        self.max_lag_bytes = max_lag_bytes
+        self.check_seconds = check_seconds
+        self._next = itertools.count()
+        self._task: asyncio.Task[None] | None = None
+
+    @classmethod
+    def from_settings(cls) -> "ReplicaSet":
+        replicas = [
+            Replica(
+                create_async_engine(url, **engine_options(InstrumentedAsyncQueuePool))
+            )
+            for url in settings.POSTGRES_REPLICA_URLS
+        ]
+        return cls(
+            replicas,
+            max_lag_bytes=settings.POSTGRES_REPLICA_MAX_LAG_BYTES,
+            check_seconds=settings.POSTGRES_REPLICA_CHECK_SECONDS,
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self, read_after_lsn: int | None = None) -> Replica | None:
+        """
+        Return the next healthy replica, round robin, that has replayed
+        `read_after_lsn` as of its last check, or None to read from the
+        primary.
+        """
+        usable = [
+            replica
+            for replica in self.replicas
+            if replica.healthy
+            and (read_after_lsn is None or replica.replay_lsn >= read_after_lsn)
+        ]
+        if not usable:
+            return None
+        return usable[next(self._next) % len(usable)]
+
+    async def check(self) -> None:
+        try:
+            primary_lsn = await query_lsn(async_engine, PRIMARY_LSN, self.check_seconds)
+        except Exception as e:
+            logger.warning(f"Could not read the primary WAL position: {e!r}")
+            primary_lsn = None
+        await asyncio.gather(
+            *(self.check_replica(replica, primary_lsn) for replica in self.replicas)
+        )
+
+    async def check_replica(self, replica: Replica, primary_lsn: int | None) -> None:
+        was_healthy = replica.healthy
+        try:
+            replica.replay_lsn = await query_lsn(
+                replica.engine, REPLAY_LSN, self.check_seconds
+            )
+        except Exception as e:
+            replica.healthy = False
+            replica.lag_bytes = None
+            replica.error = repr(e)
+        else:
+            replica.error = None
+            replica.lag_bytes = (
+                max(primary_lsn - replica.replay_lsn, 0)
+                if primary_lsn is not None
+                else None
+            )
+            replica.healthy = (
+                replica.lag_bytes is not None
+                and replica.lag_bytes <= self.max_lag_bytes
+            )
+        if replica.healthy != was_healthy:
+            state = "healthy" if replica.healthy else "unhealthy"
+            logger.warning(
+                f"Replica {replica.engine.url} is {state}, "
+                f"lag: {replica.lag_bytes} bytes, error: {replica.error}"
+            )
+
+    async def run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_seconds)
+
+    def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+            replica.healthy = False
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [replica.stats() for replica in self.replicas]
+
+
+async def query_lsn(engine: AsyncEngine, statement: Any, timeout: float) -> int:
+    async def query() -> int:
+        async with engine.connect() as connection:
+            lsn = (await connection.execute(statement)).scalar_one()
+        return parse_lsn(lsn)
+
+    return await asyncio.wait_for(query(), timeout)
+
+
+replicas = ReplicaSet.from_settings()
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session: Session) -> None:
+    session.info["committed"] = True
+
+
+async def committed_lsn(session: AsyncSession) -> str | None:
+    """
+    Return the primary's WAL position after the writes `session` committed,
+    or after the ones passed to it with `pass_lsn` if later, None when it
+    did not write or there are no replicas to catch up.
+
+    Replicas are of the main database, writes to other shards have no
+    position they could replay.
+    """
+    lsns: list[str] = session.info.pop("passed_lsns", [])
+    bind = session.bind
+    if (
+        replicas
+        and session.info.pop("committed", False)
+        and isinstance(bind, AsyncEngine)
+        and bind.pool is async_engine.pool
+    ):
+        connection = await session.connection()
+        lsns.append((await connection.execute(PRIMARY_LSN)).scalar_one())
+    return max(lsns, key=parse_lsn, default=None)
+
+
+async def pass_lsn(other: AsyncSession, session: AsyncSession) -> None:
+    """
+    Hand the WAL position after the writes `other` committed to `session`,
+    for sessions opened next to the request's own.
+    """
+    if lsn := await committed_lsn(other):
+        session.info.setdefault("passed_lsns", []).append(lsn)
+
+
+def reads_replica(session: AsyncSession) -> bool:
+    """
+    Whether `session` is bound to one of the replicas, in any of its read
+    modes.
+    """
+    bind = session.bind
+    return isinstance(bind, AsyncEngine) and any(
+        bind.pool is replica.engine.pool for replica in replicas.replicas
+    )
+
+
+def requested_lsn(request: Request) -> int | None:
+    """
+    Read the WAL position a client must see from its header or cookie.
+    """
+    value = request.headers.get(READ_AFTER_LSN_HEADER) or request.cookies.get(
+        READ_AFTER_LSN_COOKIE
+    )
+    if not value:
+        return None
+    try:
+        return parse_lsn(value)
+    except ValueError:
+        return None
+
+
+class ReadAfterWriteMiddleware:
+    """
+    Hand clients the WAL position of their last write, found in the request
+    state by the session dependency, as a cookie for browsers and a header
+    for other clients to send back.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not replicas:
+            await self.app(scope, receive, send)
+            return
+        state = scope.setdefault("state", {})
+
+        async def send_with_lsn(message: Message) -> None:
+            if message["type"] == "http.response.start" and (
+                lsn := state.get("read_after_lsn")
+            ):
+                cookie = (
+                    f"{READ_AFTER_LSN_COOKIE}={lsn}; Max-Age={READ_AFTER_LSN_MAX_AGE}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = [
+                    *message["headers"],
+                    (b"set-cookie", cookie.encode()),
+                    (READ_AFTER_LSN_HEADER.lower().encode(), lsn.encode()),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_lsn)
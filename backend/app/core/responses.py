@@ -0,0 +1,155 @@
+import functools
+import importlib
+import json
+from collections.abc import Mapping
+from contextvars import ContextVar
+from typing import Any
+
+import msgpack  # type: ignore[import-untyped]
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+from app.core.config import settings
+
+
+@functools.cache
+def _msgspec_encoder() -> Any:
+    msgspec = importlib.import_module("msgspec")
+    return msgspec.json.Encoder()
+
+
+class MsgspecJSONResponse(JSONResponse):
+    """
+    JSON response encoded with msgspec, which like orjson handles UUIDs and
+    datetimes natively.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return _msgspec_encoder().encode(content)  # type: ignore[no-any-return]
+
+
+def get_default_response_class() -> type[JSONResponse]:
+    """
+    Return the response class selected by `settings.JSON_RESPONSE_CLASS`.
+
+    orjson and msgspec come with the fast-json extra, they are only imported
+    when selected, the settings check they are installed.
+    """
+    if settings.JSON_RESPONSE_CLASS == "orjson":
+        importlib.import_module("orjson")
+        return ORJSONResponse
+    if settings.JSON_RESPONSE_CLASS == "msgspec":
+        _msgspec_encoder()
+        return MsgspecJSONResponse
+    return JSONResponse
+
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack"}
+
+# Whether the request being handled asked for MessagePack, set by MsgpackRoute
+accepts_msgpack: ContextVar[bool] = ContextVar("accepts_msgpack", default=False)
+
+
+def wants_msgpack(accept: str | None) -> bool:
+    """
+    Tell whether an Accept header asks for MessagePack, JSON stays the default
+    for anything else.
+    """
+    if not accept:
+        return False
+    for media_range in accept.split(","):
+        media_type, *params = media_range.split(";")
+        if media_type.strip().lower() not in MSGPACK_MEDIA_TYPES:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+
+def packb(content: Any) -> bytes:
+    return msgpack.packb(content)  # type: ignore[no-any-return]
+
+
+class MsgpackNegotiation(JSONResponse):
+    """
+    Render the content as MessagePack instead of JSON when the request asked
+    for it. The class `media_type` stays JSON, which is what the OpenAPI
+    schema documents.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        media_type: str | None = None,
+        background: BackgroundTask | None = None,
+    ) -> None:
+        if media_type is None and accepts_msgpack.get():
+            media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, status_code, headers, media_type, background)
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return packb(content)
+        return super().render(content)
+
+
+_negotiated_classes: dict[type[JSONResponse], type[JSONResponse]] = {}
+
+
+def negotiated_response_class(json_class: type[JSONResponse]) -> type[JSONResponse]:
+    """
+    Return `json_class` extended to answer in MessagePack when asked to.
+    """
+    if issubclass(json_class, MsgpackNegotiation):
+        return json_class
+    if json_class not in _negotiated_classes:
+        _negotiated_classes[json_class] = type(
+            json_class.__name__, (MsgpackNegotiation, json_class), {}
+        )
+    return _negotiated_classes[json_class]
+
+
+def serialize_model(
+    model: BaseModel, *, include: Any = None, headers: Mapping[str, str] | None = None
+) -> Response:
+    """
+    Serialize `model` in the format the request asked for, straight from the
+    model without going through JSON for MessagePack.
+    """
+    if accepts_msgpack.get():
+        return Response(
+            packb(model.model_dump(mode="json", include=include)),
+            media_type=MSGPACK_MEDIA_TYPE,
+            headers=headers,
+        )
+    return Response(
+        model.model_dump_json(include=include),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def json_body_response(
+    body: bytes, *, headers: Mapping[str, str] | None = None
+) -> Response:
+    """
+    Answer with an already serialized JSON `body`, converted to MessagePack
+    when the request asked for it.
+    """
+    if accepts_msgpack.get():
+        return Response(
+            packb(json.loads(body)), media_type=MSGPACK_MEDIA_TYPE, headers=headers
+        )
+    return Response(body, media_type="application/json", headers=headers)
@@ -5,12 +5,34 @@ import jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.executor import BoundedExecutor
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# The configured scheme hashes new passwords, the other one is only kept to
+# verify existing hashes. Pinning min and max to the configured cost makes
+# needs_update() flag hashes created with any other cost.
+legacy_scheme = "argon2" if settings.PASSWORD_HASH_SCHEME == "bcrypt" else "bcrypt"
+pwd_context = CryptContext(
+    schemes=[settings.PASSWORD_HASH_SCHEME, legacy_scheme],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    argon2__default_rounds=settings.PASSWORD_ARGON2_TIME_COST,
+    argon2__min_rounds=settings.PASSWORD_ARGON2_TIME_COST,
+    argon2__max_rounds=settings.PASSWORD_ARGON2_TIME_COST,
+    argon2__memory_cost=settings.PASSWORD_ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.PASSWORD_ARGON2_PARALLELISM,
+)
 
 
 ALGORITHM = "HS256"
 
+password_hasher = BoundedExecutor(
+    kind=settings.PASSWORD_HASH_EXECUTOR,
+    workers=settings.password_hash_workers,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
 
 def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
@@ -23,5 +45,31 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """
+    Verify a password and return a new hash if the stored one is outdated.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+# bcrypt is CPU bound, async code runs it on the dedicated password_hasher pool
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    return await password_hasher.run(
+        verify_and_update_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import uuid
+from collections.abc import Callable, Coroutine, Sequence
+from typing import Any, TypeVar
+
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import async_engine, engine_options
+from app.core.pool import InstrumentedAsyncQueuePool, pool_stats
+from app.models import ShardAssignment
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash of a 64 bit `key` into `buckets`: going from n to
+    n + 1 buckets only moves 1 / (n + 1) of the keys, all to the new one.
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+class ShardRouter:
+    """
+    Databases users and their items are split across by owner id, shard 0 is
+    the main database.
+
+    An owner lives on the shard its id hashes to among the first
+    `hash_count`, unless it was assigned to another one by
+    `app.shard_rebalance`. Assignments are stored in shard 0 and reloaded
+    every `refresh_seconds` by a background task. With a single shard there
+    is nothing to route and no task runs.
+    """
+
+    def __init__(
+        self, engines: list[AsyncEngine], *, refresh_seconds: float, hash_count: int
+    ) -> None:
+        self.engines = engines
+        self.refresh_seconds = refresh_seconds
+        self.hash_count = hash_count
+        self.assignments: dict[uuid.UUID, int] = {}
+        self._task: asyncio.Task[None] | None = None
+
+    @classmethod
+    def from_settings(cls) -> "ShardRouter":
+        engines = [
+            async_engine,
+            *(
+                create_async_engine(url, **engine_options(InstrumentedAsyncQueuePool))
+                for url in settings.POSTGRES_SHARD_URLS
+            ),
+        ]
+        return cls(
+            engines,
+            refresh_seconds=settings.POSTGRES_SHARD_ASSIGNMENT_REFRESH_SECONDS,
+            hash_count=settings.POSTGRES_SHARD_HASH_COUNT,
+        )
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def hashed_shard(self, owner_id: uuid.UUID) -> int:
+        return jump_hash(owner_id.int >> 64, self.hash_count)
+
+    def shard_for(self, owner_id: uuid.UUID) -> int:
+        shard = self.assignments.get(owner_id)
+        return shard if shard is not None else self.hashed_shard(owner_id)
+
+    def engine_for(self, owner_id: uuid.UUID) -> AsyncEngine:
+        return self.engines[self.shard_for(owner_id)]
+
+    def session(self, shard: int) -> AsyncSession:
+        # Like the request sessions, objects stay loaded after commit
+        return AsyncSession(self.engines[shard], expire_on_commit=False)
+
+    async def locate(self, statement: Select[Any]) -> int | None:
+        """
+        Return the first shard where `statement` finds a row, querying all of
+        them at once, or None when none does.
+        """
+
+        async def found(session: AsyncSession) -> bool:
+            return (await session.execute(statement.limit(1))).first() is not None
+
+        results = await gather_shards(self.engines, found)
+        return next((shard for shard, hit in enumerate(results) if hit), None)
+
+    async def refresh(self) -> None:
+        async with AsyncSession(self.engines[0]) as session:
+            result = await session.exec(select(ShardAssignment))
+            assignments = {}
+            for assignment in result:
+                if assignment.shard < len(self.engines):
+                    assignments[assignment.owner_id] = assignment.shard
+                else:
+                    logger.warning(
+                        f"Owner {assignment.owner_id} is assigned to shard "
+                        f"{assignment.shard}, which is not configured"
+                    )
+        self.assignments = assignments
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not reload the shard assignments: {e!r}")
+
+    async def start(self) -> None:
+        # The first load is awaited, routing must not start from the hashes
+        if len(self.engines) > 1 and self._task is None:
+            await self.refresh()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Shard 0 is the main engine, disposed by its owner
+        for engine in self.engines[1:]:
+            await engine.dispose()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "assignments": len(self.assignments),
+            "shards": [
+                {"url": str(engine.url), "pool": pool_stats(engine.pool)}
+                for engine in self.engines
+            ],
+        }
+
+
+async def gather_shards(
+    engines: Sequence[AsyncEngine],
+    load: Callable[[AsyncSession], Coroutine[Any, Any, T]],
+) -> list[T]:
+    """
+    Run `load` on every shard at once, each with a session of its own, and
+    return the results in shard order.
+    """
+
+    async def run(engine: AsyncEngine) -> T:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            return await load(session)
+
+    return list(await asyncio.gather(*(run(engine) for engine in engines)))
+
+
+def connect_shards() -> ShardRouter:
+    """
+    A router with engines of its own, for scripts running their own event
+    loop. They dispose of the engines when done.
+    """
+    urls = [str(settings.SQLALCHEMY_DATABASE_URI), *settings.POSTGRES_SHARD_URLS]
+    return ShardRouter(
+        [create_async_engine(url) for url in urls],
+        refresh_seconds=settings.POSTGRES_SHARD_ASSIGNMENT_REFRESH_SECONDS,
+        hash_count=settings.POSTGRES_SHARD_HASH_COUNT,
+    )
+
+
+shards = ShardRouter.from_settings()
@@ -0,0 +1,52 @@
+import asyncio
+import functools
+from collections.abc import Callable, Coroutine
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Share one call between the concurrent callers of the same key: the first
+    caller starts it, the others wait for its result. Nothing is kept once
+    the call completes, this is not a cache.
+
+    The call runs in its own task, so a caller going away does not cancel it
+    for the others. Calls are only shared within a worker process.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, asyncio.Task[Any]] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Coroutine[Any, Any, T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task[Any]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the exception so it is not logged when every caller is gone
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict[str, Any]:
+        requests = self.calls + self.shared
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "shared": self.shared,
+            "coalescing_ratio": self.shared / requests if requests else None,
+        }
+
+
+singleflight = SingleFlight()
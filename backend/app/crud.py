@@ -1,54 +1,96 @@
 import uuid
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.core.cache import invalidate_user
+from app.core.security import (
+    get_password_hash_async,
+    verify_and_update_password_async,
+)
+from app.models import EmailOutbox, Item, ItemCreate, User, UserCreate, UserUpdate
+from app.utils import EmailData
 
 
-def create_user(*, session: Session, user_create: UserCreate) -> User:
-    db_obj = User.model_validate(
-        user_create, update={"hashed_password": get_password_hash(user_create.password)}
-    )
+async def create_user(
+    *, session: AsyncSession, user_create: UserCreate, user_id: uuid.UUID | None = None
+) -> User:
+    hashed_password = await get_password_hash_async(user_create.password)
+    update: dict[str, Any] = {"hashed_password": hashed_password}
+    # Callers that picked the shard of the new user also pick its id
+    if user_id:
+        update["id"] = user_id
+    db_obj = User.model_validate(user_create, update=update)
     session.add(db_obj)
-    session.commit()
-    session.refresh(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
     return db_obj
 
 
-def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
+async def update_user(
+    *, session: AsyncSession, db_user: User, user_in: UserUpdate
+) -> Any:
     user_data = user_in.model_dump(exclude_unset=True)
     extra_data = {}
     if "password" in user_data:
         password = user_data["password"]
-        hashed_password = get_password_hash(password)
+        hashed_password = await get_password_hash_async(password)
         extra_data["hashed_password"] = hashed_password
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await invalidate_user(db_user.id)
+    await session.refresh(db_user)
     return db_user
 
 
-def get_user_by_email(*, session: Session, email: str) -> User | None:
+async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
     statement = select(User).where(User.email == email)
-    session_user = session.exec(statement).first()
+    result = await session.exec(statement)
+    session_user = result.first()
     return session_user
 
 
-def authenticate(*, session: Session, email: str, password: str) -> User | None:
-    db_user = get_user_by_email(session=session, email=email)
+async def authenticate(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await get_user_by_email(session=session, email=email)
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    verified, new_hash = await verify_and_update_password_async(
+        password, db_user.hashed_password
+    )
+    if not verified:
         return None
+    if new_hash:
+        # The stored hash predates the current hashing policy, migrate it
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        await session.commit()
+        await invalidate_user(db_user.id)
     return db_user
 
 
-def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
+async def create_item(
+    *, session: AsyncSession, item_in: ItemCreate, owner_id: uuid.UUID
+) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
-    session.commit()
-    session.refresh(db_item)
+    await session.commit()
+    await session.refresh(db_item)
     return db_item
+
+
+def enqueue_email(
+    *, session: AsyncSession, email_to: str, email_data: EmailData
+) -> EmailOutbox:
+    # Only staged here, the caller's commit writes it together with the change
+    # that triggered the email
+    db_obj = EmailOutbox(
+        email_to=email_to,
+        subject=email_data.subject,
+        html_content=email_data.html_content,
+    )
+    session.add(db_obj)
+    return db_obj
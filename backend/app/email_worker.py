@@ -0,0 +1,125 @@
+import logging
+import signal
+import threading
+from datetime import datetime, timedelta, timezone
+from types import FrameType
+
+from sqlalchemy import Engine
+from sqlmodel import Session, col, create_engine, select
+
+from app.core.config import settings
+from app.core.db import engine, engine_options
+from app.core.pool import InstrumentedQueuePool
+from app.models import EmailOutbox
+from app.utils import send_email
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stored errors are for operators, not a full traceback
+MAX_ERROR_LENGTH = 1000
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Return how long to wait before retrying an email that failed `attempts`
+    times.
+    """
+    seconds = settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.EMAIL_OUTBOX_RETRY_MAX_SECONDS))
+
+
+def deliver_batch(session: Session, *, now: datetime | None = None) -> int:
+    """
+    Send the pending emails that are due and return how many were attempted.
+
+    Rows are claimed with SKIP LOCKED so several workers can drain the outbox
+    without sending an email twice: each claimed row has its attempt counted
+    and is rescheduled, then the claim is committed. No lock or transaction
+    is held while talking to the SMTP server, each result is recorded in a
+    short transaction of its own. Delivery is at least once: a worker dying
+    between a send and its record leaves the row pending, to be sent again
+    when the claim runs out.
+    """
+    now = now or datetime.now(timezone.utc)
+    statement = (
+        select(EmailOutbox)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(col(EmailOutbox.next_attempt_at))
+        .limit(settings.EMAIL_OUTBOX_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    emails = session.exec(statement).all()
+    for email in emails:
+        email.attempts += 1
+        # Not due for the other workers until the claim runs out
+        email.next_attempt_at = now + retry_delay(email.attempts)
+        session.add(email)
+    session.flush()
+    # Detached, so sending reads nothing from the database after the commit
+    for email in emails:
+        session.expunge(email)
+    session.commit()
+
+    for email in emails:
+        try:
+            send_email(
+                email_to=email.email_to,
+                subject=email.subject,
+                html_content=email.html_content,
+            )
+        except Exception as e:
+            email.last_error = repr(e)[:MAX_ERROR_LENGTH]
+            if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                email.status = "dead"
+                logger.error(
+                    f"Giving up on email {email.id} after {email.attempts} attempts: {e!r}"
+                )
+            else:
+                logger.warning(f"Email {email.id} failed, will retry: {e!r}")
+        else:
+            email.status = "sent"
+            email.sent_at = now
+            email.last_error = None
+        session.add(email)
+        session.commit()
+    return len(emails)
+
+
+def run(stop: threading.Event, engines: list[Engine]) -> None:
+    while not stop.is_set():
+        # Emails are queued on the shard of the user they are about
+        attempted = 0
+        for shard_engine in engines:
+            with Session(shard_engine) as session:
+                attempted = max(attempted, deliver_batch(session))
+        # A full batch means there is probably more work waiting
+        if attempted < settings.EMAIL_OUTBOX_BATCH_SIZE:
+            stop.wait(settings.EMAIL_OUTBOX_POLL_SECONDS)
+
+
+def main() -> None:
+    if not settings.emails_enabled:
+        logger.warning("Email is not configured, queued emails will fail")
+    stop = threading.Event()
+
+    def handle_signal(signum: int, _frame: FrameType | None) -> None:
+        logger.info(f"Received signal {signum}, finishing current batch")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    engines = [
+        engine,
+        *(
+            create_engine(url, **engine_options(InstrumentedQueuePool))
+            for url in settings.POSTGRES_SHARD_URLS
+        ),
+    ]
+    logger.info("Email worker started")
+    run(stop, engines)
+    logger.info("Email worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import time
+import uuid
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any, Literal
+
+import psycopg
+from pydantic import ValidationError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core.config import settings
+from app.core.shards import connect_shards
+from app.models import ItemCreate, ItemImportReject, ItemImportReport, User
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ImportFormat = Literal["ndjson", "csv"]
+
+COPY_ITEMS = "COPY item (id, owner_id, title, description) FROM STDIN"
+
+# A record is either the parsed fields or why the line could not be parsed
+Record = tuple[int, dict[str, Any] | str]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, bytes]]:
+    """
+    Split a stream of chunks into numbered lines as the chunks arrive, only
+    holding on to the last incomplete line.
+    """
+    pending = b""
+    line_number = 0
+    async for chunk in chunks:
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            line_number += 1
+            yield line_number, line.rstrip(b"\r")
+    if pending:
+        yield line_number + 1, pending.rstrip(b"\r")
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    async for line_number, line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, "Expected a JSON object"
+            continue
+        yield line_number, record
+
+
+async def iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    header: list[str] | None = None
+    start = 0
+    pending = ""
+    async for line_number, line in iter_lines(chunks):
+        try:
+            text = line.decode()
+        except UnicodeDecodeError as e:
+            yield line_number, f"Invalid UTF-8: {e}"
+            continue
+        if not pending:
+            start = line_number
+        pending = f"{pending}\n{text}" if pending else text
+        # An odd number of quotes means a quoted field continues on the next
+        # line, escaped quotes ("") never change the parity
+        if pending.count('"') % 2:
+            continue
+        (values,) = csv.reader([pending])
+        pending = ""
+        if header is None:
+            header = values
+        elif len(values) != len(header):
+            yield start, f"Expected {len(header)} fields, got {len(values)}"
+        else:
+            # CSV has no null, treat empty fields as missing
+            yield start, {k: v for k, v in zip(header, values, strict=True) if v}
+    if pending:
+        yield start, "Unterminated quoted field"
+
+
+def validate_chunk(
+    records: list[Record],
+) -> tuple[list[ItemCreate], list[ItemImportReject]]:
+    items = []
+    rejects = []
+    for line_number, record in records:
+        if isinstance(record, str):
+            rejects.append(ItemImportReject(line=line_number, errors=[record]))
+            continue
+        try:
+            items.append(ItemCreate.model_validate(record))
+        except ValidationError as e:
+            errors = [
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            ]
+            rejects.append(ItemImportReject(line=line_number, errors=errors))
+    return items, rejects
+
+
+async def import_items(
+    session: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    *,
+    owner_id: uuid.UUID,
+    import_format: ImportFormat,
+) -> ItemImportReport:
+    """
+    Load the items of an NDJSON or CSV upload for `owner_id`.
+
+    The upload is parsed as it streams in and validated in chunks of
+    `settings.IMPORT_CHUNK_SIZE` rows, valid rows are written with a single
+    COPY and committed together. Invalid rows are skipped and reported.
+    """
+    start = time.perf_counter()
+    records = iter_csv(chunks) if import_format == "csv" else iter_ndjson(chunks)
+    imported = 0
+    rejected = 0
+    rejects: list[ItemImportReject] = []
+
+    # COPY is not exposed by SQLAlchemy, use the psycopg connection of the
+    # session's transaction directly
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection: psycopg.AsyncConnection[Any]
+    driver_connection = raw_connection.driver_connection  # type: ignore[assignment]
+    async with (
+        driver_connection.cursor() as cursor,
+        cursor.copy(COPY_ITEMS) as copy,
+    ):
+
+        async def flush(chunk: list[Record]) -> None:
+            nonlocal imported, rejected
+            items, chunk_rejects = validate_chunk(chunk)
+            for item in items:
+                await copy.write_row(
+                    (uuid.uuid4(), owner_id, item.title, item.description)
+                )
+            imported += len(items)
+            rejected += len(chunk_rejects)
+            rejects.extend(chunk_rejects[: settings.IMPORT_MAX_REJECTS - len(rejects)])
+
+        chunk: list[Record] = []
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= settings.IMPORT_CHUNK_SIZE:
+                await flush(chunk)
+                chunk = []
+        await flush(chunk)
+    await session.commit()
+
+    elapsed = time.perf_counter() - start
+    return ItemImportReport(
+        imported=imported,
+        rejected=rejected,
+        rejects=rejects,
+        elapsed_seconds=elapsed,
+        rows_per_second=imported / elapsed if elapsed else 0.0,
+    )
+
+
+async def read_file(path: Path, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with path.open("rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+async def run(
+    path: Path, *, owner_email: str, import_format: ImportFormat
+) -> ItemImportReport:
+    # Fresh engines, this runs on its own event loop
+    router = connect_shards()
+    try:
+        # The items go to the shard of their owner
+        shard = await router.locate(select(User.id).where(User.email == owner_email))
+        if shard is None:
+            raise SystemExit(f"No user with email {owner_email}")
+        async with router.session(shard) as session:
+            owner = await crud.get_user_by_email(session=session, email=owner_email)
+            assert owner
+            return await import_items(
+                session, read_file(path), owner_id=owner.id, import_format=import_format
+            )
+    finally:
+        for engine in router.engines:
+            await engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Import items from an NDJSON or CSV file."
+    )
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--owner-email", required=True)
+    parser.add_argument(
+        "--format",
+        choices=["ndjson", "csv"],
+        help="defaults to csv for .csv files and ndjson otherwise",
+    )
+    args = parser.parse_args(argv)
+    import_format: ImportFormat = args.format or (
+        "csv" if args.path.suffix == ".csv" else "ndjson"
+    )
+
+    report = asyncio.run(
+        run(args.path, owner_email=args.owner_email, import_format=import_format)
+    )
+    for reject in report.rejects:
+        logger.warning(f"Line {reject.line} rejected: {'; '.join(reject.errors)}")
+    logger.info(
+        f"Imported {report.imported} items, rejected {report.rejected}, "
+        f"in {report.elapsed_seconds:.2f}s ({report.rows_per_second:.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,22 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.db import async_engine
+from app.core.executor import ExecutorBusyError
+from app.core.replicas import ReadAfterWriteMiddleware, replicas
+from app.core.responses import get_default_response_class
+from app.core.security import password_hasher
+from app.core.shards import shards
+from app.utils import warm_email_templates
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,10 +26,47 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    # Keep template compilation out of the first password recovery request
+    warm_email_templates()
+    replicas.start()
+    await shards.start()
+    yield
+    # Pooled connections belong to this event loop, close them with it
+    await replicas.stop()
+    await shards.stop()
+    await async_engine.dispose()
+    password_hasher.shutdown()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
+    lifespan=lifespan,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    default_response_class=get_default_response_class(),
+)
+
+
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(
+    _request: Request, exc: ExecutorBusyError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+app.add_middleware(ReadAfterWriteMiddleware)
+# Added before CORS, which then wraps the cached static responses too
+app.add_middleware(
+    CompressionMiddleware,
+    # The schema and docs pages only change with the code
+    static_paths=[url for url in (app.openapi_url, app.docs_url, app.redoc_url) if url],
 )
 
 # Set all CORS enabled origins
@@ -1,7 +1,10 @@
 import uuid
+from datetime import datetime, timezone
+from typing import Any
 
 from pydantic import EmailStr
-from sqlmodel import Field, Relationship, SQLModel
+from sqlalchemy import Connection, Table, event
+from sqlmodel import DateTime, Field, Index, Relationship, SQLModel, text
 
 
 # Shared properties
@@ -39,10 +42,20 @@ class UpdatePassword(SQLModel):
     new_password: str = Field(min_length=8, max_length=128)
 
 
+# Row version counter for ETags, every UPDATE issued through SQLAlchemy bumps
+# it in the database, rows inserted outside the ORM (COPY) start at 1
+def _version_field() -> Any:
+    return Field(
+        default=1,
+        sa_column_kwargs={"server_default": "1", "onupdate": text("version + 1")},
+    )
+
+
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
+    version: int = _version_field()
     items: list["Item"] = Relationship(back_populates="owner", cascade_delete=True)
 
 
@@ -53,7 +66,10 @@ class UserPublic(UserBase):
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    # None when the count was skipped, see app.api.pagination.CountMode
+    count: int | None
+    count_estimated: bool = False
+    next_cursor: str | None = None
 
 
 # Shared properties
@@ -72,13 +88,47 @@ class ItemUpdate(ItemBase):
     title: str | None = Field(default=None, min_length=1, max_length=255)  # type: ignore
 
 
+# Element of a batch update, identifies the item to update
+class ItemBatchUpdate(ItemUpdate):
+    id: uuid.UUID
+
+
+# Number of hash partitions of the item table
+ITEM_PARTITIONS = 16
+
+
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    # Keyset pagination walks items in (owner_id, id) order. The table is
+    # hash partitioned by owner, queries naming the owner read one partition
+    __table_args__ = (
+        Index("ix_item_owner_id_id", "owner_id", "id"),
+        {"postgresql_partition_by": "HASH (owner_id)"},
+    )
+    # The primary key has to include the partition key, items are still
+    # identified by id alone. No constraint keeps id unique by itself, ids
+    # are only generated here, never taken from requests. Flushes name both
+    # columns, and the new version is read back with RETURNING
+    __mapper_args__ = {"primary_key": ["id"], "eager_defaults": True}
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     owner_id: uuid.UUID = Field(
-        foreign_key="user.id", nullable=False, ondelete="CASCADE"
+        foreign_key="user.id", primary_key=True, ondelete="CASCADE"
     )
     owner: User | None = Relationship(back_populates="items")
+    version: int = _version_field()
+
+
+# Migrations create the partitions themselves, these are for create_all
+@event.listens_for(Item.__table__, "after_create")  # type: ignore[attr-defined]
+def _create_item_partitions(_table: Table, connection: Connection, **_kw: Any) -> None:
+    for remainder in range(ITEM_PARTITIONS):
+        connection.execute(
+            text(
+                f"CREATE TABLE item_p{remainder} PARTITION OF item FOR VALUES "
+                f"WITH (MODULUS {ITEM_PARTITIONS}, REMAINDER {remainder})"
+            )
+        )
 
 
 # Properties to return via API, id is always required
@@ -89,7 +139,95 @@ class ItemPublic(ItemBase):
 
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
-    count: int
+    # None when the count was skipped, see app.api.pagination.CountMode
+    count: int | None
+    count_estimated: bool = False
+    next_cursor: str | None = None
+
+
+# Outcome of one element of a batch request, `status` is the HTTP status the
+# single item endpoint would have answered with
+class ItemBatchResult(SQLModel):
+    id: uuid.UUID
+    status: int
+    detail: str | None = None
+    item: ItemPublic | None = None
+
+
+class ItemBatchResults(SQLModel):
+    data: list[ItemBatchResult]
+
+
+# Row of an import that failed validation, `line` is 1-based in the upload
+class ItemImportReject(SQLModel):
+    line: int
+    errors: list[str]
+
+
+class ItemImportReport(SQLModel):
+    imported: int
+    rejected: int
+    # Only the first IMPORT_MAX_REJECTS rejects are listed
+    rejects: list[ItemImportReject]
+    elapsed_seconds: float
+    rows_per_second: float
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# Emails waiting for delivery, written in the same transaction as the change
+# that triggers them and sent by app.email_worker
+class EmailOutbox(SQLModel, table=True):
+    __tablename__ = "email_outbox"
+    # The worker only ever scans pending rows that are due
+    __table_args__ = (
+        Index(
+            "ix_email_outbox_pending_next_attempt_at",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str
+    html_content: str
+    # One of "pending", "sent" or "dead" (retries exhausted)
+    status: str = Field(default="pending", max_length=16)
+    attempts: int = 0
+    last_error: str | None = None
+    created_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    next_attempt_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    sent_at: datetime | None = Field(
+        default=None,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+
+
+# Owners kept on another shard than the one their id hashes to, only stored
+# in shard 0, see app.core.shards
+class ShardAssignment(SQLModel, table=True):
+    __tablename__ = "shard_assignment"
+
+    owner_id: uuid.UUID = Field(primary_key=True)
+    shard: int
+
+
+# The owner of every email, only stored in shard 0 where it keeps emails
+# unique across the shards, see app.api.deps.claim_email
+class UserEmail(SQLModel, table=True):
+    __tablename__ = "user_email"
+
+    email: str = Field(primary_key=True, max_length=255)
+    owner_id: uuid.UUID
 
 
 # Generic message
@@ -108,6 +246,13 @@ class TokenPayload(SQLModel):
     sub: str | None = None
 
 
+# What authorization needs of the requesting user, kept in the user cache
+class AuthUser(SQLModel):
+    id: uuid.UUID
+    is_active: bool
+    is_superuser: bool
+
+
 class NewPassword(SQLModel):
     token: str
     new_password: str = Field(min_length=8, max_length=128)
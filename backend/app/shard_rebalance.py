@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import logging
+import uuid
+from collections.abc import Sequence
+from typing import Any
+
+from sqlalchemy import Insert, Table, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.shards import ShardRouter, connect_shards, jump_hash
+from app.models import Item, ShardAssignment, User
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+user_table: Table = User.__table__  # type: ignore[attr-defined]
+item_table: Table = Item.__table__  # type: ignore[attr-defined]
+
+
+def upsert(table: Table, rows: Sequence[Any]) -> Insert:
+    # Rows already on the target keep their changes if they are newer
+    statement = insert(table).values([dict(row) for row in rows])
+    return statement.on_conflict_do_update(
+        index_elements=list(table.primary_key),
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in table.columns
+            if not column.primary_key
+        },
+        where=table.c.version < statement.excluded.version,
+    )
+
+
+async def copy_owner(
+    source: AsyncEngine, target: AsyncEngine, owner_id: uuid.UUID, *, chunk_size: int
+) -> set[uuid.UUID]:
+    """
+    Copy the user `owner_id` and their items from `source` to `target` and
+    return the ids of the items copied. The rows are read from one snapshot
+    and written in a single transaction.
+    """
+    async with source.connect() as connection:
+        snapshot = await connection.execution_options(isolation_level="REPEATABLE READ")
+        result = await snapshot.execute(
+            select(user_table).where(user_table.c.id == owner_id)
+        )
+        user = result.mappings().one_or_none()
+        if user is None:
+            raise SystemExit(f"No user {owner_id} on the source shard")
+        copied: set[uuid.UUID] = set()
+        async with target.begin() as destination:
+            await destination.execute(upsert(user_table, [user]))
+            items = await snapshot.stream(
+                select(item_table)
+                .where(item_table.c.owner_id == owner_id)
+                .execution_options(yield_per=chunk_size)
+            )
+            async for rows in items.mappings().partitions():
+                await destination.execute(upsert(item_table, rows))
+                copied.update(row["id"] for row in rows)
+    return copied
+
+
+async def copy_changes(
+    source: AsyncEngine,
+    target: AsyncEngine,
+    owner_id: uuid.UUID,
+    copied: set[uuid.UUID],
+    *,
+    chunk_size: int,
+) -> set[uuid.UUID]:
+    """
+    Copy the writes made on `source` since the items `copied` were copied,
+    then delete the user `owner_id` and their items from `source`. Return
+    the ids of the items of `copied` deleted on either shard in between.
+
+    The user row is locked first, so new items wait for it, and the items
+    are locked as they are read, so a request still routed to `source`
+    can't write to them until they are gone. Items of `copied` missing on
+    `target`, or all of them if the user is, were deleted there and are not
+    copied again.
+    """
+    async with source.begin() as connection:
+        result = await connection.execute(
+            select(user_table).where(user_table.c.id == owner_id).with_for_update()
+        )
+        user = result.mappings().one()
+        remaining: set[uuid.UUID] = set()
+        async with target.begin() as destination:
+            # Locked too, a delete on `target` waits for the copy and wins
+            result = await destination.execute(
+                select(user_table.c.id)
+                .where(user_table.c.id == owner_id)
+                .with_for_update()
+            )
+            # Deleted there, nothing is copied again
+            moved = result.first() is not None
+            present = set(
+                await destination.scalars(
+                    select(item_table.c.id)
+                    .where(item_table.c.owner_id == owner_id)
+                    .with_for_update()
+                )
+            )
+            if moved:
+                await destination.execute(upsert(user_table, [user]))
+            items = await connection.stream(
+                select(item_table)
+                .where(item_table.c.owner_id == owner_id)
+                .with_for_update()
+                .execution_options(yield_per=chunk_size)
+            )
+            async for rows in items.mappings().partitions():
+                remaining.update(row["id"] for row in rows)
+                rows = [
+                    row
+                    for row in rows
+                    if row["id"] in present or row["id"] not in copied
+                ]
+                if moved and rows:
+                    await destination.execute(upsert(item_table, rows))
+            await destination.execute(
+                delete(item_table).where(item_table.c.id.in_(copied - remaining))
+            )
+        # The items go with the user
+        await connection.execute(delete(user_table).where(user_table.c.id == owner_id))
+    return copied - (present & remaining)
+
+
+async def assign(router: ShardRouter, owner_id: uuid.UUID, shard: int) -> None:
+    async with router.engines[0].begin() as connection:
+        if shard == router.hashed_shard(owner_id):
+            await connection.execute(
+                delete(ShardAssignment).where(ShardAssignment.owner_id == owner_id)  # type: ignore[arg-type]
+            )
+            return
+        statement = insert(ShardAssignment).values(owner_id=owner_id, shard=shard)
+        await connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=["owner_id"], set_={"shard": statement.excluded.shard}
+            )
+        )
+
+
+async def rebalance(
+    router: ShardRouter, owner_id: uuid.UUID, shard: int, *, chunk_size: int
+) -> None:
+    """
+    Move the user `owner_id` and their items to `shard`.
+
+    The rows are copied while the user keeps writing to the source, then the
+    assignment is switched. Once every worker has reloaded it, the writes
+    made to the source in between are copied with `copy_changes`, which
+    fences the user on the source until they are deleted from it.
+    """
+    await router.refresh()
+    current = router.shard_for(owner_id)
+    if current == shard:
+        logger.info(f"User {owner_id} is already on shard {shard}")
+        return
+    source, target = router.engines[current], router.engines[shard]
+    copied = await copy_owner(source, target, owner_id, chunk_size=chunk_size)
+    logger.info(f"Copied {len(copied)} items from shard {current} to shard {shard}")
+    await assign(router, owner_id, shard)
+    # Requests routed with the previous assignment may still be running
+    await asyncio.sleep(2 * router.refresh_seconds)
+    deleted = await copy_changes(
+        source, target, owner_id, copied, chunk_size=chunk_size
+    )
+    logger.info(
+        f"Moved user {owner_id} from shard {current} to shard {shard}, "
+        f"{len(deleted)} items deleted during the move"
+    )
+
+
+async def pin_owners(router: ShardRouter, hash_count: int, *, chunk_size: int) -> int:
+    """
+    Assign every user that `hash_count` would hash to another shard than the
+    one they are on to that shard, and return how many were assigned.
+
+    Run before POSTGRES_SHARD_HASH_COUNT is changed to `hash_count`, and
+    once more after every worker uses it, for the users who signed up in
+    between. Owners already assigned keep their assignment.
+    """
+    pinned = 0
+    for shard, engine in enumerate(router.engines):
+        async with engine.connect() as connection:
+            result = await connection.stream(
+                select(user_table.c.id).execution_options(yield_per=chunk_size)
+            )
+            async for ids in result.scalars().partitions():
+                rows = [
+                    {"owner_id": id, "shard": shard}
+                    for id in ids
+                    if jump_hash(id.int >> 64, hash_count) != shard
+                ]
+                if not rows:
+                    continue
+                async with router.engines[0].begin() as main:
+                    await main.execute(
+                        insert(ShardAssignment).values(rows).on_conflict_do_nothing()
+                    )
+                pinned += len(rows)
+    logger.info(f"Pinned {pinned} users for a hash count of {hash_count}")
+    return pinned
+
+
+async def run(owner_id: uuid.UUID, shard: int, *, chunk_size: int) -> None:
+    # Fresh engines, this runs on its own event loop
+    router = connect_shards()
+    try:
+        if not 0 <= shard < len(router):
+            raise SystemExit(f"Shard {shard} is not configured")
+        await rebalance(router, owner_id, shard, chunk_size=chunk_size)
+    finally:
+        for engine in router.engines:
+            await engine.dispose()
+
+
+async def run_pin(hash_count: int, *, chunk_size: int) -> None:
+    router = connect_shards()
+    try:
+        if not 1 <= hash_count <= len(router):
+            raise SystemExit(f"Only {len(router)} shards are configured")
+        await pin_owners(router, hash_count, chunk_size=chunk_size)
+    finally:
+        for engine in router.engines:
+            await engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Place users on the shards.")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser(
+        "move", help="Move a user and their items to another shard."
+    )
+    move.add_argument("owner_id", type=uuid.UUID)
+    move.add_argument("shard", type=int)
+    pin = commands.add_parser(
+        "pin",
+        help="Assign the users a new POSTGRES_SHARD_HASH_COUNT would move "
+        "to the shard they are on.",
+    )
+    pin.add_argument("hash_count", type=int)
+    args = parser.parse_args(argv)
+    if args.command == "move":
+        asyncio.run(run(args.owner_id, args.shard, chunk_size=args.chunk_size))
+    else:
+        asyncio.run(run_pin(args.hash_count, chunk_size=args.chunk_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ from typing import Any
 
 import emails  # type: ignore
 import jwt
-from jinja2 import Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from jwt.exceptions import InvalidTokenError
 
 from app.core import security
@@ -16,17 +16,41 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class EmailDeliveryError(Exception):
+    pass
+
+
 @dataclass
 class EmailData:
     html_content: str
     subject: str
 
 
+EMAIL_TEMPLATES_DIR = Path(__file__).parent / "email-templates" / "build"
+
+# Templates are compiled once per process and kept by the environment. The
+# built templates only change on deploy, so skip the per-render mtime check.
+email_templates = Environment(
+    loader=FileSystemLoader(EMAIL_TEMPLATES_DIR),
+    auto_reload=False,
+    bytecode_cache=(
+        FileSystemBytecodeCache(settings.EMAIL_TEMPLATES_BYTECODE_CACHE_DIR)
+        if settings.EMAIL_TEMPLATES_BYTECODE_CACHE_DIR
+        else None
+    ),
+)
+
+
+def warm_email_templates() -> None:
+    """
+    Compile every email template now instead of on the first email sent.
+    """
+    for template_name in email_templates.list_templates(extensions=["html"]):
+        email_templates.get_template(template_name)
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
+    html_content = email_templates.get_template(template_name).render(context)
     return html_content
 
 
@@ -53,6 +77,8 @@ def send_email(
         smtp_options["password"] = settings.SMTP_PASSWORD
     response = message.send(to=email_to, smtp=smtp_options)
     logger.info(f"send email result: {response}")
+    if not response.success:
+        raise EmailDeliveryError(f"SMTP delivery failed: {response!r}")
 
 
 def generate_test_email(email_to: str) -> EmailData:
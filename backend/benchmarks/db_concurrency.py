@@ -0,0 +1,113 @@
+"""
+Compare throughput of the blocking and the asyncio database stacks.
+
+Emulates how FastAPI runs routes: a sync route takes a slot in the anyio
+threadpool (40 threads by default) and uses the blocking engine, an async
+route runs on the event loop with the async engine. Every simulated request
+loads a user by primary key, like `get_current_user` does.
+
+Run from the backend directory against a database with initial data:
+
+    python -m benchmarks.db_concurrency --concurrency 500 --requests 20000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import User
+
+
+async def drive(
+    handle: Callable[[], Awaitable[None]], *, concurrency: int, requests: int
+) -> tuple[float, list[float]]:
+    latencies: list[float] = []
+    remaining = requests
+
+    async def client() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await handle()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+def report(name: str, elapsed: float, latencies: list[float]) -> None:
+    cuts = statistics.quantiles(latencies, n=100)
+    print(  # noqa: T201
+        f"{name:>6}: {len(latencies) / elapsed:8.0f} req/s"
+        f"  p50 {cuts[49] * 1000:7.1f} ms"
+        f"  p95 {cuts[94] * 1000:7.1f} ms"
+        f"  p99 {cuts[98] * 1000:7.1f} ms"
+    )
+
+
+async def bench_sync(user_id: uuid.UUID, args: argparse.Namespace) -> None:
+    engine = create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        pool_size=args.pool_size,
+        max_overflow=args.max_overflow,
+    )
+
+    def load_user() -> None:
+        with Session(engine) as session:
+            session.get(User, user_id)
+
+    async def handle() -> None:
+        await run_in_threadpool(load_user)
+
+    elapsed, latencies = await drive(
+        handle, concurrency=args.concurrency, requests=args.requests
+    )
+    report("sync", elapsed, latencies)
+    engine.dispose()
+
+
+async def bench_async(user_id: uuid.UUID, args: argparse.Namespace) -> None:
+    engine: AsyncEngine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        pool_size=args.pool_size,
+        max_overflow=args.max_overflow,
+    )
+
+    async def handle() -> None:
+        async with AsyncSession(engine) as session:
+            await session.get(User, user_id)
+
+    elapsed, latencies = await drive(
+        handle, concurrency=args.concurrency, requests=args.requests
+    )
+    report("async", elapsed, latencies)
+    await engine.dispose()
+
+
+async def main(args: argparse.Namespace) -> None:
+    with Session(create_engine(str(settings.SQLALCHEMY_DATABASE_URI))) as session:
+        user_id = session.exec(select(User.id).limit(1)).first()
+    if user_id is None:
+        raise SystemExit("No users found, run `python app/initial_data.py` first")
+    await bench_sync(user_id, args)
+    await bench_async(user_id, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--pool-size", type=int, default=20)
+    parser.add_argument("--max-overflow", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,212 @@
+"""
+Compare the item table before and after hash partitioning by owner_id.
+
+Both layouts are built side by side in scratch tables filled with the same
+rows, so the comparison does not depend on the migration state:
+
+- plain: one heap, primary key (id) and the (owner_id, id) index
+- hash: the partitions of migration 6b2e9d4f8a1c, primary key (id, owner_id)
+
+Every simulated request runs one of the queries of `app.api.routes.items`:
+a first page and the count of one owner's items, a lookup by id and owner
+like `read_item` does for regular users, and a lookup by id alone like it
+does for superusers. The partitions a query reads are counted from its
+plan. The size of the largest relation and the time to vacuum it stand for
+the maintenance cost, which partitions split into smaller runs.
+
+Run from the backend directory:
+
+    python -m benchmarks.item_partitions --rows 1000000 --owners 1000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from typing import Any
+
+import psycopg
+from psycopg import sql
+
+from app.core.config import settings
+from benchmarks.db_concurrency import drive, report
+
+PARTITIONS = 16
+
+COLUMNS = sql.SQL("""
+    title VARCHAR(255) NOT NULL,
+    description VARCHAR(255),
+    id UUID NOT NULL,
+    owner_id UUID NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+""")
+
+QUERIES = {
+    "page": sql.SQL(
+        "SELECT id, owner_id, title, description FROM {table} "
+        "WHERE owner_id = %(owner_id)s ORDER BY owner_id, id LIMIT 100"
+    ),
+    "count": sql.SQL("SELECT count(*) FROM {table} WHERE owner_id = %(owner_id)s"),
+    "get": sql.SQL(
+        "SELECT * FROM {table} WHERE id = %(id)s AND owner_id = %(owner_id)s"
+    ),
+    "get_id": sql.SQL("SELECT * FROM {table} WHERE id = %(id)s"),
+}
+
+
+def connection_url() -> str:
+    return str(settings.SQLALCHEMY_DATABASE_URI).replace("+psycopg", "")
+
+
+def create_tables(connection: psycopg.Connection, rows: int, owners: int) -> None:
+    connection.execute(
+        sql.SQL("CREATE TABLE bench_item_plain ({}, PRIMARY KEY (id))").format(COLUMNS)
+    )
+    connection.execute(
+        sql.SQL(
+            "CREATE TABLE bench_item_hash ({}, PRIMARY KEY (id, owner_id)) "
+            "PARTITION BY HASH (owner_id)"
+        ).format(COLUMNS)
+    )
+    for remainder in range(PARTITIONS):
+        connection.execute(
+            sql.SQL(
+                "CREATE TABLE {} PARTITION OF bench_item_hash "
+                "FOR VALUES WITH (MODULUS {}, REMAINDER {})"
+            ).format(
+                sql.Identifier(f"bench_item_hash_p{remainder}"),
+                sql.Literal(PARTITIONS),
+                sql.Literal(remainder),
+            )
+        )
+    owner_ids = [uuid.uuid4() for _ in range(owners)]
+    with connection.cursor().copy(
+        "COPY bench_item_plain (id, owner_id, title) FROM STDIN"
+    ) as copy:
+        for row in range(rows):
+            copy.write_row((uuid.uuid4(), random.choice(owner_ids), f"Item {row}"))
+    connection.execute("INSERT INTO bench_item_hash SELECT * FROM bench_item_plain")
+    for table in (
+        sql.Identifier("bench_item_plain"),
+        sql.Identifier("bench_item_hash"),
+    ):
+        connection.execute(sql.SQL("CREATE INDEX ON {} (owner_id, id)").format(table))
+        connection.execute(sql.SQL("VACUUM ANALYZE {}").format(table))
+
+
+def partitions_read(
+    connection: psycopg.Connection, query: sql.Composable, params: dict[str, Any]
+) -> int:
+    row = connection.execute(
+        sql.SQL("EXPLAIN (ANALYZE, FORMAT JSON) {}").format(query), params
+    ).fetchone()
+    assert row
+    plan = row[0][0]["Plan"]
+    relations = set()
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        # Pruned at execution time, the node is in the plan but never ran
+        if "Relation Name" in node and node.get("Actual Loops", 0) > 0:
+            relations.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return len(relations)
+
+
+def largest_relation(connection: psycopg.Connection, table: str) -> tuple[str, int]:
+    row = connection.execute(
+        "SELECT relid::regclass::text, pg_total_relation_size(relid) "
+        "FROM pg_partition_tree(%s) WHERE isleaf ORDER BY 2 DESC LIMIT 1",
+        (table,),
+    ).fetchone()
+    if row is None:
+        # Not partitioned
+        row = connection.execute(
+            "SELECT %s, pg_total_relation_size(%s::regclass)", (table, table)
+        ).fetchone()
+        assert row
+    return row[0], row[1]
+
+
+def maintenance(connection: psycopg.Connection, name: str, table: str) -> None:
+    relation, size = largest_relation(connection, table)
+    # Every row updated once, like autovacuum would find after a busy period
+    connection.execute(
+        sql.SQL("UPDATE {} SET version = version + 1").format(sql.Identifier(relation))
+    )
+    start = time.perf_counter()
+    connection.execute(sql.SQL("VACUUM {}").format(sql.Identifier(relation)))
+    elapsed = time.perf_counter() - start
+    print(  # noqa: T201
+        f"{name:>6}: largest relation {size / 1024**2:7.1f} MiB,"
+        f" vacuumed in {elapsed * 1000:7.1f} ms"
+    )
+
+
+async def bench(
+    layouts: list[tuple[str, str]],
+    samples: list[tuple[uuid.UUID, uuid.UUID]],
+    args: argparse.Namespace,
+) -> None:
+    idle = [
+        await psycopg.AsyncConnection.connect(connection_url(), autocommit=True)
+        for _ in range(args.concurrency)
+    ]
+    for query_name, query in QUERIES.items():
+        print(f"{query_name}:")  # noqa: T201
+        for name, table in layouts:
+            statement = query.format(table=sql.Identifier(table))
+
+            async def handle(statement: sql.Composed = statement) -> None:
+                item_id, owner_id = random.choice(samples)
+                connection = idle.pop()
+                params = {"id": item_id, "owner_id": owner_id}
+                await connection.execute(statement, params)
+                idle.append(connection)
+
+            elapsed, latencies = await drive(
+                handle, concurrency=args.concurrency, requests=args.requests
+            )
+            report(name, elapsed, latencies)
+    for connection in idle:
+        await connection.close()
+
+
+def main(args: argparse.Namespace) -> None:
+    with psycopg.connect(connection_url(), autocommit=True) as connection:
+        connection.execute("DROP TABLE IF EXISTS bench_item_plain, bench_item_hash")
+        create_tables(connection, args.rows, args.owners)
+        try:
+            samples = connection.execute(
+                "SELECT id, owner_id FROM bench_item_plain "
+                "TABLESAMPLE SYSTEM (1) LIMIT 10000"
+            ).fetchall()
+            layouts = [("plain", "bench_item_plain"), ("hash", "bench_item_hash")]
+            asyncio.run(bench(layouts, samples, args))
+            item_id, owner_id = samples[0]
+            for query_name, query in QUERIES.items():
+                counts = [
+                    partitions_read(
+                        connection,
+                        query.format(table=sql.Identifier(table)),
+                        {"id": item_id, "owner_id": owner_id},
+                    )
+                    for _, table in layouts
+                ]
+                print(  # noqa: T201
+                    f"{query_name:>6}: relations read plain {counts[0]}, hash {counts[1]}"
+                )
+            for name, table in layouts:
+                maintenance(connection, name, table)
+        finally:
+            connection.execute("DROP TABLE bench_item_plain, bench_item_hash")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--owners", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=20_000)
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+"""
+Compare the session modes of POSTGRES_SAFE_METHOD_SESSION for GET requests.
+
+Every simulated request opens a session, loads a user and one of their items
+by primary key, like `read_item` does on a cache miss, and closes it. The
+round trips of one request are counted from the libpq protocol trace, one
+per ReadyForQuery the server sends back; throughput is measured against the
+same pool for each mode:
+
+- transaction: BEGIN, the queries, ROLLBACK when the session closes
+- read_only: the same round trips, the server refuses writes
+- autocommit: the queries alone
+
+Run from the backend directory against a database with initial data:
+
+    python -m benchmarks.read_session --concurrency 50 --requests 20000
+"""
+
+import argparse
+import asyncio
+import tempfile
+import uuid
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import SAFE_METHOD_SESSION_OPTIONS
+from app.models import Item, User
+from benchmarks.db_concurrency import drive, report
+
+
+async def handle(bind: AsyncEngine, user_id: uuid.UUID, item_id: uuid.UUID) -> None:
+    async with AsyncSession(bind) as session:
+        await session.get(User, user_id)
+        await session.get(Item, item_id)
+
+
+async def count_round_trips(
+    engine: AsyncEngine, bind: AsyncEngine, user_id: uuid.UUID, item_id: uuid.UUID
+) -> int:
+    with tempfile.TemporaryFile("w+") as trace:
+
+        def start_trace(dbapi_connection: Any, _record: Any) -> None:
+            dbapi_connection.driver_connection.pgconn.trace(trace.fileno())
+
+        # A connection of its own, only traced while the request runs
+        await engine.dispose()
+        event.listen(engine.sync_engine, "connect", start_trace)
+        async with engine.connect():
+            pass
+        trace.seek(0)
+        connect_messages = trace.read().count("ReadyForQuery")
+        await handle(bind, user_id, item_id)
+        event.remove(engine.sync_engine, "connect", start_trace)
+        await engine.dispose()
+        trace.seek(0)
+        return trace.read().count("ReadyForQuery") - connect_messages
+
+
+async def bench(
+    mode: str, user_id: uuid.UUID, item_id: uuid.UUID, args: argparse.Namespace
+) -> None:
+    engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), pool_size=args.pool_size
+    )
+    bind = engine.execution_options(**SAFE_METHOD_SESSION_OPTIONS[mode])
+    round_trips = await count_round_trips(engine, bind, user_id, item_id)
+
+    async def run() -> None:
+        await handle(bind, user_id, item_id)
+
+    elapsed, latencies = await drive(
+        run, concurrency=args.concurrency, requests=args.requests
+    )
+    report(mode, elapsed, latencies)
+    print(f"{mode}: {round_trips} round trips per request")  # noqa: T201
+    await engine.dispose()
+
+
+async def main(args: argparse.Namespace) -> None:
+    with Session(create_engine(str(settings.SQLALCHEMY_DATABASE_URI))) as session:
+        row = session.exec(select(Item.owner_id, Item.id).limit(1)).first()
+    if row is None:
+        raise SystemExit("No items found, create one first")
+    for mode in SAFE_METHOD_SESSION_OPTIONS:
+        await bench(mode, *row, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--pool-size", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,110 @@
+"""
+Compare the JSON response classes selectable with JSON_RESPONSE_CLASS on list
+payloads of growing size.
+
+Each render starts from what FastAPI hands to the response class: the
+response model dumped in JSON mode. The time of that dump is shown too, it is
+the same whatever the response class.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization --sizes 10 100 1000 10000
+"""
+
+import argparse
+import functools
+import importlib
+import time
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlmodel import SQLModel
+
+from app.core.responses import MsgspecJSONResponse
+from app.models import ItemPublic, ItemsPublic, UserPublic, UsersPublic
+
+
+def make_items(size: int) -> ItemsPublic:
+    owner_id = uuid.uuid4()
+    return ItemsPublic(
+        data=[
+            ItemPublic(
+                id=uuid.uuid4(),
+                owner_id=owner_id,
+                title=f"Item {i}",
+                description="A description of reasonable length",
+            )
+            for i in range(size)
+        ],
+        count=size,
+    )
+
+
+def make_users(size: int) -> UsersPublic:
+    return UsersPublic(
+        data=[
+            UserPublic(id=uuid.uuid4(), email=f"user{i}@example.com", full_name="Name")
+            for i in range(size)
+        ],
+        count=size,
+    )
+
+
+def per_call(func: Callable[[], Any], min_seconds: float = 0.2) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_seconds:
+        func()
+        calls += 1
+    return elapsed / calls
+
+
+def available_classes() -> dict[str, type[JSONResponse]]:
+    classes: dict[str, type[JSONResponse]] = {"json": JSONResponse}
+    for name, response_class in (
+        ("orjson", ORJSONResponse),
+        ("msgspec", MsgspecJSONResponse),
+    ):
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            print(f"{name} is not installed, skipping it")  # noqa: T201
+            continue
+        classes[name] = response_class
+    return classes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+    classes = available_classes()
+
+    builders: dict[str, Callable[[int], SQLModel]] = {
+        "items": make_items,
+        "users": make_users,
+    }
+    for payload, build in builders.items():
+        for size in args.sizes:
+            model = build(size)
+            content = model.model_dump(mode="json")
+            dump = per_call(functools.partial(model.model_dump, mode="json"))
+            # The body is rendered when the response is created
+            timings = {
+                name: per_call(functools.partial(response_class, content))
+                for name, response_class in classes.items()
+            }
+            base = timings["json"]
+            renders = "  ".join(
+                f"{name} {t * 1e6:9.1f} us ({base / t:4.1f}x)"
+                for name, t in timings.items()
+            )
+            print(  # noqa: T201
+                f"{payload:>5} {size:>6}: dump {dump * 1e6:9.1f} us  {renders}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ set -x
 # Let the DB start
 python app/backend_pre_start.py
 
-# Run migrations
+# Run migrations, on the main database and every shard
 alembic upgrade head
 
 # Create initial data in DB
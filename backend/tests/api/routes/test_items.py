@@ -1,10 +1,25 @@
+import csv
+import io
+import json
 import uuid
+from typing import Any
+from unittest.mock import patch
 
+import msgpack  # type: ignore[import-untyped]
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.core.cache import response_cache
 from app.core.config import settings
+from app.core.singleflight import singleflight
+from app.models import Item
 from tests.utils.item import create_random_item
+from tests.utils.user import create_random_user
+from tests.utils.utils import random_lower_string
+
+pytestmark = pytest.mark.anyio
 
 
 def test_create_item(
@@ -24,10 +39,41 @@ def test_create_item(
     assert "owner_id" in content
 
 
-def test_read_item(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+def test_create_item_msgpack(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = {"title": "Foo", "description": "Fighters"}
+    response = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers={
+            **superuser_token_headers,
+            "Content-Type": "application/msgpack",
+            "Accept": "application/msgpack",
+        },
+        content=msgpack.packb(data),
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/msgpack"
+    content = msgpack.unpackb(response.content)
+    assert content["title"] == data["title"]
+    assert content["description"] == data["description"]
+
+
+def test_create_item_invalid_msgpack(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers={**superuser_token_headers, "Content-Type": "application/msgpack"},
+        content=b"\xc1",
+    )
+    assert response.status_code == 400
+
+
+async def test_read_item(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
-    item = create_random_item(db)
+    item = await create_random_item(db)
     response = client.get(
         f"{settings.API_V1_STR}/items/{item.id}",
         headers=superuser_token_headers,
@@ -40,6 +86,109 @@ def test_read_item(
     assert content["owner_id"] == str(item.owner_id)
 
 
+async def test_read_item_fields(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers=superuser_token_headers,
+        params={"fields": "title,id"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"id": str(item.id), "title": item.title}
+    etag = response.headers["ETag"]
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers={**superuser_token_headers, "If-None-Match": etag},
+        params={"fields": "id,title"},
+    )
+    assert response.status_code == 304
+    # Another field set, or the full item, is another representation
+    for params in ({"fields": "title"}, {}):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/{item.id}",
+            headers={**superuser_token_headers, "If-None-Match": etag},
+            params=params,
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+    # Any representation of the current version is enough to update
+    response = client.put(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"title": "Updated"},
+    )
+    assert response.status_code == 200
+
+
+async def test_read_item_fields_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers=normal_user_token_headers,
+        params={"fields": "title"},
+    )
+    assert response.status_code == 400
+
+
+async def test_read_item_singleflight(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
+    with patch("app.core.config.settings.SINGLEFLIGHT_ENABLED", True):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/{item.id}",
+            headers=superuser_token_headers,
+        )
+        assert response.status_code == 200
+        assert response.json()["title"] == item.title
+        response = client.get(
+            f"{settings.API_V1_STR}/items/{uuid.uuid4()}",
+            headers=superuser_token_headers,
+        )
+        assert response.status_code == 404
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            params={"fields": "id"},
+        )
+        assert response.status_code == 200
+        assert {"id": str(item.id)} in response.json()["data"]
+
+
+async def test_read_item_singleflight_scoped(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: AsyncSession,
+) -> None:
+    item = await create_random_item(db)
+    keys = []
+    do = singleflight.do
+
+    async def record(key: str, fn: Any) -> Any:
+        keys.append(key)
+        return await do(key, fn)
+
+    with (
+        patch("app.core.config.settings.SINGLEFLIGHT_ENABLED", True),
+        patch.object(singleflight, "do", record),
+    ):
+        for headers, status_code in (
+            (normal_user_token_headers, 400),
+            (superuser_token_headers, 200),
+        ):
+            response = client.get(
+                f"{settings.API_V1_STR}/items/{item.id}", headers=headers
+            )
+            assert response.status_code == status_code
+    # A regular user's lookup is never handed to a superuser
+    assert len(set(keys)) == 2
+
+
 def test_read_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -52,10 +201,10 @@ def test_read_item_not_found(
     assert content["detail"] == "Item not found"
 
 
-def test_read_item_not_enough_permissions(
-    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+async def test_read_item_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
-    item = create_random_item(db)
+    item = await create_random_item(db)
     response = client.get(
         f"{settings.API_V1_STR}/items/{item.id}",
         headers=normal_user_token_headers,
@@ -65,11 +214,11 @@ def test_read_item_not_enough_permissions(
     assert content["detail"] == "Not enough permissions"
 
 
-def test_read_items(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_read_items(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
-    create_random_item(db)
-    create_random_item(db)
+    await create_random_item(db)
+    await create_random_item(db)
     response = client.get(
         f"{settings.API_V1_STR}/items/",
         headers=superuser_token_headers,
@@ -79,10 +228,138 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
-def test_update_item(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_read_items_fields(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    await create_random_item(db)
+    await create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"fields": "title", "limit": 1},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert [set(item) for item in content["data"]] == [{"title"}]
+    assert content["count"] >= 2
+    assert content["next_cursor"]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"fields": "title", "limit": 1, "cursor": content["next_cursor"]},
+    )
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == 1
+
+
+def test_read_items_unknown_fields(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    for fields in ("title,secret", " , "):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            params={"fields": fields},
+        )
+        assert response.status_code == 400
+    assert response.json()["detail"] == "No fields requested"
+
+
+async def test_read_item_msgpack_etag(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    as_msgpack = {**superuser_token_headers, "Accept": "application/msgpack"}
+    json_etag = client.get(url, headers=superuser_token_headers).headers["ETag"]
+    response = client.get(url, headers={**as_msgpack, "If-None-Match": json_etag})
+    assert response.status_code == 200
+    msgpack_etag = response.headers["ETag"]
+    assert msgpack_etag != json_etag
+    response = client.get(url, headers={**as_msgpack, "If-None-Match": msgpack_etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"].removeprefix("W/") == msgpack_etag
+    response = client.get(
+        url, headers={**superuser_token_headers, "If-None-Match": msgpack_etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] == json_etag
+
+
+async def test_read_items_msgpack(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers={**superuser_token_headers, "Accept": "application/msgpack"},
+        params={"fields": "id,title"},
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/msgpack"
+    assert "Accept" in response.headers["Vary"]
+    content = msgpack.unpackb(response.content)
+    assert {"id": str(item.id), "title": item.title} in content["data"]
+    # JSON stays the default
+    response = client.get(
+        f"{settings.API_V1_STR}/items/", headers=superuser_token_headers
+    )
+    assert response.headers["Content-Type"] == "application/json"
+
+
+async def test_read_items_count_modes(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    await create_random_item(db)
+    counts = {}
+    for count_mode in ("exact", "window", "none"):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            params={"count": count_mode},
+        )
+        assert response.status_code == 200
+        content = response.json()
+        assert content["count_estimated"] is False
+        counts[count_mode] = content["count"]
+    assert counts["exact"] == counts["window"]
+    assert counts["none"] is None
+
+
+async def test_read_items_count_estimated(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    await create_random_item(db)
+    await db.execute(text("ANALYZE item"))
+    await db.commit()
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"count": "estimated"},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count_estimated"] is True
+    assert content["count"] >= 0
+
+
+def test_read_items_count_estimated_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
 ) -> None:
-    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"count": "estimated"},
+    )
+    assert response.status_code == 200
+    assert response.json()["count_estimated"] is False
+
+
+async def test_update_item(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
     data = {"title": "Updated title", "description": "Updated description"}
     response = client.put(
         f"{settings.API_V1_STR}/items/{item.id}",
@@ -111,10 +388,10 @@ def test_update_item_not_found(
     assert content["detail"] == "Item not found"
 
 
-def test_update_item_not_enough_permissions(
-    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+async def test_update_item_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
-    item = create_random_item(db)
+    item = await create_random_item(db)
     data = {"title": "Updated title", "description": "Updated description"}
     response = client.put(
         f"{settings.API_V1_STR}/items/{item.id}",
@@ -126,10 +403,10 @@ def test_update_item_not_enough_permissions(
     assert content["detail"] == "Not enough permissions"
 
 
-def test_delete_item(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_delete_item(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
-    item = create_random_item(db)
+    item = await create_random_item(db)
     response = client.delete(
         f"{settings.API_V1_STR}/items/{item.id}",
         headers=superuser_token_headers,
@@ -151,10 +428,10 @@ def test_delete_item_not_found(
     assert content["detail"] == "Item not found"
 
 
-def test_delete_item_not_enough_permissions(
-    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+async def test_delete_item_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
-    item = create_random_item(db)
+    item = await create_random_item(db)
     response = client.delete(
         f"{settings.API_V1_STR}/items/{item.id}",
         headers=normal_user_token_headers,
@@ -162,3 +439,360 @@ def test_delete_item_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+
+
+async def test_read_items_cursor_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    for _ in range(3):
+        await create_random_item(db)
+    seen: list[str] = []
+    cursor = None
+    while True:
+        params: dict[str, str | int] = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            params=params,
+        )
+        assert response.status_code == 200
+        content = response.json()
+        assert len(content["data"]) <= 2
+        seen.extend(item["id"] for item in content["data"])
+        cursor = content["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen))
+    assert len(seen) == content["count"]
+
+
+def test_read_items_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_items_limit_too_large(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"limit": settings.MAX_PAGE_SIZE + 1},
+    )
+    assert response.status_code == 422
+
+
+async def test_create_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    data = [{"title": f"Batch {i}", "description": "Bulk"} for i in range(3)]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [r["status"] for r in results] == [200, 200, 200]
+    assert [r["item"]["title"] for r in results] == ["Batch 0", "Batch 1", "Batch 2"]
+    for result in results:
+        item = await db.get(Item, uuid.UUID(result["id"]))
+        assert item
+        assert str(item.owner_id) == result["item"]["owner_id"]
+
+
+async def test_create_items_ignore_client_ids(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    # Nothing in the database keeps ids unique across partitions, only the
+    # API generates them
+    item = await create_random_item(db)
+    title = random_lower_string()
+    body = {"id": str(item.id), "title": title}
+    responses = [
+        client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json=body,
+        ),
+        client.post(
+            f"{settings.API_V1_STR}/items/batch",
+            headers=normal_user_token_headers,
+            json=[body],
+        ),
+        client.post(
+            f"{settings.API_V1_STR}/items/import",
+            headers={
+                **normal_user_token_headers,
+                "Content-Type": "application/x-ndjson",
+            },
+            content=json.dumps(body).encode(),
+        ),
+    ]
+    assert all(response.status_code == 200 for response in responses)
+    result = await db.exec(select(Item).where(Item.title == title))
+    ids = [created.id for created in result.all()]
+    assert len(ids) == 3
+    assert item.id not in ids
+    result = await db.exec(select(Item).where(Item.id == item.id))
+    assert len(result.all()) == 1
+
+
+def test_create_items_batch_too_large(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = [{"title": "Foo"}] * (settings.MAX_BATCH_SIZE + 1)
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert response.status_code == 422
+
+
+async def test_update_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=[{"title": "Mine 1"}, {"title": "Mine 2"}],
+    )
+    own_ids = [r["id"] for r in response.json()["data"]]
+    other = await create_random_item(db)
+    missing = str(uuid.uuid4())
+    data = [
+        {"id": own_ids[0], "title": "Updated"},
+        {"id": str(other.id), "title": "Stolen"},
+        {"id": missing, "title": "Nobody"},
+        {"id": own_ids[1], "description": "Only description"},
+    ]
+    response = client.patch(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [r["status"] for r in results] == [200, 400, 404, 200]
+    assert results[0]["item"]["title"] == "Updated"
+    assert results[1]["detail"] == "Not enough permissions"
+    assert results[2]["detail"] == "Item not found"
+    assert results[3]["item"]["title"] == "Mine 2"
+    assert results[3]["item"]["description"] == "Only description"
+
+    await db.refresh(other)
+    assert other.title != "Stolen"
+    updated = await db.get(Item, uuid.UUID(own_ids[0]))
+    assert updated
+    await db.refresh(updated)
+    assert updated.title == "Updated"
+
+
+async def test_delete_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=[{"title": "Doomed"}],
+    )
+    own_id = response.json()["data"][0]["id"]
+    other = await create_random_item(db)
+    response = client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=[own_id, str(other.id)],
+    )
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [r["status"] for r in results] == [200, 400]
+    assert await db.get(Item, uuid.UUID(own_id)) is None
+    await db.refresh(other)
+
+
+async def test_export_items_ndjson(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=[{"title": "Exported"}],
+    )
+    own_id = response.json()["data"][0]["id"]
+    other = await create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export", headers=normal_user_token_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    ids = {row["id"] for row in rows}
+    assert own_id in ids
+    assert str(other.id) not in ids
+    assert set(rows[0]) == {"title", "description", "id", "owner_id"}
+
+
+async def test_export_items_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=superuser_token_headers,
+        params={"format": "csv"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    exported = next(row for row in rows if row["id"] == str(item.id))
+    assert exported["title"] == item.title
+    assert exported["owner_id"] == str(item.owner_id)
+
+
+async def test_import_items_ndjson(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    title = random_lower_string()
+    lines = [
+        json.dumps({"title": title, "description": "first"}),
+        "",
+        json.dumps({"title": ""}),
+        "not json",
+        json.dumps({"title": title}),
+    ]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/import",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content="\n".join(lines).encode(),
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 2
+    assert report["rejected"] == 2
+    assert [r["line"] for r in report["rejects"]] == [3, 4]
+    assert report["rejects"][0]["errors"][0].startswith("title:")
+    result = await db.exec(select(Item).where(Item.title == title))
+    items = result.all()
+    assert len(items) == 2
+    assert {item.description for item in items} == {"first", None}
+
+
+async def test_import_items_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    user = await create_random_user(db)
+    body = 'title,description\nPlain,\n"Quoted, comma","spans\ntwo lines"\nonly one\n'
+    response = client.post(
+        f"{settings.API_V1_STR}/items/import",
+        headers={**superuser_token_headers, "Content-Type": "text/csv"},
+        params={"format": "csv", "owner_id": str(user.id)},
+        content=body.encode(),
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 2
+    assert report["rejects"] == [{"line": 5, "errors": ["Expected 2 fields, got 1"]}]
+    result = await db.exec(select(Item).where(Item.owner_id == user.id))
+    items = {item.title: item.description for item in result.all()}
+    assert items == {"Plain": None, "Quoted, comma": "spans\ntwo lines"}
+
+
+def test_import_items_for_other_user_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/import",
+        headers=normal_user_token_headers,
+        params={"owner_id": str(uuid.uuid4())},
+        content=b"",
+    )
+    assert response.status_code == 400
+
+
+async def test_read_item_not_modified(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    response = client.get(url, headers=superuser_token_headers)
+    etag = response.headers["ETag"]
+    assert etag == f'"{item.id.hex}.1"'
+
+    response = client.get(
+        url, headers={**superuser_token_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    client.put(url, headers=superuser_token_headers, json={"title": "Changed"})
+    response = client.get(
+        url, headers={**superuser_token_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{item.id.hex}.2"'
+
+
+async def test_update_item_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    item = await create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    etag = client.get(url, headers=superuser_token_headers).headers["ETag"]
+
+    response = client.put(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"title": "First"},
+    )
+    assert response.status_code == 200
+    new_etag = response.headers["ETag"]
+    assert new_etag != etag
+
+    # A second writer still holding the old ETag loses
+    response = client.put(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"title": "Second"},
+    )
+    assert response.status_code == 412
+    await db.refresh(item)
+    assert item.title == "First"
+    assert item.version == 2
+
+
+async def test_read_item_cached(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: AsyncSession,
+) -> None:
+    item = await create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    with patch.object(response_cache.cache, "ttl", 60):  # type: ignore[attr-defined]
+        first = client.get(url, headers=superuser_token_headers)
+        hits = (await response_cache.stats())["hits"]
+        second = client.get(url, headers=superuser_token_headers)
+        assert (await response_cache.stats())["hits"] == hits + 1
+        assert second.json() == first.json()
+        assert second.headers["ETag"] == first.headers["ETag"]
+        # Ownership is still checked on a hit
+        r = client.get(url, headers=normal_user_token_headers)
+        assert r.status_code == 400
+
+        client.put(url, headers=superuser_token_headers, json={"title": "Fresh"})
+        r = client.get(url, headers=superuser_token_headers)
+        assert r.json()["title"] == "Fresh"
+        client.delete(url, headers=superuser_token_headers)
+        r = client.get(url, headers=superuser_token_headers)
+        assert r.status_code == 404
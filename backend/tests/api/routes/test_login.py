@@ -1,16 +1,20 @@
 from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core.config import settings
-from app.core.security import verify_password
+from app.core.security import password_hasher, verify_password
 from app.crud import create_user
-from app.models import UserCreate
+from app.models import EmailOutbox, UserCreate
 from app.utils import generate_password_reset_token
 from tests.utils.user import user_authentication_headers
 from tests.utils.utils import random_email, random_lower_string
 
+pytestmark = pytest.mark.anyio
+
 
 def test_get_access_token(client: TestClient) -> None:
     login_data = {
@@ -33,6 +37,17 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+def test_get_access_token_hashing_busy(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with patch.object(password_hasher, "max_pending", 0):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 503
+    assert int(r.headers["Retry-After"]) >= 1
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -45,8 +60,8 @@ def test_use_access_token(
     assert "email" in result
 
 
-def test_recovery_password(
-    client: TestClient, normal_user_token_headers: dict[str, str]
+async def test_recovery_password(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     with (
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
@@ -59,6 +74,8 @@ def test_recovery_password(
         )
         assert r.status_code == 200
         assert r.json() == {"message": "Password recovery email sent"}
+        result = await db.exec(select(EmailOutbox).where(EmailOutbox.email_to == email))
+        assert result.first()
 
 
 def test_recovery_password_user_not_exits(
@@ -72,7 +89,7 @@ def test_recovery_password_user_not_exits(
     assert r.status_code == 404
 
 
-def test_reset_password(client: TestClient, db: Session) -> None:
+async def test_reset_password(client: TestClient, db: AsyncSession) -> None:
     email = random_email()
     password = random_lower_string()
     new_password = random_lower_string()
@@ -84,7 +101,7 @@ def test_reset_password(client: TestClient, db: Session) -> None:
         is_active=True,
         is_superuser=False,
     )
-    user = create_user(session=db, user_create=user_create)
+    user = await create_user(session=db, user_create=user_create)
     token = generate_password_reset_token(email=email)
     headers = user_authentication_headers(client=client, email=email, password=password)
     data = {"new_password": new_password, "token": token}
@@ -98,7 +115,7 @@ def test_reset_password(client: TestClient, db: Session) -> None:
     assert r.status_code == 200
     assert r.json() == {"message": "Password updated successfully"}
 
-    db.refresh(user)
+    await db.refresh(user)
     assert verify_password(new_password, user.hashed_password)
 
 
@@ -1,11 +1,15 @@
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core.config import settings
 from app.models import User
 
+pytestmark = pytest.mark.anyio
 
-def test_create_user(client: TestClient, db: Session) -> None:
+
+async def test_create_user(client: TestClient, db: AsyncSession) -> None:
     r = client.post(
         f"{settings.API_V1_STR}/private/users/",
         json={
@@ -19,7 +23,7 @@ def test_create_user(client: TestClient, db: Session) -> None:
 
     data = r.json()
 
-    user = db.exec(select(User).where(User.id == data["id"])).first()
+    user = (await db.exec(select(User).where(User.id == data["id"]))).first()
 
     assert user
     assert user.email == "pollo@listo.com"
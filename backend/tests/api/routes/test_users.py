@@ -1,15 +1,25 @@
+import json
 import uuid
+from typing import Any
 from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlalchemy import event
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
+from app.core.cache import response_cache, user_cache, user_cache_key
 from app.core.config import settings
-from app.core.security import verify_password
-from app.models import User, UserCreate
+from app.core.db import async_engine
+from app.core.security import get_password_hash, verify_password
+from app.models import EmailOutbox, User, UserCreate
+from tests.utils.user import user_authentication_headers
 from tests.utils.utils import random_email, random_lower_string
 
+pytestmark = pytest.mark.anyio
+
 
 def test_get_users_superuser_me(
     client: TestClient, superuser_token_headers: dict[str, str]
@@ -33,11 +43,64 @@ def test_get_users_normal_user_me(
     assert current_user["email"] == settings.EMAIL_TEST_USER
 
 
-def test_create_user_new_email(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+def test_get_users_me_fields(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers=normal_user_token_headers,
+        params={"fields": "email,is_active"},
+    )
+    assert r.status_code == 200
+    assert r.json() == {"email": settings.EMAIL_TEST_USER, "is_active": True}
+    etag = r.headers["ETag"]
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers={**normal_user_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers=normal_user_token_headers,
+        params={"fields": "hashed_password"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Unknown fields: hashed_password"
+
+
+def test_get_users_me_fields_columns(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    # The authorization fields are cached by the first request
+    client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    statements: list[str] = []
+
+    def record(*args: Any) -> None:
+        statements.append(args[2])
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        r = client.get(
+            f"{settings.API_V1_STR}/users/me",
+            headers=normal_user_token_headers,
+            params={"fields": "email"},
+        )
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert r.status_code == 200
+    (statement,) = [s for s in statements if 'FROM "user"' in s]
+    columns = statement.split("FROM")[0]
+    assert "email" in columns
+    assert "hashed_password" not in columns
+    assert "full_name" not in columns
+
+
+async def test_create_user_new_email(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     with (
-        patch("app.utils.send_email", return_value=None),
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
         patch("app.core.config.settings.SMTP_USER", "admin@example.com"),
     ):
@@ -51,18 +114,24 @@ def test_create_user_new_email(
         )
         assert 200 <= r.status_code < 300
         created_user = r.json()
-        user = crud.get_user_by_email(session=db, email=username)
+        user = await crud.get_user_by_email(session=db, email=username)
         assert user
         assert user.email == created_user["email"]
+        # The welcome email is queued, not sent within the request
+        result = await db.exec(
+            select(EmailOutbox).where(EmailOutbox.email_to == username)
+        )
+        email = result.one()
+        assert email.status == "pending"
 
 
-def test_get_existing_user(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_get_existing_user(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    user = crud.create_user(session=db, user_create=user_in)
+    user = await crud.create_user(session=db, user_create=user_in)
     user_id = user.id
     r = client.get(
         f"{settings.API_V1_STR}/users/{user_id}",
@@ -70,16 +139,18 @@ def test_get_existing_user(
     )
     assert 200 <= r.status_code < 300
     api_user = r.json()
-    existing_user = crud.get_user_by_email(session=db, email=username)
+    existing_user = await crud.get_user_by_email(session=db, email=username)
     assert existing_user
     assert existing_user.email == api_user["email"]
 
 
-def test_get_existing_user_current_user(client: TestClient, db: Session) -> None:
+async def test_get_existing_user_current_user(
+    client: TestClient, db: AsyncSession
+) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    user = crud.create_user(session=db, user_create=user_in)
+    user = await crud.create_user(session=db, user_create=user_in)
     user_id = user.id
 
     login_data = {
@@ -97,7 +168,7 @@ def test_get_existing_user_current_user(client: TestClient, db: Session) -> None
     )
     assert 200 <= r.status_code < 300
     api_user = r.json()
-    existing_user = crud.get_user_by_email(session=db, email=username)
+    existing_user = await crud.get_user_by_email(session=db, email=username)
     assert existing_user
     assert existing_user.email == api_user["email"]
 
@@ -113,14 +184,14 @@ def test_get_existing_user_permissions_error(
     assert r.json() == {"detail": "The user doesn't have enough privileges"}
 
 
-def test_create_user_existing_username(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_create_user_existing_username(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     username = random_email()
     # username = email
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    crud.create_user(session=db, user_create=user_in)
+    await crud.create_user(session=db, user_create=user_in)
     data = {"email": username, "password": password}
     r = client.post(
         f"{settings.API_V1_STR}/users/",
@@ -146,18 +217,18 @@ def test_create_user_by_normal_user(
     assert r.status_code == 403
 
 
-def test_retrieve_users(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_retrieve_users(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    crud.create_user(session=db, user_create=user_in)
+    await crud.create_user(session=db, user_create=user_in)
 
     username2 = random_email()
     password2 = random_lower_string()
     user_in2 = UserCreate(email=username2, password=password2)
-    crud.create_user(session=db, user_create=user_in2)
+    await crud.create_user(session=db, user_create=user_in2)
 
     r = client.get(f"{settings.API_V1_STR}/users/", headers=superuser_token_headers)
     all_users = r.json()
@@ -168,8 +239,52 @@ def test_retrieve_users(
         assert "email" in item
 
 
-def test_update_user_me(
-    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+async def test_retrieve_users_cursor_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    for _ in range(2):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        await crud.create_user(session=db, user_create=user_in)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 1},
+    )
+    first_page = r.json()
+    assert len(first_page["data"]) == 1
+    assert first_page["next_cursor"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 1, "cursor": first_page["next_cursor"]},
+    )
+    second_page = r.json()
+    assert r.status_code == 200
+    assert len(second_page["data"]) == 1
+    assert second_page["data"][0]["id"] > first_page["data"][0]["id"]
+
+
+async def test_retrieve_users_fields(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    await crud.create_user(session=db, user_create=user_in)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"fields": "email"},
+    )
+    assert r.status_code == 200
+    all_users = r.json()
+    assert len(all_users["data"]) > 1
+    assert all(set(user) == {"email"} for user in all_users["data"])
+
+
+async def test_update_user_me(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     full_name = "Updated Name"
     email = random_email()
@@ -185,14 +300,31 @@ def test_update_user_me(
     assert updated_user["full_name"] == full_name
 
     user_query = select(User).where(User.email == email)
-    user_db = db.exec(user_query).first()
+    user_db = (await db.exec(user_query)).first()
     assert user_db
     assert user_db.email == email
     assert user_db.full_name == full_name
 
 
-def test_update_password_me(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+def test_update_user_me_read_back(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    # The first read puts the user in the authentication cache
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    full_name = random_lower_string()
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/me",
+        headers=normal_user_token_headers,
+        json={"full_name": full_name},
+    )
+    assert r.status_code == 200
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    assert r.json()["full_name"] == full_name
+
+
+async def test_update_password_me(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     new_password = random_lower_string()
     data = {
@@ -209,7 +341,7 @@ def test_update_password_me(
     assert updated_user["message"] == "Password updated successfully"
 
     user_query = select(User).where(User.email == settings.FIRST_SUPERUSER)
-    user_db = db.exec(user_query).first()
+    user_db = (await db.exec(user_query)).first()
     assert user_db
     assert user_db.email == settings.FIRST_SUPERUSER
     assert verify_password(new_password, user_db.hashed_password)
@@ -224,12 +356,51 @@ def test_update_password_me(
         headers=superuser_token_headers,
         json=old_data,
     )
-    db.refresh(user_db)
+    await db.refresh(user_db)
 
     assert r.status_code == 200
     assert verify_password(settings.FIRST_SUPERUSER_PASSWORD, user_db.hashed_password)
 
 
+async def test_update_password_me_stale_user_cache(
+    client: TestClient, db: AsyncSession
+) -> None:
+    email, password = random_email(), random_lower_string()
+    user = await crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+    # Only what authorization needs is cached, never the password hash
+    assert set(user_cache.get(str(user.id)) or {}) == {
+        "id",
+        "is_active",
+        "is_superuser",
+    }
+
+    # Changed by another worker, whose invalidation this one does not see
+    changed_password = random_lower_string()
+    user.hashed_password = get_password_hash(changed_password)
+    db.add(user)
+    await db.commit()
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/me/password",
+        headers=headers,
+        json={"current_password": password, "new_password": random_lower_string()},
+    )
+    assert r.status_code == 400
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/me/password",
+        headers=headers,
+        json={
+            "current_password": changed_password,
+            "new_password": random_lower_string(),
+        },
+    )
+    assert r.status_code == 200
+
+
 def test_update_password_me_incorrect_password(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -245,13 +416,13 @@ def test_update_password_me_incorrect_password(
     assert updated_user["detail"] == "Incorrect password"
 
 
-def test_update_user_me_email_exists(
-    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+async def test_update_user_me_email_exists(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    user = crud.create_user(session=db, user_create=user_in)
+    user = await crud.create_user(session=db, user_create=user_in)
 
     data = {"email": user.email}
     r = client.patch(
@@ -282,7 +453,7 @@ def test_update_password_me_same_password_error(
     )
 
 
-def test_register_user(client: TestClient, db: Session) -> None:
+async def test_register_user(client: TestClient, db: AsyncSession) -> None:
     username = random_email()
     password = random_lower_string()
     full_name = random_lower_string()
@@ -297,7 +468,7 @@ def test_register_user(client: TestClient, db: Session) -> None:
     assert created_user["full_name"] == full_name
 
     user_query = select(User).where(User.email == username)
-    user_db = db.exec(user_query).first()
+    user_db = (await db.exec(user_query)).first()
     assert user_db
     assert user_db.email == username
     assert user_db.full_name == full_name
@@ -320,13 +491,13 @@ def test_register_user_already_exists_error(client: TestClient) -> None:
     assert r.json()["detail"] == "The user with this email already exists in the system"
 
 
-def test_update_user(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_update_user(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    user = crud.create_user(session=db, user_create=user_in)
+    user = await crud.create_user(session=db, user_create=user_in)
 
     data = {"full_name": "Updated_full_name"}
     r = client.patch(
@@ -340,8 +511,8 @@ def test_update_user(
     assert updated_user["full_name"] == "Updated_full_name"
 
     user_query = select(User).where(User.email == username)
-    user_db = db.exec(user_query).first()
-    db.refresh(user_db)
+    user_db = (await db.exec(user_query)).first()
+    await db.refresh(user_db)
     assert user_db
     assert user_db.full_name == "Updated_full_name"
 
@@ -359,18 +530,18 @@ def test_update_user_not_exists(
     assert r.json()["detail"] == "The user with this id does not exist in the system"
 
 
-def test_update_user_email_exists(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_update_user_email_exists(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    user = crud.create_user(session=db, user_create=user_in)
+    user = await crud.create_user(session=db, user_create=user_in)
 
     username2 = random_email()
     password2 = random_lower_string()
     user_in2 = UserCreate(email=username2, password=password2)
-    user2 = crud.create_user(session=db, user_create=user_in2)
+    user2 = await crud.create_user(session=db, user_create=user_in2)
 
     data = {"email": user2.email}
     r = client.patch(
@@ -382,11 +553,11 @@ def test_update_user_email_exists(
     assert r.json()["detail"] == "User with this email already exists"
 
 
-def test_delete_user_me(client: TestClient, db: Session) -> None:
+async def test_delete_user_me(client: TestClient, db: AsyncSession) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    user = crud.create_user(session=db, user_create=user_in)
+    user = await crud.create_user(session=db, user_create=user_in)
     user_id = user.id
 
     login_data = {
@@ -405,11 +576,11 @@ def test_delete_user_me(client: TestClient, db: Session) -> None:
     assert r.status_code == 200
     deleted_user = r.json()
     assert deleted_user["message"] == "User deleted successfully"
-    result = db.exec(select(User).where(User.id == user_id)).first()
+    result = (await db.exec(select(User).where(User.id == user_id))).first()
     assert result is None
 
     user_query = select(User).where(User.id == user_id)
-    user_db = db.execute(user_query).first()
+    user_db = (await db.execute(user_query)).first()
     assert user_db is None
 
 
@@ -425,13 +596,13 @@ def test_delete_user_me_as_superuser(
     assert response["detail"] == "Super users are not allowed to delete themselves"
 
 
-def test_delete_user_super_user(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_delete_user_super_user(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    user = crud.create_user(session=db, user_create=user_in)
+    user = await crud.create_user(session=db, user_create=user_in)
     user_id = user.id
     r = client.delete(
         f"{settings.API_V1_STR}/users/{user_id}",
@@ -440,7 +611,7 @@ def test_delete_user_super_user(
     assert r.status_code == 200
     deleted_user = r.json()
     assert deleted_user["message"] == "User deleted successfully"
-    result = db.exec(select(User).where(User.id == user_id)).first()
+    result = (await db.exec(select(User).where(User.id == user_id))).first()
     assert result is None
 
 
@@ -455,10 +626,12 @@ def test_delete_user_not_found(
     assert r.json()["detail"] == "User not found"
 
 
-def test_delete_user_current_super_user_error(
-    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+async def test_delete_user_current_super_user_error(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
-    super_user = crud.get_user_by_email(session=db, email=settings.FIRST_SUPERUSER)
+    super_user = await crud.get_user_by_email(
+        session=db, email=settings.FIRST_SUPERUSER
+    )
     assert super_user
     user_id = super_user.id
 
@@ -470,13 +643,13 @@ def test_delete_user_current_super_user_error(
     assert r.json()["detail"] == "Super users are not allowed to delete themselves"
 
 
-def test_delete_user_without_privileges(
-    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+async def test_delete_user_without_privileges(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: AsyncSession
 ) -> None:
     username = random_email()
     password = random_lower_string()
     user_in = UserCreate(email=username, password=password)
-    user = crud.create_user(session=db, user_create=user_in)
+    user = await crud.create_user(session=db, user_create=user_in)
 
     r = client.delete(
         f"{settings.API_V1_STR}/users/{user.id}",
@@ -484,3 +657,86 @@ def test_delete_user_without_privileges(
     )
     assert r.status_code == 403
     assert r.json()["detail"] == "The user doesn't have enough privileges"
+
+
+def test_export_users(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/users/export", headers=superuser_token_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert settings.FIRST_SUPERUSER in {row["email"] for row in rows}
+    assert all("hashed_password" not in row for row in rows)
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+
+def test_export_users_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/users/export", headers=normal_user_token_headers
+    )
+    assert response.status_code == 403
+
+
+def test_read_user_me_not_modified(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/users/me"
+    etag = client.get(url, headers=normal_user_token_headers).headers["ETag"]
+    r = client.get(url, headers={**normal_user_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    r = client.get(
+        url, headers={**normal_user_token_headers, "If-None-Match": f'"other", {etag}'}
+    )
+    assert r.status_code == 304
+
+
+async def test_update_user_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = await crud.create_user(session=db, user_create=user_in)
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    etag = client.get(url, headers=superuser_token_headers).headers["ETag"]
+
+    r = client.patch(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"full_name": "Updated"},
+    )
+    assert r.status_code == 200
+    assert r.headers["ETag"] == f'"{user.id.hex}.2"'
+
+    r = client.patch(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"full_name": "Stale"},
+    )
+    assert r.status_code == 412
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Updated"
+
+
+async def test_read_user_by_id_cached(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = await crud.create_user(session=db, user_create=user_in)
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    with patch.object(response_cache.cache, "ttl", 60):  # type: ignore[attr-defined]
+        r = client.get(url, headers=superuser_token_headers)
+        assert r.json()["full_name"] is None
+        r = client.patch(
+            url, headers=superuser_token_headers, json={"full_name": "Renamed"}
+        )
+        assert r.status_code == 200
+        r = client.get(url, headers=superuser_token_headers)
+        assert r.json()["full_name"] == "Renamed"
+        assert r.headers["ETag"] == f'"{user.id.hex}.2"'
+        client.delete(url, headers=superuser_token_headers)
+        assert await response_cache.get(user_cache_key(user.id)) is None
@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import EmailOutbox
+from tests.utils.utils import random_email
+
+pytestmark = pytest.mark.anyio
+
+
+def test_read_metrics_user_cache(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    client.get(f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers)
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    before = r.json()["user_cache"]
+    client.get(f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers)
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    after = r.json()["user_cache"]
+    # Both the read and the metrics request authenticate from the cache
+    assert after["hits"] >= before["hits"] + 2
+    assert after["misses"] == before["misses"]
+
+
+def test_read_metrics_singleflight(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    with patch("app.core.config.settings.SINGLEFLIGHT_ENABLED", True):
+        client.get(f"{settings.API_V1_STR}/items/", headers=superuser_token_headers)
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    stats = r.json()["singleflight"]
+    assert stats["calls"] >= 1
+    assert stats["in_flight"] == 0
+
+
+def test_read_database_pool(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/database-pool/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["settings"]["pool_size"] == settings.POSTGRES_POOL_SIZE
+    api = content["api"]
+    assert api["size"] == settings.POSTGRES_POOL_SIZE
+    assert api["checkout_wait_seconds"]["count"] >= 1
+    assert "blocking" in content
+
+
+def test_read_metrics_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=normal_user_token_headers
+    )
+    assert r.status_code == 403
+
+
+async def test_test_email_is_queued(
+    client: TestClient, superuser_token_headers: dict[str, str], db: AsyncSession
+) -> None:
+    email_to = random_email()
+    r = client.post(
+        f"{settings.API_V1_STR}/utils/test-email/",
+        headers=superuser_token_headers,
+        params={"email_to": email_to},
+    )
+    assert r.status_code == 201
+    assert r.json() == {"message": "Test email sent"}
+    result = await db.exec(select(EmailOutbox).where(EmailOutbox.email_to == email_to))
+    email = result.one()
+    assert email.status == "pending"
+    assert email.attempts == 0
@@ -1,27 +1,46 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, delete
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core.config import settings
-from app.core.db import engine, init_db
+from app.core.db import init_db
 from app.main import app
-from app.models import Item, User
+from app.models import EmailOutbox, Item, User, UserEmail
 from tests.utils.user import authentication_token_from_email
 from tests.utils.utils import get_superuser_token_headers
 
 
+@pytest.fixture(scope="session")
+def anyio_backend() -> str:
+    return "asyncio"
+
+
 @pytest.fixture(scope="session", autouse=True)
-def db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
-        init_db(session)
+async def db(anyio_backend: str) -> AsyncGenerator[AsyncSession, None]:  # noqa: ARG001
+    # The app runs its own event loop inside TestClient, so the tests get an
+    # engine of their own instead of sharing the app's connection pool.
+    # Like the app, keep objects loaded after commit to avoid implicit IO.
+    engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        await init_db(session)
         yield session
         statement = delete(Item)
-        session.execute(statement)
+        await session.execute(statement)
         statement = delete(User)
-        session.execute(statement)
-        session.commit()
+        await session.execute(statement)
+        statement = delete(EmailOutbox)
+        await session.execute(statement)
+        statement = delete(UserEmail)
+        await session.execute(statement)
+        await session.commit()
+    await engine.dispose()
 
 
 @pytest.fixture(scope="module")
@@ -36,7 +55,9 @@ def superuser_token_headers(client: TestClient) -> dict[str, str]:
 
 
 @pytest.fixture(scope="module")
-def normal_user_token_headers(client: TestClient, db: Session) -> dict[str, str]:
-    return authentication_token_from_email(
+async def normal_user_token_headers(
+    client: TestClient, db: AsyncSession
+) -> dict[str, str]:
+    return await authentication_token_from_email(
         client=client, email=settings.EMAIL_TEST_USER, db=db
     )
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.core.cache import MemoryCacheBackend, RedisCacheBackend, TTLCache
+from tests.utils.resp_server import resp_server
+
+pytestmark = pytest.mark.anyio
+
+
+def test_cache_hit_and_miss() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=10, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_entries_expire() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=10, ttl=5)
+    with patch("app.core.cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("app.core.cache.time.monotonic", return_value=104.0):
+        assert cache.get("a") == 1
+    with patch("app.core.cache.time.monotonic", return_value=106.0):
+        assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_delete() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=10, ttl=60)
+    cache.set("a", 1)
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.get("a") is None
+
+
+def test_cache_disabled() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=10, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+async def test_memory_backend_stats() -> None:
+    backend = MemoryCacheBackend(max_size=1, ttl=60, tombstone_ttl=10)
+    assert await backend.get("a") is None
+    await backend.set("a", b"1")
+    await backend.set("b", b"2")
+    assert await backend.get("b") == b"2"
+    await backend.delete("b")
+    assert await backend.get("b") is None
+    stats = await backend.stats()
+    assert stats["hit_ratio"] == 1 / 3
+    assert stats["evictions"] == 1
+
+
+async def test_memory_backend_tombstone() -> None:
+    backend = MemoryCacheBackend(max_size=10, ttl=60, tombstone_ttl=10)
+    await backend.delete("a")
+    # A read that started before the delete cannot put back what it loaded
+    await backend.set("a", b"stale")
+    assert await backend.get("a") is None
+    with patch("app.core.cache.time.monotonic", return_value=time.monotonic() + 11):
+        await backend.set("a", b"1")
+        assert await backend.get("a") == b"1"
+
+
+async def test_redis_backend() -> None:
+    async with resp_server(max_keys=2) as server:
+        backend = RedisCacheBackend(
+            server.url, ttl=60, tombstone_ttl=10, max_connections=2, timeout=1
+        )
+        assert await backend.get("a") is None
+        await backend.set("a", b"\r\nbinary\x00")
+        assert await backend.get("a") == b"\r\nbinary\x00"
+        await backend.set("b", b"2")
+        await backend.set("c", b"3")
+        await backend.delete("b")
+        assert await backend.get("b") is None
+        stats = await backend.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 2
+        assert stats["evictions"] == 1
+        assert [
+            b"SET",
+            b"a",
+            b"\r\nbinary\x00",
+            b"PX",
+            b"60000",
+            b"NX",
+        ] in server.commands
+
+
+async def test_redis_backend_tombstone() -> None:
+    async with resp_server() as server:
+        backend = RedisCacheBackend(
+            server.url, ttl=60, tombstone_ttl=0.1, max_connections=2, timeout=1
+        )
+        await backend.set("a", b"1")
+        await backend.delete("a", "b")
+        await backend.set("a", b"stale")
+        assert await backend.get("a") is None
+        await asyncio.sleep(0.2)
+        await backend.set("a", b"2")
+        assert await backend.get("a") == b"2"
+
+
+async def test_redis_backend_acl_user() -> None:
+    async with resp_server() as server:
+        url = server.url.replace("redis://", "redis://cache:p%40ss@")
+        backend = RedisCacheBackend(
+            url, ttl=60, tombstone_ttl=10, max_connections=2, timeout=1
+        )
+        await backend.get("a")
+        assert [b"AUTH", b"cache", b"p@ss"] in server.commands
+
+
+async def test_redis_backend_unreachable_is_a_miss() -> None:
+    async with resp_server() as server:
+        url = server.url
+    backend = RedisCacheBackend(
+        url, ttl=60, tombstone_ttl=10, max_connections=2, timeout=1
+    )
+    assert await backend.get("a") is None
+    await backend.set("a", b"1")
+    stats = await backend.stats()
+    assert stats["errors"] == 3
+    assert stats["evictions"] is None
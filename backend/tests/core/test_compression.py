@@ -0,0 +1,146 @@
+import gzip
+from collections.abc import Callable, Iterator
+from unittest.mock import patch
+
+import brotli  # type: ignore[import-untyped]
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from app.core.compression import (
+    BrotliCompressor,
+    CompressionMiddleware,
+    Compressor,
+    GzipCompressor,
+    ZstdCompressor,
+    choose_encoding,
+)
+from app.core.config import settings
+
+BODY = b'{"title": "Foo", "description": "Fighters"}\n' * 100
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected",
+    [
+        (None, None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("deflate, gzip;q=0.5", "gzip"),
+        ("gzip;q=0", None),
+        ("gzip, br", "br"),
+        ("gzip, br, zstd", "zstd"),
+        ("*", "zstd"),
+        ("*, zstd;q=0", "br"),
+        ("*, zstd;q=0, br;q=0, gzip;q=0", None),
+    ],
+)
+def test_choose_encoding(accept_encoding: str | None, expected: str | None) -> None:
+    assert choose_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize(
+    "compressor,decompress",
+    [
+        (GzipCompressor(level=6), gzip.decompress),
+        (BrotliCompressor(quality=4), brotli.decompress),
+        (
+            ZstdCompressor(level=3),
+            lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+        ),
+    ],
+)
+def test_compressor_flush(
+    compressor: Compressor, decompress: Callable[[bytes], bytes]
+) -> None:
+    chunks = [compressor.compress(BODY) + compressor.flush() for _ in range(3)]
+    chunks.append(compressor.finish())
+    assert decompress(b"".join(chunks)) == BODY * 3
+
+
+calls = 0
+
+
+async def full(_request: Request) -> Response:
+    global calls
+    calls += 1
+    return Response(BODY, media_type="application/json", headers={"ETag": '"1"'})
+
+
+async def small(_request: Request) -> Response:
+    return Response(b"{}", media_type="application/json")
+
+
+async def stream(_request: Request) -> StreamingResponse:
+    def chunks() -> Iterator[bytes]:
+        for _ in range(3):
+            yield BODY
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@pytest.fixture(scope="module")
+def app_client() -> Iterator[TestClient]:
+    app = Starlette(
+        routes=[Route("/full", full), Route("/small", small), Route("/stream", stream)]
+    )
+    app.add_middleware(CompressionMiddleware, static_paths=["/full"])
+    yield TestClient(app, headers={"Accept-Encoding": "gzip"})
+
+
+def test_compress_response(app_client: TestClient) -> None:
+    r = app_client.get("/full")
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.headers["Vary"] == "Accept-Encoding"
+    assert r.headers["ETag"] == 'W/"1"'
+    assert int(r.headers["Content-Length"]) < len(BODY)
+    assert r.content == BODY
+
+
+def test_compress_response_below_minimum_size(app_client: TestClient) -> None:
+    r = app_client.get("/small")
+    assert "Content-Encoding" not in r.headers
+    assert r.content == b"{}"
+    with patch("app.core.config.settings.COMPRESSION_MIN_SIZE", 0):
+        r = app_client.get("/small")
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.content == b"{}"
+
+
+def test_compress_streaming_response(app_client: TestClient) -> None:
+    r = app_client.get("/stream")
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in r.headers
+    assert r.content == BODY * 3
+
+
+def test_compress_not_accepted(app_client: TestClient) -> None:
+    r = app_client.get("/stream", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in r.headers
+    assert r.content == BODY * 3
+
+
+def test_static_path_compressed_once(app_client: TestClient) -> None:
+    before = calls
+    for _ in range(3):
+        r = app_client.get("/full")
+        assert r.headers["Content-Encoding"] == "gzip"
+        assert r.content == BODY
+    r = app_client.get("/full", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in r.headers
+    assert r.content == BODY
+    # At most once per encoding
+    assert calls - before <= 2
+
+
+def test_openapi_compressed(client: TestClient) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/openapi.json", headers={"Accept-Encoding": "gzip"}
+    )
+    assert r.status_code == 200
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.json()["info"]["title"] == settings.PROJECT_NAME
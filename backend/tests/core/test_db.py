@@ -0,0 +1,75 @@
+import uuid
+from collections.abc import AsyncIterator
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.requests import Request
+
+from app.api.deps import get_async_db
+from app.core.config import settings
+from app.core.db import async_engine, read_only_engine
+from app.models import Item
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def engine() -> AsyncIterator[AsyncEngine]:
+    # Not the app's pool, its connections belong to the TestClient event loop
+    engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    yield engine
+    await engine.dispose()
+
+
+def make_request(method: str) -> Request:
+    return Request({"type": "http", "method": method, "headers": [], "state": {}})
+
+
+async def test_autocommit_session(engine: AsyncEngine) -> None:
+    bind = read_only_engine(engine)
+    assert read_only_engine(engine) is bind
+    async with AsyncSession(bind) as session:
+        connection = await session.connection()
+        raw = await connection.get_raw_connection()
+        assert raw.driver_connection.autocommit
+    # The connection is switched back for the other sessions
+    async with AsyncSession(engine) as session:
+        connection = await session.connection()
+        raw = await connection.get_raw_connection()
+        assert not raw.driver_connection.autocommit
+
+
+async def test_read_only_session(engine: AsyncEngine) -> None:
+    with patch("app.core.config.settings.POSTGRES_SAFE_METHOD_SESSION", "read_only"):
+        bind = read_only_engine(engine)
+    async with AsyncSession(bind) as session:
+        connection = await session.connection()
+        result = await connection.execute(text("SHOW transaction_read_only"))
+        assert result.scalar_one() == "on"
+        session.add(Item(title="Foo", owner_id=uuid.uuid4()))
+        with pytest.raises(DBAPIError, match="read-only transaction"):
+            await session.flush()
+
+
+def test_transaction_session(engine: AsyncEngine) -> None:
+    with patch("app.core.config.settings.POSTGRES_SAFE_METHOD_SESSION", "transaction"):
+        assert read_only_engine(engine) is engine
+
+
+async def test_get_async_db_safe_methods() -> None:
+    # No query is run, the app's engine is only inspected
+    for method, isolation_level in [("GET", "AUTOCOMMIT"), ("POST", None)]:
+        sessions = get_async_db(make_request(method))
+        session = await anext(sessions)
+        assert isinstance(session.bind, AsyncEngine)
+        assert session.bind.pool is async_engine.pool
+        options = session.bind.get_execution_options()
+        assert options.get("isolation_level") == isolation_level
+        await sessions.aclose()
@@ -0,0 +1,51 @@
+import threading
+from unittest.mock import patch
+
+import anyio
+import pytest
+
+from app.core.config import settings
+from app.core.executor import BoundedExecutor, ExecutorBusyError
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_run_returns_result() -> None:
+    executor = BoundedExecutor(kind="thread", workers=1, max_pending=1)
+    try:
+        assert await executor.run(pow, 2, 10) == 1024
+        stats = executor.stats()
+        assert stats["pending"] == 0
+        assert stats["run_time_seconds"]["count"] == 1
+    finally:
+        executor.shutdown()
+
+
+async def test_run_rejects_when_backlog_full() -> None:
+    executor = BoundedExecutor(kind="thread", workers=1, max_pending=1)
+    release = threading.Event()
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(executor.run, release.wait)
+            await anyio.sleep(0.05)
+            assert executor.pending == 1
+            with pytest.raises(ExecutorBusyError) as exc_info:
+                await executor.run(pow, 2, 10)
+            assert exc_info.value.retry_after >= 1
+            release.set()
+        assert executor.stats()["rejected"] == 1
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_password_hash_workers_shared_between_processes() -> None:
+    with (
+        patch("os.cpu_count", return_value=8),
+        patch("app.core.config.settings.WEB_CONCURRENCY", 4),
+    ):
+        assert settings.password_hash_workers == 2
+        with patch("app.core.config.settings.WEB_CONCURRENCY", 16):
+            assert settings.password_hash_workers == 1
+        with patch("app.core.config.settings.PASSWORD_HASH_WORKERS", 3):
+            assert settings.password_hash_workers == 3
@@ -0,0 +1,73 @@
+import uuid
+from collections.abc import AsyncIterator
+from typing import Any
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.pagination import estimate_row_count
+from app.core.config import settings
+from app.models import ITEM_PARTITIONS, Item
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def engine() -> AsyncIterator[AsyncEngine]:
+    # Not the app's pool, its connections belong to the TestClient event loop
+    engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    yield engine
+    await engine.dispose()
+
+
+async def partitions_read(session: AsyncSession, statement: Any) -> set[str]:
+    sql = statement.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+    nodes = [result.scalar_one()[0]["Plan"]]
+    relations = set()
+    while nodes:
+        node = nodes.pop()
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return relations
+
+
+async def test_item_partitions(engine: AsyncEngine) -> None:
+    async with AsyncSession(engine) as session:
+        result = await session.execute(
+            text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'item'::regclass")
+        )
+        assert result.scalar_one() == ITEM_PARTITIONS
+
+
+async def test_owner_scoped_queries_prune(engine: AsyncEngine) -> None:
+    owner_id, item_id = uuid.uuid4(), uuid.uuid4()
+    owned = [
+        select(Item).where(Item.owner_id == owner_id, Item.id == item_id),
+        select(Item).where(Item.owner_id == owner_id).order_by(col(Item.id)),
+        select(func.count()).select_from(Item).where(Item.owner_id == owner_id),
+    ]
+    async with AsyncSession(engine) as session:
+        for statement in owned:
+            assert len(await partitions_read(session, statement)) == 1
+        # Without the owner every partition is read
+        statement = select(Item).where(Item.id == item_id)
+        assert len(await partitions_read(session, statement)) == ITEM_PARTITIONS
+
+
+async def test_estimate_row_count_partitioned(engine: AsyncEngine) -> None:
+    async with AsyncSession(engine) as session:
+        await session.execute(text("ANALYZE item"))
+        estimate = await estimate_row_count(session, "item")
+        count = (await session.exec(select(func.count()).select_from(Item))).one()
+        assert estimate == count
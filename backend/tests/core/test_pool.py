@@ -0,0 +1,50 @@
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import exc, text
+from sqlmodel import create_engine
+
+from app.core.config import settings
+from app.core.db import engine_options
+from app.core.pool import InstrumentedQueuePool, pool_stats
+
+
+def test_pool_checkout_metrics() -> None:
+    engine = create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    try:
+        with engine.connect():
+            stats = pool_stats(engine.pool)
+            assert stats["checked_out"] == 1
+            assert stats["idle"] == 0
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        stats = pool_stats(engine.pool)
+        assert stats["checked_out"] == 0
+        assert stats["idle"] == 1
+        assert stats["timeouts"] == 1
+        assert stats["checkout_wait_seconds"]["count"] == 2
+        assert stats["checkout_wait_seconds"]["sum"] >= 0.05
+    finally:
+        engine.dispose()
+
+
+def test_statement_timeout() -> None:
+    with patch("app.core.config.settings.POSTGRES_STATEMENT_TIMEOUT_MS", 50):
+        engine = create_engine(
+            str(settings.SQLALCHEMY_DATABASE_URI),
+            **engine_options(InstrumentedQueuePool),
+        )
+    try:
+        with engine.connect() as connection:
+            timeout = connection.execute(text("SHOW statement_timeout")).scalar()
+            assert timeout == "50ms"
+            with pytest.raises(exc.OperationalError):
+                connection.execute(text("SELECT pg_sleep(1)"))
+    finally:
+        engine.dispose()
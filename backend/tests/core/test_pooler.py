@@ -0,0 +1,97 @@
+import asyncio
+import os
+from collections.abc import AsyncIterator, Iterator
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import exc, make_url, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import engine_options
+from app.core.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+
+pytestmark = pytest.mark.anyio
+
+# Port of a transaction pooler in front of the test database, such as the
+# pgbouncer service of docker-compose.override.yml
+POOLER_PORT = os.environ.get("TEST_POOLER_PORT")
+
+requires_pooler = pytest.mark.skipif(
+    not POOLER_PORT, reason="TEST_POOLER_PORT is not set"
+)
+
+
+@pytest.fixture
+def pooler_settings() -> Iterator[None]:
+    with (
+        patch("app.core.config.settings.POSTGRES_TRANSACTION_POOLER", True),
+        patch("app.core.config.settings.POSTGRES_STATEMENT_TIMEOUT_MS", 50),
+    ):
+        yield
+
+
+@pytest.fixture
+async def pooler(pooler_settings: None) -> AsyncIterator[AsyncEngine]:  # noqa: ARG001
+    url = make_url(str(settings.SQLALCHEMY_DATABASE_URI)).set(port=int(POOLER_PORT))
+    engine = create_async_engine(url, **engine_options(InstrumentedAsyncQueuePool))
+    yield engine
+    await engine.dispose()
+
+
+def test_engine_options(pooler_settings: None) -> None:  # noqa: ARG001
+    assert engine_options(InstrumentedQueuePool) == {
+        "poolclass": NullPool,
+        "connect_args": {"prepare_threshold": None},
+    }
+
+
+def test_statement_timeout_per_transaction(pooler_settings: None) -> None:  # noqa: ARG001
+    # One connection kept, to check that the timeout does not stay on it
+    engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), pool_size=1)
+    try:
+        with engine.begin() as connection:
+            timeout = connection.execute(text("SHOW statement_timeout")).scalar()
+            assert timeout == "50ms"
+        with engine.connect() as connection:
+            with pytest.raises(exc.OperationalError):
+                connection.execute(text("SELECT pg_sleep(1)"))
+        autocommit = engine.execution_options(isolation_level="AUTOCOMMIT")
+        with autocommit.connect() as connection:
+            timeout = connection.execute(text("SHOW statement_timeout")).scalar()
+            assert timeout == "0"
+    finally:
+        engine.dispose()
+
+
+@requires_pooler
+async def test_pooler_repeated_statements(pooler: AsyncEngine) -> None:
+    # Beyond psycopg's prepare threshold, on connections the pooler shares
+    async def run() -> None:
+        for value in range(20):
+            async with AsyncSession(pooler) as session:
+                connection = await session.connection()
+                result = await connection.execute(
+                    text("SELECT :value"), {"value": value}
+                )
+                assert result.scalar_one() == value
+
+    await asyncio.gather(*(run() for _ in range(10)))
+
+
+@requires_pooler
+async def test_pooler_statement_timeout(pooler: AsyncEngine) -> None:
+    async with pooler.connect() as connection:
+        with pytest.raises(exc.OperationalError):
+            await connection.execute(text("SELECT pg_sleep(1)"))
+    async with pooler.connect() as connection:
+        timeout = await connection.execute(text("SHOW statement_timeout"))
+        assert timeout.scalar_one() == "50ms"
+    autocommit = pooler.execution_options(isolation_level="AUTOCOMMIT")
+    for _ in range(10):
+        async with autocommit.connect() as connection:
+            timeout = await connection.execute(text("SHOW statement_timeout"))
+            assert timeout.scalar_one() == "0"
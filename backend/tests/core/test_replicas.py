@@ -0,0 +1,123 @@
+from collections.abc import AsyncIterator
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from starlette.requests import Request
+
+from app.api.deps import get_read_engine
+from app.core.config import settings
+from app.core.db import async_engine
+from app.core.replicas import (
+    READ_AFTER_LSN_COOKIE,
+    READ_AFTER_LSN_HEADER,
+    Replica,
+    ReplicaSet,
+    parse_lsn,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def primary() -> AsyncIterator[AsyncEngine]:
+    # Not the app's pool, its connections belong to the TestClient event loop
+    engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    with patch("app.core.replicas.async_engine", engine):
+        yield engine
+    await engine.dispose()
+
+
+def make_replica(url: str) -> Replica:
+    return Replica(create_async_engine(url, poolclass=NullPool))
+
+
+def test_parse_lsn() -> None:
+    assert parse_lsn("0/0") == 0
+    assert parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+    assert parse_lsn("1/0") > parse_lsn("0/FFFFFFFF")
+
+
+async def test_check_healthy_replica(primary: AsyncEngine) -> None:
+    # The primary itself stands in for an up to date replica
+    replica = make_replica(primary.url.render_as_string(hide_password=False))
+    replica_set = ReplicaSet([replica], max_lag_bytes=1024**2, check_seconds=5)
+    assert replica_set.choose() is None
+    await replica_set.check()
+    assert replica.healthy
+    assert replica.lag_bytes is not None
+    assert replica.lag_bytes <= 1024**2
+    assert replica_set.choose() is replica
+    assert replica_set.choose(replica.replay_lsn) is replica
+    # Not replayed yet, read from the primary
+    assert replica_set.choose(replica.replay_lsn + 1) is None
+    await replica.engine.dispose()
+
+
+async def test_check_lagging_replica(primary: AsyncEngine) -> None:
+    replica = make_replica(primary.url.render_as_string(hide_password=False))
+    replica_set = ReplicaSet([replica], max_lag_bytes=-1, check_seconds=5)
+    await replica_set.check()
+    assert not replica.healthy
+    assert replica_set.choose() is None
+    await replica.engine.dispose()
+
+
+async def test_check_replica_down(primary: AsyncEngine) -> None:
+    url = primary.url.set(port=1).render_as_string(hide_password=False)
+    replica = make_replica(url)
+    replica.healthy = True
+    replica_set = ReplicaSet([replica], max_lag_bytes=1024**2, check_seconds=5)
+    await replica_set.check()
+    assert not replica.healthy
+    assert replica.error
+    assert replica_set.stats()[0]["healthy"] is False
+
+
+def make_request(headers: dict[str, str]) -> Request:
+    raw = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "headers": raw})
+
+
+def test_get_read_engine() -> None:
+    replica = make_replica(str(settings.SQLALCHEMY_DATABASE_URI))
+    replica.healthy = True
+    replica.replay_lsn = parse_lsn("0/100")
+    replica_set = ReplicaSet([replica], max_lag_bytes=0, check_seconds=5)
+    with patch("app.api.deps.replicas", replica_set):
+        assert get_read_engine(make_request({})) is replica.engine
+        request = make_request({READ_AFTER_LSN_HEADER: "0/100"})
+        assert get_read_engine(request) is replica.engine
+        request = make_request({READ_AFTER_LSN_HEADER: "0/101"})
+        assert get_read_engine(request) is async_engine
+        request = make_request({"Cookie": f"{READ_AFTER_LSN_COOKIE}=0/101"})
+        assert get_read_engine(request) is async_engine
+    assert get_read_engine(make_request({})) is async_engine
+
+
+def test_write_returns_lsn(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    replica = make_replica(str(settings.SQLALCHEMY_DATABASE_URI))
+    replica_set = ReplicaSet([replica], max_lag_bytes=0, check_seconds=5)
+    with (
+        patch("app.core.replicas.replicas", replica_set),
+        patch("app.api.deps.replicas", replica_set),
+    ):
+        r = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            json={"title": "Foo"},
+        )
+        assert r.status_code == 200
+        lsn = r.headers[READ_AFTER_LSN_HEADER]
+        assert parse_lsn(lsn) > 0
+        assert r.cookies[READ_AFTER_LSN_COOKIE] == lsn
+
+        r = client.get(f"{settings.API_V1_STR}/items/", headers=superuser_token_headers)
+        assert r.status_code == 200
+        assert READ_AFTER_LSN_HEADER not in r.headers
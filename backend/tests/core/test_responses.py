@@ -0,0 +1,57 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import ValidationError
+
+from app.core.config import Settings
+from app.core.responses import (
+    MsgspecJSONResponse,
+    get_default_response_class,
+    wants_msgpack,
+)
+
+
+def test_default_response_class_json() -> None:
+    with patch("app.core.config.settings.JSON_RESPONSE_CLASS", "json"):
+        assert get_default_response_class() is JSONResponse
+
+
+def test_default_response_class_orjson() -> None:
+    pytest.importorskip("orjson")
+    with patch("app.core.config.settings.JSON_RESPONSE_CLASS", "orjson"):
+        response_class = get_default_response_class()
+    assert response_class is ORJSONResponse
+    id = uuid.uuid4()
+    assert response_class({"id": id}).body == f'{{"id":"{id}"}}'.encode()
+
+
+def test_default_response_class_msgspec() -> None:
+    pytest.importorskip("msgspec")
+    with patch("app.core.config.settings.JSON_RESPONSE_CLASS", "msgspec"):
+        response_class = get_default_response_class()
+    assert response_class is MsgspecJSONResponse
+    id = uuid.uuid4()
+    assert response_class({"id": id}).body == f'{{"id":"{id}"}}'.encode()
+
+
+def test_json_response_class_not_installed() -> None:
+    with patch.dict("sys.modules", {"orjson": None}):
+        with pytest.raises(ValidationError, match="fast-json"):
+            Settings(JSON_RESPONSE_CLASS="orjson")
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [
+        (None, False),
+        ("application/json", False),
+        ("*/*", False),
+        ("application/msgpack", True),
+        ("application/json;q=0.9, application/x-msgpack", True),
+        ("application/msgpack;q=0, application/json", False),
+    ],
+)
+def test_wants_msgpack(accept: str | None, expected: bool) -> None:
+    assert wants_msgpack(accept) is expected
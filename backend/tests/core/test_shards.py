@@ -0,0 +1,470 @@
+import asyncio
+import uuid
+from collections.abc import AsyncIterator, Callable, Generator
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from sqlalchemy import make_url, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine, delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api.deps import shard_session
+from app.core.config import Settings, settings
+from app.core.db import read_only_engine
+from app.core.replicas import (
+    Replica,
+    ReplicaSet,
+    committed_lsn,
+    parse_lsn,
+    reads_replica,
+)
+from app.core.shards import ShardRouter, jump_hash, shards
+from app.main import app
+from app.models import ITEM_PARTITIONS, Item, ShardAssignment, User
+from app.shard_rebalance import copy_changes, run, run_pin
+from tests.utils.utils import random_email, random_lower_string
+
+pytestmark = pytest.mark.anyio
+
+SHARD_DATABASE = "app_shard_1"
+
+SignUp = Callable[[int], tuple[uuid.UUID, dict[str, str]]]
+
+
+def test_jump_hash() -> None:
+    keys = [uuid.uuid4().int >> 64 for _ in range(1000)]
+    for buckets in range(1, 10):
+        placed = [jump_hash(key, buckets) for key in keys]
+        assert all(0 <= bucket < buckets for bucket in placed)
+        assert placed == [jump_hash(key, buckets) for key in keys]
+        # Adding a bucket only moves keys to the new one
+        grown = [jump_hash(key, buckets + 1) for key in keys]
+        moved = [new for old, new in zip(placed, grown, strict=True) if old != new]
+        assert set(moved) <= {buckets}
+        assert len(moved) < 2 * len(keys) / (buckets + 1)
+
+
+def test_shard_for_assignment() -> None:
+    engines: list[AsyncEngine] = [
+        create_async_engine(str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool)
+    ] * 3
+    router = ShardRouter(engines, refresh_seconds=5, hash_count=3)
+    owner_id = uuid.uuid4()
+    hashed = router.hashed_shard(owner_id)
+    assert router.shard_for(owner_id) == hashed
+    router.assignments[owner_id] = (hashed + 1) % 3
+    assert router.shard_for(owner_id) == (hashed + 1) % 3
+    assert router.engine_for(owner_id) is engines[(hashed + 1) % 3]
+
+
+def test_shard_hash_count_configured() -> None:
+    assert Settings(POSTGRES_SHARD_URLS=[shard_url()]).POSTGRES_SHARD_HASH_COUNT == 1
+    with pytest.raises(ValidationError, match="POSTGRES_SHARD_HASH_COUNT"):
+        Settings(POSTGRES_SHARD_HASH_COUNT=2)
+
+
+async def test_reads_replica() -> None:
+    replica = Replica(
+        create_async_engine(str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool)
+    )
+    other = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    with patch("app.core.replicas.replicas.replicas", [replica]):
+        assert reads_replica(AsyncSession(replica.engine))
+        assert reads_replica(AsyncSession(read_only_engine(replica.engine)))
+        assert not reads_replica(AsyncSession(other))
+
+
+def shard_url() -> str:
+    url = make_url(str(settings.SQLALCHEMY_DATABASE_URI))
+    return url.set(database=SHARD_DATABASE).render_as_string(hide_password=False)
+
+
+@pytest.fixture(scope="module")
+async def shard(db: AsyncSession) -> AsyncIterator[AsyncEngine]:
+    admin = create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), isolation_level="AUTOCOMMIT"
+    )
+    with admin.connect() as connection:
+        connection.execute(text(f"DROP DATABASE IF EXISTS {SHARD_DATABASE}"))
+        connection.execute(text(f"CREATE DATABASE {SHARD_DATABASE}"))
+    # Like prestart.sh, migrations also run on every shard
+    config = Config()
+    config.set_main_option("script_location", "app/alembic")
+    with patch("app.core.config.settings.POSTGRES_SHARD_URLS", [shard_url()]):
+        command.upgrade(config, "head")
+    # Pinned like init_db does when shards are configured
+    superuser = (
+        await db.exec(select(User).where(User.email == settings.FIRST_SUPERUSER))
+    ).one()
+    db.add(ShardAssignment(owner_id=superuser.id, shard=0))
+    await db.commit()
+
+    # Both shards are used from the TestClient and the test event loops
+    engine = create_async_engine(shard_url(), poolclass=NullPool)
+    with (
+        patch.object(shards, "engines", [shards.engines[0], engine]),
+        patch.object(shards, "assignments", {}),
+        patch.object(shards, "refresh_seconds", 0.1),
+        patch.object(shards, "hash_count", 2),
+        patch("app.core.config.settings.POSTGRES_SHARD_URLS", [shard_url()]),
+        patch("app.core.config.settings.POSTGRES_SHARD_ASSIGNMENT_REFRESH_SECONDS", 0),
+    ):
+        yield engine
+    await engine.dispose()
+
+    await db.execute(delete(ShardAssignment))
+    await db.commit()
+    with admin.connect() as connection:
+        connection.execute(text(f"DROP DATABASE {SHARD_DATABASE} WITH (FORCE)"))
+    admin.dispose()
+
+
+@pytest.fixture
+async def primary() -> AsyncIterator[AsyncEngine]:
+    # Not the app's pool, its connections belong to the TestClient event loop
+    engine = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def client(shard: AsyncEngine) -> Generator[TestClient, None, None]:  # noqa: ARG001
+    # Started after the shards are patched, for the lifespan to load them
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def owner_on(client: TestClient) -> SignUp:
+    def sign_up(shard: int) -> tuple[uuid.UUID, dict[str, str]]:
+        # Signups are placed by the hash of a random id
+        for _ in range(100):
+            email, password = random_email(), random_lower_string()
+            r = client.post(
+                f"{settings.API_V1_STR}/users/signup",
+                json={"email": email, "password": password},
+            )
+            assert r.status_code == 200
+            user_id = uuid.UUID(r.json()["id"])
+            if shards.shard_for(user_id) == shard:
+                r = client.post(
+                    f"{settings.API_V1_STR}/login/access-token",
+                    data={"username": email, "password": password},
+                )
+                assert r.status_code == 200
+                token = r.json()["access_token"]
+                return user_id, {"Authorization": f"Bearer {token}"}
+        raise AssertionError(f"No signup placed on shard {shard}")
+
+    return sign_up
+
+
+async def count(engine: AsyncEngine, model: Any, owner_id: uuid.UUID) -> int:
+    column = model.id if model is User else model.owner_id
+    async with AsyncSession(engine) as session:
+        statement = select(func.count()).select_from(model).where(column == owner_id)
+        return (await session.exec(statement)).one()
+
+
+def read_all(client: TestClient, path: str, headers: dict[str, str]) -> list[Any]:
+    rows: list[Any] = []
+    cursor = None
+    while True:
+        params = {"limit": settings.MAX_PAGE_SIZE, "count": "none"}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get(f"{settings.API_V1_STR}{path}", headers=headers, params=params)
+        assert r.status_code == 200
+        rows.extend(r.json()["data"])
+        cursor = r.json()["next_cursor"]
+        if not cursor:
+            return rows
+
+
+async def test_shard_migrated(shard: AsyncEngine) -> None:
+    config = Config()
+    config.set_main_option("script_location", "app/alembic")
+    head = ScriptDirectory.from_config(config).get_current_head()
+    # Already at head, the next upgrade runs the migrations as usual
+    with patch("app.core.config.settings.POSTGRES_SHARD_URLS", [shard_url()]):
+        command.upgrade(config, "head")
+    async with shard.connect() as connection:
+        result = await connection.execute(
+            text("SELECT version_num FROM alembic_version")
+        )
+        assert result.scalar_one() == head
+        result = await connection.execute(
+            text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'item'::regclass")
+        )
+        assert result.scalar_one() == ITEM_PARTITIONS
+
+
+async def test_shard_session_passes_lsn(
+    shard: AsyncEngine, primary: AsyncEngine
+) -> None:
+    replica_set = ReplicaSet([Replica(primary)], max_lag_bytes=0, check_seconds=5)
+    with (
+        patch.object(shards, "engines", [primary, shard]),
+        patch("app.core.replicas.async_engine", primary),
+        patch("app.core.replicas.replicas", replica_set),
+    ):
+        async with AsyncSession(shard) as session:
+            # Replicas are of the main database, shard 1 has no position
+            await session.exec(select(User).limit(1))
+            await session.commit()
+            assert await committed_lsn(session) is None
+
+            async with shard_session(session, 0) as other:
+                assignment = ShardAssignment(owner_id=uuid.uuid4(), shard=0)
+                other.add(assignment)
+                await other.commit()
+                await other.delete(assignment)
+                await other.commit()
+            lsn = await committed_lsn(session)
+            assert lsn and parse_lsn(lsn) > 0
+            # Only handed over once
+            assert await committed_lsn(session) is None
+
+
+async def test_sign_up_on_own_shard(
+    shard: AsyncEngine, primary: AsyncEngine, client: TestClient, owner_on: SignUp
+) -> None:
+    user_id, headers = owner_on(1)
+    assert await count(shard, User, user_id) == 1
+    assert await count(primary, User, user_id) == 0
+    r = client.post(
+        f"{settings.API_V1_STR}/items/", headers=headers, json={"title": "Foo"}
+    )
+    assert r.status_code == 200
+    assert await count(shard, Item, user_id) == 1
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert [item["title"] for item in r.json()["data"]] == ["Foo"]
+
+
+async def test_superuser_reads_all_shards(
+    client: TestClient, superuser_token_headers: dict[str, str], owner_on: SignUp
+) -> None:
+    ids = {}
+    for shard in (0, 1):
+        user_id, headers = owner_on(shard)
+        r = client.post(
+            f"{settings.API_V1_STR}/items/", headers=headers, json={"title": "Foo"}
+        )
+        ids[shard] = user_id, uuid.UUID(r.json()["id"])
+
+    users = read_all(client, "/users/", superuser_token_headers)
+    user_ids = [uuid.UUID(user["id"]) for user in users]
+    assert user_ids == sorted(user_ids)
+    assert {ids[0][0], ids[1][0]} <= set(user_ids)
+
+    items = read_all(client, "/items/", superuser_token_headers)
+    keys = [(uuid.UUID(item["owner_id"]), uuid.UUID(item["id"])) for item in items]
+    assert keys == sorted(keys)
+    assert {ids[0], ids[1]} <= set(keys)
+
+    _, item_id = ids[1]
+    r = client.get(
+        f"{settings.API_V1_STR}/items/{item_id}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    r = client.get(
+        f"{settings.API_V1_STR}/users/{ids[1][0]}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+
+
+async def test_email_unique_across_shards(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    email, password = random_email(), random_lower_string()
+    ids = iter(uuid.uuid4() for _ in range(1000))
+    first = next(id for id in ids if shards.shard_for(id) == 0)
+    second = next(id for id in ids if shards.shard_for(id) == 1)
+    # Both signups pass the lookup, as they would when running concurrently
+    with (
+        patch("app.api.routes.users.get_user_by_email", return_value=None),
+        patch("app.api.routes.users.uuid.uuid4", side_effect=[first, second]),
+    ):
+        for status_code in (200, 400):
+            r = client.post(
+                f"{settings.API_V1_STR}/users/signup",
+                json={"email": email, "password": password},
+            )
+            assert r.status_code == status_code
+
+    # Released with the user
+    r = client.delete(
+        f"{settings.API_V1_STR}/users/{first}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    with patch("app.api.routes.users.uuid.uuid4", return_value=second):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/signup",
+            json={"email": email, "password": password},
+        )
+    assert r.status_code == 200
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{second}",
+        headers=superuser_token_headers,
+        json={"email": settings.FIRST_SUPERUSER},
+    )
+    assert r.status_code == 409
+
+
+async def test_superuser_writes_all_shards(
+    client: TestClient, superuser_token_headers: dict[str, str], owner_on: SignUp
+) -> None:
+    ids = []
+    for shard in (0, 1):
+        _, headers = owner_on(shard)
+        r = client.post(
+            f"{settings.API_V1_STR}/items/batch",
+            headers=headers,
+            json=[{"title": "Foo"}, {"title": "Bar"}],
+        )
+        ids.extend(uuid.UUID(item["id"]) for item in r.json()["data"])
+    missing = uuid.uuid4()
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        json=[{"id": str(id), "title": "Updated"} for id in [*ids, missing]],
+    )
+    assert r.status_code == 200
+    results = r.json()["data"]
+    assert [result["id"] for result in results] == [str(id) for id in [*ids, missing]]
+    assert [result["status"] for result in results] == [200, 200, 200, 200, 404]
+    assert [result["item"]["title"] for result in results[:4]] == ["Updated"] * 4
+
+    for id in ids[:3]:
+        r = client.put(
+            f"{settings.API_V1_STR}/items/{id}",
+            headers=superuser_token_headers,
+            json={"title": "Again"},
+        )
+        assert r.status_code == 200
+        assert r.json()["title"] == "Again"
+    r = client.get(
+        f"{settings.API_V1_STR}/items/{ids[2]}",
+        headers=superuser_token_headers,
+        params={"fields": "title"},
+    )
+    assert r.json() == {"title": "Again"}
+    r = client.delete(
+        f"{settings.API_V1_STR}/items/{ids[3]}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+
+    r = client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        json=[str(id) for id in ids],
+    )
+    assert r.status_code == 200
+    assert [result["status"] for result in r.json()["data"]] == [200, 200, 200, 404]
+    for id in ids:
+        r = client.get(
+            f"{settings.API_V1_STR}/items/{id}", headers=superuser_token_headers
+        )
+        assert r.status_code == 404
+
+
+async def test_rebalance(
+    shard: AsyncEngine, primary: AsyncEngine, client: TestClient, owner_on: SignUp
+) -> None:
+    user_id, headers = owner_on(0)
+    for title in ("Foo", "Bar"):
+        r = client.post(
+            f"{settings.API_V1_STR}/items/", headers=headers, json={"title": title}
+        )
+        assert r.status_code == 200
+
+    await run(user_id, 1, chunk_size=1)
+    assert await count(primary, User, user_id) == 0
+    assert await count(shard, User, user_id) == 1
+    assert await count(shard, Item, user_id) == 2
+    # Once the app reloaded the assignment
+    await asyncio.sleep(0.5)
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert r.json()["count"] == 2
+
+    # Back to the shard it hashes to, the assignment is not needed anymore
+    await run(user_id, 0, chunk_size=1)
+    assert await count(shard, User, user_id) == 0
+    assert await count(primary, Item, user_id) == 2
+    async with AsyncSession(primary) as session:
+        assert await session.get(ShardAssignment, user_id) is None
+
+
+async def test_rebalance_keeps_writes_during_move(
+    shard: AsyncEngine, primary: AsyncEngine, client: TestClient, owner_on: SignUp
+) -> None:
+    user_id, headers = owner_on(0)
+    ids = []
+    for title in ("Foo", "Bar"):
+        r = client.post(
+            f"{settings.API_V1_STR}/items/", headers=headers, json={"title": title}
+        )
+        ids.append(uuid.UUID(r.json()["id"]))
+    foo, bar = ids
+    added = uuid.uuid4()
+
+    async def writes_between_passes(*args: Any, **kwargs: Any) -> set[uuid.UUID]:
+        # Deleted on the target, updated and added by late requests on the source
+        async with AsyncSession(shard) as session:
+            await session.exec(delete(Item).where(Item.id == foo))  # type: ignore[arg-type]
+            await session.commit()
+        async with AsyncSession(primary) as session:
+            await session.exec(
+                update(Item).where(Item.id == foo).values(title="Late", version=5)  # type: ignore[arg-type]
+            )
+            await session.exec(
+                update(Item).where(Item.id == bar).values(title="Late", version=5)  # type: ignore[arg-type]
+            )
+            session.add(Item(id=added, title="Added", owner_id=user_id))
+            await session.commit()
+        return await copy_changes(*args, **kwargs)
+
+    with patch("app.shard_rebalance.copy_changes", writes_between_passes):
+        await run(user_id, 1, chunk_size=1)
+    assert await count(primary, User, user_id) == 0
+    async with AsyncSession(shard) as session:
+        items = (await session.exec(select(Item).where(Item.owner_id == user_id))).all()
+    assert {(item.id, item.title) for item in items} == {
+        (bar, "Late"),
+        (added, "Added"),
+    }
+
+
+async def test_pin_before_hash_count_change(
+    primary: AsyncEngine, client: TestClient, owner_on: SignUp
+) -> None:
+    kept, _ = owner_on(0)
+    moved, headers = owner_on(1)
+    async with AsyncSession(primary) as session:
+        assert await session.get(ShardAssignment, moved) is None
+
+    # Back to one hashed shard, the owners already on shard 1 must stay there
+    await run_pin(1, chunk_size=1)
+    async with AsyncSession(primary) as session:
+        assignment = await session.get(ShardAssignment, moved)
+        assert assignment and assignment.shard == 1
+        assert await session.get(ShardAssignment, kept) is None
+    with patch.object(shards, "hash_count", 1):
+        await asyncio.sleep(0.5)
+        assert shards.shard_for(moved) == 1
+        r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+        assert r.status_code == 200
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_calls_are_shared() -> None:
+    group = SingleFlight()
+    calls = 0
+
+    async def load() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(group.do("key", load) for _ in range(5)))
+    assert results == [1] * 5
+    assert calls == 1
+    stats = group.stats()
+    assert stats["calls"] == 1
+    assert stats["shared"] == 4
+    assert stats["coalescing_ratio"] == 0.8
+    assert stats["in_flight"] == 0
+
+    # Nothing is kept once the call completes
+    assert await group.do("key", load) == 2
+
+
+async def test_different_keys_are_not_shared() -> None:
+    group = SingleFlight()
+
+    async def load(value: int) -> int:
+        await asyncio.sleep(0.01)
+        return value
+
+    results = await asyncio.gather(
+        group.do("a", lambda: load(1)), group.do("b", lambda: load(2))
+    )
+    assert results == [1, 2]
+    assert group.stats()["shared"] == 0
+
+
+async def test_error_is_raised_to_every_caller() -> None:
+    group = SingleFlight()
+
+    async def fail() -> None:
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        group.do("key", fail), group.do("key", fail), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    assert group.stats()["in_flight"] == 0
+
+
+async def test_cancelled_caller_does_not_cancel_the_call() -> None:
+    group = SingleFlight()
+    release = asyncio.Event()
+
+    async def load() -> str:
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(group.do("key", load))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(group.do("key", load))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    assert await second == "done"
+    assert first.cancelled()
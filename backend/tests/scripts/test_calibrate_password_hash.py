@@ -0,0 +1,19 @@
+from typing import Any
+from unittest.mock import patch
+
+from app.calibrate_password_hash import MIN_BCRYPT_ROUNDS, calibrate_bcrypt
+
+
+def fake_measure(handler: Any, samples: int) -> float:  # noqa: ARG001
+    # Each extra bcrypt round doubles the cost, 10 rounds take 25 ms here
+    return 0.025 * 2 ** (handler.default_rounds - 10)
+
+
+def test_calibrate_bcrypt_picks_highest_rounds_within_budget() -> None:
+    with patch("app.calibrate_password_hash.measure", side_effect=fake_measure):
+        assert calibrate_bcrypt(target_seconds=0.1, samples=1) == 12
+
+
+def test_calibrate_bcrypt_never_goes_below_minimum() -> None:
+    with patch("app.calibrate_password_hash.measure", side_effect=fake_measure):
+        assert calibrate_bcrypt(target_seconds=0.001, samples=1) == MIN_BCRYPT_ROUNDS
@@ -0,0 +1,107 @@
+from collections.abc import Generator
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.email_worker import deliver_batch, retry_delay
+from app.models import EmailOutbox
+from app.utils import EmailDeliveryError
+from tests.utils.utils import random_email
+
+
+@pytest.fixture
+def session() -> Generator[Session, None, None]:
+    with Session(engine, expire_on_commit=False) as session:
+        yield session
+
+
+def queue_email(session: Session, **kwargs: object) -> EmailOutbox:
+    email = EmailOutbox(
+        email_to=random_email(), subject="Subject", html_content="<p>Hi</p>", **kwargs
+    )
+    session.add(email)
+    session.commit()
+    return email
+
+
+def test_retry_delay_backs_off_exponentially() -> None:
+    base = settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS
+    assert retry_delay(1) == timedelta(seconds=base)
+    assert retry_delay(3) == timedelta(seconds=base * 4)
+    assert retry_delay(100) == timedelta(
+        seconds=settings.EMAIL_OUTBOX_RETRY_MAX_SECONDS
+    )
+
+
+def test_deliver_batch_sends_pending(session: Session) -> None:
+    email = queue_email(session)
+    with patch("app.email_worker.send_email") as send:
+        deliver_batch(session)
+    send.assert_any_call(
+        email_to=email.email_to, subject="Subject", html_content="<p>Hi</p>"
+    )
+    session.refresh(email)
+    assert email.status == "sent"
+    assert email.attempts == 1
+    assert email.sent_at is not None
+
+
+def test_deliver_batch_sends_without_locks(session: Session) -> None:
+    email = queue_email(session)
+
+    def send(**_kwargs: object) -> None:
+        assert not session.in_transaction()
+        # Claimed but not locked, another worker skips it as not due
+        with Session(engine) as other:
+            statement = (
+                select(EmailOutbox)
+                .where(EmailOutbox.id == email.id)
+                .with_for_update(nowait=True)
+            )
+            claimed = other.exec(statement).one()
+            assert claimed.attempts == 1
+            assert claimed.next_attempt_at > datetime.now(timezone.utc)
+
+    with patch("app.email_worker.send_email", side_effect=send) as send_email:
+        deliver_batch(session)
+    assert send_email.called
+    session.refresh(email)
+    assert email.status == "sent"
+
+
+def test_deliver_batch_skips_emails_not_due(session: Session) -> None:
+    later = datetime.now(timezone.utc) + timedelta(hours=1)
+    email = queue_email(session, next_attempt_at=later)
+    with patch("app.email_worker.send_email"):
+        deliver_batch(session)
+    session.refresh(email)
+    assert email.status == "pending"
+    assert email.attempts == 0
+
+
+def test_deliver_batch_reschedules_failures(session: Session) -> None:
+    email = queue_email(session)
+    now = datetime.now(timezone.utc)
+    with patch(
+        "app.email_worker.send_email", side_effect=EmailDeliveryError("refused")
+    ):
+        deliver_batch(session, now=now)
+    session.refresh(email)
+    assert email.status == "pending"
+    assert email.attempts == 1
+    assert email.next_attempt_at == now + retry_delay(1)
+    assert email.last_error and "refused" in email.last_error
+
+
+def test_deliver_batch_marks_dead_after_max_attempts(session: Session) -> None:
+    email = queue_email(session, attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS - 1)
+    with patch("app.email_worker.send_email", side_effect=OSError("unreachable")):
+        deliver_batch(session)
+    session.refresh(email)
+    assert email.status == "dead"
+    assert email.attempts == settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    assert email.sent_at is None
@@ -0,0 +1,33 @@
+import json
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.item_import import main
+from app.models import Item
+from tests.utils.utils import random_lower_string
+
+
+def test_main_imports_file(tmp_path: Path) -> None:
+    title = random_lower_string()
+    path = tmp_path / "items.ndjson"
+    path.write_text(
+        "\n".join(json.dumps({"title": title, "description": str(i)}) for i in range(3))
+        + '\n{"description": "no title"}\n'
+    )
+
+    main([str(path), "--owner-email", settings.FIRST_SUPERUSER])
+
+    with Session(engine) as session:
+        items = session.exec(select(Item).where(Item.title == title)).all()
+    assert sorted(item.description or "" for item in items) == ["0", "1", "2"]
+
+
+def test_main_unknown_owner(tmp_path: Path) -> None:
+    path = tmp_path / "items.csv"
+    path.write_text("title\nFoo\n")
+    with pytest.raises(SystemExit):
+        main([str(path), "--owner-email", "nobody@example.com"])
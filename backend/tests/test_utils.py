@@ -0,0 +1,32 @@
+from jinja2 import Template
+
+from app.utils import (
+    EMAIL_TEMPLATES_DIR,
+    email_templates,
+    generate_reset_password_email,
+    render_email_template,
+    warm_email_templates,
+)
+
+
+def test_warm_email_templates_compiles_once() -> None:
+    warm_email_templates()
+    names = email_templates.list_templates(extensions=["html"])
+    assert "reset_password.html" in names
+    for name in names:
+        assert email_templates.get_template(name) is email_templates.get_template(name)
+
+
+def test_render_email_template_matches_source() -> None:
+    context = {"project_name": "Project", "email": "user@example.com"}
+    source = (EMAIL_TEMPLATES_DIR / "test_email.html").read_text()
+    assert render_email_template(
+        template_name="test_email.html", context=context
+    ) == Template(source).render(context)
+
+
+def test_generate_reset_password_email_renders_link() -> None:
+    email_data = generate_reset_password_email(
+        email_to="user@example.com", email="user@example.com", token="abc"
+    )
+    assert "reset-password?token=abc" in email_data.html_content
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+
+class RespServer:
+    """
+    In-memory stand-in for a Redis server, speaking just enough RESP2 for
+    `app.core.cache.RedisCacheBackend`.
+    """
+
+    def __init__(self, *, max_keys: int = 1000) -> None:
+        self.max_keys = max_keys
+        self.data: dict[bytes, tuple[float | None, bytes]] = {}
+        self.evicted_keys = 0
+        self.commands: list[list[bytes]] = []
+        self.port = 0
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n")
+                args = []
+                for _ in range(int(header[1:-2])):
+                    length = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                self.commands.append(args)
+                writer.write(self.execute(args))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    def get(self, key: bytes) -> bytes | None:
+        expires, value = self.data.get(key, (None, b""))
+        if key not in self.data or (expires and expires < time.monotonic()):
+            return None
+        return value
+
+    def execute(self, args: list[bytes]) -> bytes:
+        command = args[0].upper()
+        if command in (b"PING", b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if command == b"GET":
+            value = self.get(args[1])
+            if value is None:
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET":
+            options = [arg.upper() for arg in args[3:]]
+            expires = None
+            if b"PX" in options:
+                expires = (
+                    time.monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+                )
+            if b"NX" in options and self.get(args[1]) is not None:
+                return b"$-1\r\n"
+            self.data[args[1]] = (expires, args[2])
+            while len(self.data) > self.max_keys:
+                del self.data[next(iter(self.data))]
+                self.evicted_keys += 1
+            return b"+OK\r\n"
+        if command == b"DEL":
+            deleted = sum(self.data.pop(key, None) is not None for key in args[1:])
+            return b":%d\r\n" % deleted
+        if command == b"INFO":
+            info = b"# Stats\r\nevicted_keys:%d\r\n" % self.evicted_keys
+            return b"$%d\r\n%s\r\n" % (len(info), info)
+        return b"-ERR unknown command\r\n"
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+
+@asynccontextmanager
+async def resp_server(**kwargs: int) -> AsyncGenerator[RespServer, None]:
+    server = RespServer(**kwargs)
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    server.port = listener.sockets[0].getsockname()[1]
+    async with listener:
+        yield server